@@ -1,6 +1,9 @@
 import os
 import sys
 import json
+import hmac
+import signal
+from functools import wraps
 from datetime import datetime
 from dotenv import load_dotenv
 from flask import Flask, request, abort
@@ -34,6 +37,29 @@ kb_path = os.path.join(data_dir, "knowledge_base.json")
 persona_path = os.path.join(base_dir, "persona.md")
 hotel_bot = HotelBot(kb_path, persona_path)
 
+# 內部 API 共用金鑰：後台 (ktw-backend) 呼叫 Bot 的管理 / 統計端點時帶在 X-Internal-Token header
+# Port 5001 經 ngrok 對外公開，未設定金鑰時只接受本機直接呼叫（經 ngrok 轉發的請求帶有 X-Forwarded-For）
+BOT_INTERNAL_TOKEN = os.getenv('BOT_INTERNAL_TOKEN', '')
+LOCAL_ADDRESSES = ('127.0.0.1', '::1')
+
+def require_internal_token(view):
+    """內部端點驗證：比對 X-Internal-Token，未設定金鑰時退回只允許本機直連"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if BOT_INTERNAL_TOKEN:
+            token = request.headers.get('X-Internal-Token', '')
+            if not hmac.compare_digest(token.encode('utf-8'), BOT_INTERNAL_TOKEN.encode('utf-8')):
+                print(f"🚫 內部端點驗證失敗: {request.path}")
+                abort(403)
+        elif request.remote_addr not in LOCAL_ADDRESSES or request.headers.get('X-Forwarded-For'):
+            print(f"🚫 內部端點拒絕非本機請求: {request.path}")
+            abort(403)
+        return view(*args, **kwargs)
+    return wrapper
+
+# 收到 SIGTERM 時正常結束，讓 atexit 把延遲寫入的用戶資料寫回檔案
+signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
 # 推送通知到 Node.js Core (給 Vue.js Admin 即時顯示)
 import requests as req_lib
 NODEJS_CORE_URL = "http://localhost:3000"
@@ -76,6 +102,65 @@ def callback():
 
     return 'OK'
 
+@app.route("/vip/invalidate", methods=['POST'])
+@require_internal_token
+def vip_invalidate():
+    """後台新增 / 移除 VIP 標籤後呼叫，讓 VIP 快取立即更新"""
+    from handlers.vip_manager import vip_manager
+    data = request.get_json(silent=True) or {}
+    user_id = data.get('userId')
+    vip_manager.invalidate(user_id)
+    print(f"⭐ VIP 快取已更新: {user_id or '全部'}")
+    return {'success': True}
+
+@app.route("/chat/search", methods=['GET'])
+@require_internal_token
+def chat_search():
+    """對話全文檢索（後台呼叫）：q 關鍵字、user_id、start / end、role、page、page_size"""
+    args = request.args
+    try:
+        result = hotel_bot.logger.search_logs(
+            keyword=args.get('q'),
+            user_id=args.get('user_id'),
+            start=args.get('start'),
+            end=args.get('end'),
+            role=args.get('role'),
+            page=int(args.get('page', 1)),
+            page_size=int(args.get('page_size', 20)),
+        )
+    except ValueError:
+        return {'success': False, 'error': 'page / page_size 必須為數字'}, 400
+    return {'success': True, **result}
+
+@app.route("/pending/stats", methods=['GET'])
+@require_internal_token
+def pending_stats():
+    """暫存資料背景重試匹配的統計（查詢次數、匹配延遲等）"""
+    from helpers.pending_guest import get_pending_match_retrier
+    retrier = get_pending_match_retrier()
+    if retrier is None:
+        return {'success': False, 'error': '重試匹配尚未啟動'}, 503
+    return {'success': True, **retrier.get_stats()}
+
+@app.route("/sessions/stats", methods=['GET'])
+@require_internal_token
+def session_stats():
+    """對話狀態統計：背景同步（待同步筆數、outbox、同步延遲）與各 session map 的常駐數量 / 記憶體"""
+    from helpers.session_sweeper import get_session_sweeper
+    return {
+        'success': True,
+        'sync': hotel_bot.state_machine.get_sync_stats(),
+        'memory': get_session_sweeper().get_stats(),
+    }
+
+@app.route("/vip/intent-stats", methods=['GET'])
+@require_internal_token
+def vip_intent_stats():
+    """VIP 查詢意圖判斷來源統計（本地規則 / AI 分類 / AI 失敗的次數與本地判定比例）"""
+    if hotel_bot.vip_service is None:
+        return {'success': False, 'error': 'VIP 服務尚未初始化'}, 503
+    return {'success': True, **hotel_bot.vip_service.get_intent_stats()}
+
 @handler.add(MessageEvent, message=TextMessage)
 def handle_message(event):
     user_msg = event.message.text.strip()
@@ -120,7 +205,10 @@ def handle_message(event):
         reply_text = "好的！已為您重新開始對話。有什麼能為您服務的嗎？😊"
     else:
         # Generate response using HotelBot
+        hotel_bot.logger.begin_turn()
         reply_text = hotel_bot.generate_response(user_msg, user_id, display_name)
+        log_ms, log_writes = hotel_bot.logger.end_turn()
+        hotel_bot.bot_logger.log_debug(f"對話日誌寫入耗時 {log_ms:.2f} ms ({log_writes} 筆)")
     
     
     # Remove Markdown formatting (LINE doesn't support it)
@@ -204,10 +292,10 @@ def handle_sticker(event):
         print(f"Error getting profile: {e}")
     
     # Log the sticker message
-    hotel_bot.logger.log(user_id, "User", f"[傳送貼圖 Package: {package_id}, Sticker: {sticker_id}]")
+    hotel_bot.logger.log(user_id, "User", f"[傳送貼圖 Package: {package_id}, Sticker: {sticker_id}]", message_type='sticker')
     
     # Reply with a friendly sticker (LINE official sticker)
-    hotel_bot.logger.log(user_id, "Bot", "[回應貼圖: 微笑揮手]")
+    hotel_bot.logger.log(user_id, "Bot", "[回應貼圖: 微笑揮手]", message_type='sticker')
     
     line_bot_api.reply_message(
         event.reply_token,
@@ -11,12 +11,12 @@ from PIL import Image
 import io
 
 # 從新的模組結構匯入
-from helpers import GoogleServices, GmailHelper, WeatherHelper, PMSClient
+from helpers import GoogleServices, GmailHelper, WeatherHelper, PMSClient, IntentDetector
 from helpers.bot_logger import get_bot_logger  # Bot 內部運作日誌
 from handlers import HandlerRouter, OrderQueryHandler, AIConversationHandler, SameDayBookingHandler, ConversationStateMachine
 from chat_logger import ChatLogger
 from helpers.order_helper import (
-    ROOM_TYPES, normalize_phone, clean_ota_id, 
+    normalize_phone, clean_ota_id, 
     detect_booking_source, get_breakfast_info, get_resume_message,
     sync_order_details
 )
@@ -63,6 +63,11 @@ class HotelBot:
         # Initialize User Sessions
         self.user_sessions = {}
         self.user_context = {}  # Store temporary context like pending order IDs
+        # Gemini chat session 閒置超過 2 小時從記憶體移除（背景 sweeper）
+        from helpers.session_sweeper import get_session_sweeper
+        self._chat_tracker = get_session_sweeper().register(
+            'HotelBot.user_sessions', self.user_sessions, 2 * 60 * 60
+        )
         self.current_user_id = None  # 當前對話的用戶 ID，用於工具調用
         
         # Configure Gemini
@@ -156,15 +161,33 @@ class HotelBot:
             )
             print("✅ VIPServiceHandler initialized.")
             
-            # 🔧 方案 C：啟動時自動重試匹配暫存資料
+            # 🔧 方案 C：背景定期重試匹配暫存資料（啟動後立即執行第一輪）
             try:
-                from helpers.pending_guest import retry_pending_matches
-                matched = retry_pending_matches(self.pms_client, self.logger)
-                if matched > 0:
-                    print(f"🔄 啟動時自動匹配了 {matched} 筆暫存資料")
+                from helpers.pending_guest import start_pending_match_retrier
+                start_pending_match_retrier(self.pms_client, self.logger)
             except Exception as e:
-                print(f"⚠️ 啟動時重試匹配失敗: {e}")
+                print(f"⚠️ 啟動暫存資料重試匹配失敗: {e}")
             
+        # 內部報表每日住房快照：背景刷新，VIP 查詢房況時直接讀本地快照
+        if os.getenv('REPORT_SNAPSHOT_ENABLED', 'True').lower() == 'true':
+            from handlers.internal_query import internal_query
+            internal_query.start_snapshot_refresher()
+
+        # VIP 名單：啟動時一次載入並定期刷新，每則訊息的 VIP 判定直接查本地快取
+        from handlers.vip_manager import vip_manager
+        vip_manager.start_refresher()
+
+        # 記憶體內 session 定期清理（狀態機、各處理器、Gemini chat）
+        from helpers.session_sweeper import get_session_sweeper
+        get_session_sweeper().start()
+
+        # 對話日誌冷資料封存：較舊月份壓縮到 archive/，熱路徑只讀近期的 .jsonl
+        if os.getenv('CHAT_LOG_ARCHIVE_ENABLED', 'True').lower() == 'true':
+            self.logger.start_log_compactor()
+
+        # 對話全文索引：新訊息寫入時即時更新，背景追補舊日誌與後台寫入的紀錄
+        self.logger.start_search_indexer()
+        
         print("系統啟動：旅館專業客服機器人 (AI Vision + Function Calling + Multi-User + Logging + Weather版) 已就緒。")
 
 
@@ -225,7 +248,8 @@ class HotelBot:
         print(f"🔧 Tool Called: update_guest_info(order_id={order_id}, type={info_type}, content={content})")
         
         # 驗證訂單是否存在
-        if order_id not in self.logger.orders:
+        order = self.logger.get_order(order_id)
+        if order is None:
             return {
                 "status": "error",
                 "message": f"Order {order_id} not found in database. Please check the order first."
@@ -233,8 +257,8 @@ class HotelBot:
         
         # 確保訂單有 line_user_id（從當前用戶獲取）
         if hasattr(self, 'current_user_id') and self.current_user_id:
-            if 'line_user_id' not in self.logger.orders[order_id] or not self.logger.orders[order_id]['line_user_id']:
-                self.logger.orders[order_id]['line_user_id'] = self.current_user_id
+            if not order.get('line_user_id'):
+                self.logger.link_order_to_user(order_id, self.current_user_id)
                 print(f"📝 已記錄 line_user_id: {self.current_user_id}")
         
         # 更新資料
@@ -430,7 +454,7 @@ class HotelBot:
             print(f"Gemini Vision Result: {text}")
             
             # Log the image interaction
-            self.logger.log(user_id, "User", "[傳送了一張圖片]")
+            self.logger.log(user_id, "User", "[傳送了一張圖片]", message_type='image')
             self.logger.log(user_id, "Bot (Vision)", text)
             
             # 只提取訂單編號，不回傳其他圖片分析內容
@@ -486,23 +510,17 @@ class HotelBot:
             str: 對話摘要，None 表示無歷史記錄
         """
         try:
-            # 讀取日誌
-            logs = self.logger.get_logs(user_id)
-            
-            if logs == "尚無對話紀錄 (No logs found).":
-                return None
-            
-            # 解析日誌格式: [時間] 【發送者】\n訊息\n-----
             import re
-            pattern = r'\[([^\]]+)\] 【([^】]+)】\n(.*?)(?=\n-{5,}|\Z)'
-            matches = re.findall(pattern, logs, re.DOTALL)
+            # 只取最近的對話（max_turns 輪 = max_turns*2 則訊息，因為每輪包含用戶+Bot）
+            # 結構化日誌直接以索引讀取最後幾筆，不必讀取、解析整份日誌
+            recent_messages = [
+                (r['ts'], r['sender'], r['text'])
+                for r in self.logger.get_recent_records(user_id, max_turns * 2)
+            ]
             
-            if not matches:
+            if not recent_messages:
                 return None
             
-            # 只取最近的對話（max_turns 輪 = max_turns*2 則訊息，因為每輪包含用戶+Bot）
-            recent_messages = matches[-(max_turns * 2):]
-            
             # 提取關鍵資訊
             conversation_lines = []
             found_order_ids = []  # 改為列表，記錄所有訂單號（客人可能訂過多次）
@@ -569,17 +587,19 @@ class HotelBot:
         # Session key 包含模式，確保切換模式時重建 session
         session_key = f"{user_id}_{mode_name}"
         
-        if session_key not in self.user_sessions:
+        # 先 touch 再取用，避免 sweeper 在兩步之間移除
+        self._chat_tracker.touch(session_key)
+        chat = self.user_sessions.get(session_key)
+        if chat is None:
             print(f"Creating new {mode_name} session for user: {user_id}")
-            self.user_sessions[session_key] = model.start_chat(enable_automatic_function_calling=True)
+            chat = self.user_sessions.setdefault(session_key, model.start_chat(enable_automatic_function_calling=True))
         
-        return self.user_sessions[session_key]
+        return chat
 
     def reset_conversation(self, user_id):
         """重置用戶對話：清除 chat session 和對話歷史"""
         # 刪除 chat session（下次會重新創建）
-        if user_id in self.user_sessions:
-            del self.user_sessions[user_id]
+        if self.user_sessions.pop(user_id, None) is not None:
             print(f"✅ Reset chat session for user: {user_id}")
         
         # 清除用戶上下文
@@ -602,28 +622,19 @@ class HotelBot:
         Returns:
             True 如果是訂房意圖且沒有訂單編號
         """
+        intent = IntentDetector.analyze(message)
+        
         # 檢查是否包含訂單編號 (5位數以上)
-        if re.search(r'\b\d{5,}\b', message):
+        if intent.has_long_number:
             return False  # 有訂單編號，走一般查詢流程
         
-        # 排除：查詢訂單相關
-        exclude_keywords = ['我有訂', '已經訂', '查訂單', '我的訂單', '確認訂單']
-        if any(kw in message for kw in exclude_keywords):
-            return False
-        
-        # 檢查是否有訂房關鍵字
-        booking_keywords = [
-            '訂房', '預訂', '今天住', '今日住', '有房', '還有房',
-            '空房', '想住', '要住', '可以住', '今天訂', '今日訂',
-            '今天', '今日'  # 單獨說「今天」也視為訂房意圖
-        ]
-        return any(kw in message for kw in booking_keywords)
+        # 排除：查詢訂單相關；其餘檢查是否有訂房關鍵字
+        return intent.has('booking_without_order') and not intent.has('booking_without_order_exclude')
     
     # 注意：VIP 相關函數已遷移至 handlers/vip_service_handler.py
 
     def _has_order_number(self, message: str) -> bool:
         """檢查訊息中是否包含訂單編號（排除電話號碼）"""
-        from helpers import IntentDetector
         return IntentDetector.has_order_number(message)
 
     def generate_response(self, user_question, user_id="default_user", display_name=None):
@@ -778,8 +789,7 @@ class HotelBot:
             
             # Reset session for this user to recover from error state
             print(f"🔄 Resetting session for user: {user_id} due to error")
-            if user_id in self.user_sessions:
-                del self.user_sessions[user_id]
+            self.user_sessions.pop(user_id, None)
             
             # 不回覆任何訊息,讓客戶重新發送
             # 這樣可以避免客戶看到「連線有點問題」這種不專業的訊息
@@ -831,7 +841,7 @@ class HotelBot:
                 return "抱歉，我聽不太清楚您的語音訊息，可以請您用文字再說一次嗎？"
                 
             # 3. Log the voice message
-            self.logger.log(user_id, "User (Voice)", transcribed_text)
+            self.logger.log(user_id, "User (Voice)", transcribed_text, message_type='audio')
             
             # 4. Process as Text
             return self.generate_response(transcribed_text, user_id, display_name)
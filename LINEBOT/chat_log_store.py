@@ -0,0 +1 @@
+../shared/chat_log_store.py
\ No newline at end of file
@@ -0,0 +1 @@
+../shared/chat_search.py
\ No newline at end of file
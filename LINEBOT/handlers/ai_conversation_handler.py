@@ -6,7 +6,8 @@ AI 對話處理器
 from typing import Optional, Dict, Any
 from datetime import datetime
 
-from .base_handler import BaseHandler
+from .base_handler import BaseHandler, SESSION_IDLE_SECONDS
+from helpers.session_sweeper import get_session_sweeper
 
 
 class AIConversationHandler(BaseHandler):
@@ -41,6 +42,9 @@ class AIConversationHandler(BaseHandler):
         self.weather_helper = weather_helper
         self.logger = logger
         self.chat_sessions: Dict[str, Any] = {}
+        self._chat_tracker = get_session_sweeper().register(
+            'AIConversationHandler.chat_sessions', self.chat_sessions, SESSION_IDLE_SECONDS
+        )
     
     def is_active(self, user_id: str) -> bool:
         """AI 對話不維護持續狀態，總是返回 False"""
@@ -126,14 +130,16 @@ class AIConversationHandler(BaseHandler):
     
     def _get_or_create_chat(self, user_id: str):
         """取得或建立聊天 session"""
-        if user_id not in self.chat_sessions:
-            self.chat_sessions[user_id] = self.model.start_chat(
+        # 先 touch 再取用，避免 sweeper 在兩步之間移除
+        self._chat_tracker.touch(user_id)
+        chat = self.chat_sessions.get(user_id)
+        if chat is None:
+            chat = self.chat_sessions.setdefault(user_id, self.model.start_chat(
                 enable_automatic_function_calling=True
-            )
-        return self.chat_sessions[user_id]
+            ))
+        return chat
     
     def reset_chat(self, user_id: str):
         """重置用戶的聊天 session"""
-        if user_id in self.chat_sessions:
-            del self.chat_sessions[user_id]
+        if self.chat_sessions.pop(user_id, None) is not None:
             print(f"✅ 已重置用戶 {user_id} 的 AI 對話")
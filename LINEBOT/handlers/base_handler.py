@@ -6,6 +6,11 @@
 from abc import ABC, abstractmethod
 from typing import Optional, Dict, Any
 
+from helpers.session_sweeper import get_session_sweeper
+
+# 處理器 session 閒置多久後從記憶體移除（與狀態機的 session 超時一致）
+SESSION_IDLE_SECONDS = 2 * 60 * 60
+
 
 class BaseHandler(ABC):
     """處理器抽象基礎類別"""
@@ -13,6 +18,9 @@ class BaseHandler(ABC):
     def __init__(self):
         self.user_sessions: Dict[str, Dict[str, Any]] = {}
         self._next_handler: Optional[str] = None
+        self._session_tracker = get_session_sweeper().register(
+            f"{type(self).__name__}.user_sessions", self.user_sessions, SESSION_IDLE_SECONDS
+        )
     
     @abstractmethod
     def handle_message(self, user_id: str, message: str, display_name: str = None) -> Optional[str]:
@@ -77,14 +85,16 @@ class BaseHandler(ABC):
     
     def get_session(self, user_id: str) -> Dict[str, Any]:
         """取得或建立用戶 session"""
-        if user_id not in self.user_sessions:
-            self.user_sessions[user_id] = self._create_default_session()
-        return self.user_sessions[user_id]
+        # 先 touch 再取用，避免 sweeper 在兩步之間移除
+        self._session_tracker.touch(user_id)
+        session = self.user_sessions.get(user_id)
+        if session is None:
+            session = self.user_sessions.setdefault(user_id, self._create_default_session())
+        return session
     
     def clear_session(self, user_id: str):
         """清除用戶 session"""
-        if user_id in self.user_sessions:
-            del self.user_sessions[user_id]
+        self.user_sessions.pop(user_id, None)
     
     def _create_default_session(self) -> Dict[str, Any]:
         """建立預設 session（子類別可覆寫）"""
@@ -6,7 +6,11 @@
 - 提供統一的狀態轉換 API
 - 處理跨流程意圖跳轉 (pending_intent)
 - 根據狀態決定應使用的 Handler
-- 【新增】持久化到 SQLite (透過 ktw-backend API)
+- 【新增】持久化到 SQLite (透過 ktw-backend API，或 SESSION_STORE=sqlite 使用本機 SQLite，見 helpers/session_store.py)
+- 狀態變更立即套用於記憶體，由背景執行緒延遲同步：同一用戶的多次變更合併為一次 PUT，
+  失敗的同步寫入 data/session_outbox.json 稍後重試，程式結束前會盡量送出
+- 每個持久化後端分別記錄成功與否：主要後端（如本機 SQLite）已寫入即視為已保存，
+  outbox 只重送給失敗的後端（例如離線的 ktw-backend 鏡像）
 
 設計原則：
 - Single Source of Truth (SSOT)
@@ -14,11 +18,19 @@
 - Handler 只負責業務邏輯，不管理狀態
 """
 
-from typing import Dict, Optional, Any
+from typing import Dict, Optional, Any, List
 from datetime import datetime
-import requests
+from collections import deque
+import threading
+import atexit
+import copy
+import json
+import time
 import os
 
+from helpers.session_store import SessionStore, create_session_stores
+from helpers.session_sweeper import get_session_sweeper
+
 
 class ConversationStateMachine:
     """統一對話狀態機（含 SQLite 持久化）"""
@@ -47,13 +59,72 @@ class ConversationStateMachine:
     STATE_BOOKING_CONFIRM = 'booking.confirm'
     STATE_BOOKING_COMPLETED = 'booking.completed'
     
-    # ktw-backend API URL (本地，非 PMS 192.168.8.3)
-    BACKEND_API_URL = os.getenv('KTW_BACKEND_URL', 'http://localhost:3000')
+    # 背景同步：收到變更後等待多久再送出（期間的多次變更合併為一次）
+    SYNC_COALESCE_SECONDS = 0.5
+    # outbox 中失敗項目的重試間隔（秒）
+    OUTBOX_RETRY_SECONDS = 30
+    # 程式結束時送出待同步資料的時間上限（秒）
+    SHUTDOWN_FLUSH_SECONDS = 5
     
-    def __init__(self):
-        """初始化狀態機"""
+    def __init__(self, outbox_file: Optional[str] = None, stores: Optional[List[SessionStore]] = None):
+        """
+        初始化狀態機
+
+        Args:
+            outbox_file: 同步失敗項目的暫存檔，預設 data/session_outbox.json
+            stores: 持久化後端（第一個為主要來源），預設依 SESSION_STORE 建立
+        """
         self.sessions: Dict[str, Dict[str, Any]] = {}
         self._sync_enabled = True  # 可透過環境變數關閉同步
+        self.stores = stores if stores is not None else create_session_stores()
+
+        if outbox_file is None:
+            current_dir = os.path.dirname(os.path.abspath(__file__))
+            project_root = os.path.dirname(os.path.dirname(current_dir))
+            outbox_file = os.path.join(project_root, "data", "session_outbox.json")
+        self.outbox_file = outbox_file
+
+        # 待同步：user_id → {'op': 'put' | 'delete', 'since': 第一次變更的時間}
+        self._pending_sync: Dict[str, Dict[str, Any]] = {}
+        # 同步失敗的項目：user_id → {'op', 'payload', 'stores', 'since', 'attempts'}（持久化到 outbox 檔）
+        # stores 為尚未寫入成功的後端名稱
+        self._outbox: Dict[str, Dict[str, Any]] = self._load_outbox()
+        self._sync_lock = threading.Lock()
+        self._send_lock = threading.Lock()  # 背景執行緒與結束前 flush 不同時送出 / 改寫 outbox
+        self._sync_event = threading.Event()
+        self._sync_lags = deque(maxlen=500)  # 變更 → 同步成功經過的秒數
+        self._sync_stats = {'synced': 0, 'failed': 0, 'coalesced': 0}
+        threading.Thread(target=self._sync_loop, name='session-sync', daemon=True).start()
+        atexit.register(self.flush_sync)
+
+        # 主要後端支援批次預載時（本機 SQLite），重啟後進行中的流程立即可用
+        self.preload_sessions()
+
+        # 閒置超過 SESSION_TIMEOUT_SECONDS 的 session 從記憶體移除（持久化資料保留）
+        self._session_tracker = get_session_sweeper().register(
+            'ConversationStateMachine.sessions', self.sessions, self.SESSION_TIMEOUT_SECONDS,
+            on_evict=self._can_evict
+        )
+
+    def _can_evict(self, user_id: str) -> bool:
+        """尚未同步到後端的 session 暫不移除"""
+        with self._sync_lock:
+            return user_id not in self._pending_sync
+
+    def preload_sessions(self) -> int:
+        """從主要後端一次載入所有進行中、未超時的 session，回傳筆數"""
+        if not self._sync_enabled or not self.stores:
+            return 0
+        try:
+            active = self.stores[0].load_active(self.SESSION_TIMEOUT_SECONDS)
+        except Exception as e:
+            print(f"⚠️ 預載 Session 失敗: {e}")
+            return 0
+        for user_id, session in active.items():
+            self.sessions.setdefault(user_id, session)
+        if active:
+            print(f"📥 已預載 {len(active)} 筆進行中 Session ({self.stores[0].name})")
+        return len(active)
     
     # Session 超時時間（秒）：超過此時間未活動自動重置為 idle
     SESSION_TIMEOUT_SECONDS = 2 * 60 * 60  # 2 小時
@@ -71,7 +142,10 @@ class ConversationStateMachine:
         Returns:
             用戶的 session dict
         """
-        if user_id not in self.sessions:
+        # 先 touch 再取用，避免 sweeper 在兩步之間移除
+        self._session_tracker.touch(user_id)
+        session = self.sessions.get(user_id)
+        if session is None:
             # 先嘗試從 SQLite 載入
             persisted = self._load_from_backend(user_id)
             if persisted:
@@ -79,19 +153,19 @@ class ConversationStateMachine:
                 if self._is_session_expired(persisted):
                     print(f"⏰ Session 已超時，自動重置: {user_id} (上次: {persisted.get('updated_at')})")
                     self.reset_session(user_id)
-                    self.sessions[user_id] = self._create_default_session()
+                    session = self._create_default_session()
                 else:
-                    self.sessions[user_id] = persisted
-                    print(f"📥 Session 從 SQLite 載入: {user_id} → {persisted.get('state')}")
+                    session = persisted
+                    print(f"📥 Session 從 {self.stores[0].name} 載入: {user_id} → {persisted.get('state')}")
             else:
-                self.sessions[user_id] = self._create_default_session()
-        else:
+                session = self._create_default_session()
+            session = self.sessions.setdefault(user_id, session)
+        elif self._is_session_expired(session):
             # 記憶體中的 session 也要檢查超時
-            if self._is_session_expired(self.sessions[user_id]):
-                print(f"⏰ 記憶體 Session 已超時，自動重置: {user_id}")
-                self.reset_session(user_id)
-                self.sessions[user_id] = self._create_default_session()
-        return self.sessions[user_id]
+            print(f"⏰ 記憶體 Session 已超時，自動重置: {user_id}")
+            self.reset_session(user_id)
+            session = self.sessions.setdefault(user_id, self._create_default_session())
+        return session
     
     def _is_session_expired(self, session: Dict[str, Any]) -> bool:
         """
@@ -132,66 +206,226 @@ class ConversationStateMachine:
         }
     
     def _load_from_backend(self, user_id: str) -> Optional[Dict[str, Any]]:
-        """從 ktw-backend 載入 session"""
+        """從主要後端載入 session（outbox 中尚未送出的版本較新，優先使用）"""
         if not self._sync_enabled:
             return None
-        try:
-            response = requests.get(
-                f"{self.BACKEND_API_URL}/api/bot/sessions/{user_id}",
-                timeout=2
-            )
-            if response.ok:
-                result = response.json()
-                if result.get('success') and result.get('data'):
-                    db_session = result['data']
-                    return {
-                        'state': db_session.get('state', self.STATE_IDLE),
-                        'created_at': db_session.get('created_at', datetime.now().isoformat()),
-                        'updated_at': db_session.get('updated_at', datetime.now().isoformat()),
-                        'data': db_session.get('data', {}),
-                        'pending_intent': db_session.get('pending_intent'),
-                        'pending_intent_message': db_session.get('pending_intent_message'),
-                    }
-        except Exception as e:
-            print(f"⚠️ 載入 Session 失敗: {e}")
-        return None
+        outboxed = self._outbox.get(user_id)
+        # 主要後端已寫入時以它為準（outbox 只是要補送給鏡像）
+        if outboxed and self._is_outboxed_for_primary(outboxed):
+            if outboxed['op'] == 'delete':
+                return None
+            payload = copy.deepcopy(outboxed['payload'])
+            payload.pop('handler_type', None)
+            payload.setdefault('created_at', payload.get('updated_at'))
+            return payload
+        if not self.stores:
+            return None
+        return self.stores[0].load(user_id)
     
+    # ===== 背景同步（write-behind） =====
+
     def _sync_to_backend(self, user_id: str):
-        """同步 session 到 ktw-backend"""
-        if not self._sync_enabled:
-            return
-        try:
-            session = self.sessions.get(user_id)
-            if not session:
-                return
-            
-            payload = {
-                'handler_type': self.get_active_handler_type(user_id),
-                'state': session.get('state'),
-                'data': session.get('data', {}),
-                'pending_intent': session.get('pending_intent'),
-                'pending_intent_message': session.get('pending_intent_message'),
-            }
-            
-            requests.put(
-                f"{self.BACKEND_API_URL}/api/bot/sessions/{user_id}",
-                json=payload,
-                timeout=2
-            )
-        except Exception as e:
-            print(f"⚠️ 同步 Session 失敗: {e}")
+        """標記 session 待同步（實際 PUT 由背景執行緒合併送出）"""
+        self._enqueue_sync(user_id, 'put')
     
     def _delete_from_backend(self, user_id: str):
-        """從 ktw-backend 刪除 session"""
+        """標記 session 待刪除（實際 DELETE 由背景執行緒送出）"""
+        self._enqueue_sync(user_id, 'delete')
+
+    def _enqueue_sync(self, user_id: str, op: str):
         if not self._sync_enabled:
             return
+        with self._sync_lock:
+            pending = self._pending_sync.get(user_id)
+            if pending:
+                # 尚未送出前的多次變更合併，只送最後的狀態
+                pending['op'] = op
+                self._sync_stats['coalesced'] += 1
+            else:
+                self._pending_sync[user_id] = {'op': op, 'since': time.time()}
+        self._sync_event.set()
+
+    def _build_payload(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """取得 session 目前內容的複本（送出時才讀取，合併期間的變更都會包含在內）"""
+        session = self.sessions.get(user_id)
+        if not session:
+            return None
+        state = session.get('state')
+        return copy.deepcopy({
+            'handler_type': self._handler_type_for_state(state or self.STATE_IDLE),
+            'state': state,
+            'data': session.get('data', {}),
+            'pending_intent': session.get('pending_intent'),
+            'pending_intent_message': session.get('pending_intent_message'),
+            'created_at': session.get('created_at'),
+            'updated_at': session.get('updated_at'),
+        })
+
+    def _is_outboxed_for_primary(self, item: Dict[str, Any]) -> bool:
+        """outbox 項目是否仍待寫入主要後端（舊格式沒有 stores 欄位，視為全部待寫入）"""
+        if not self.stores:
+            return True
+        return self.stores[0].name in item.get('stores', [self.stores[0].name])
+
+    def _send(self, user_id: str, op: str, payload: Optional[Dict[str, Any]],
+              store_names: Optional[List[str]] = None) -> List[str]:
+        """
+        寫入持久化後端（寫入可重複執行），回傳失敗的後端名稱
+
+        Args:
+            store_names: 只寫入這些後端，None 表示全部
+        """
+        failed = []
+        for store in self.stores:
+            if store_names is not None and store.name not in store_names:
+                continue
+            if op == 'delete':
+                ok = store.delete(user_id)
+            else:
+                ok = store.save(user_id, payload)
+            if not ok:
+                failed.append(store.name)
+        return failed
+
+    def _drain_pending(self):
+        """送出所有待同步項目；失敗的放進 outbox"""
+        with self._send_lock:
+            self._drain_pending_locked()
+
+    def _drain_pending_locked(self):
+        with self._sync_lock:
+            pending, self._pending_sync = self._pending_sync, {}
+
+        outbox_changed = False
+        for user_id, item in pending.items():
+            payload = None
+            if item['op'] == 'put':
+                try:
+                    payload = self._build_payload(user_id)
+                except RuntimeError:
+                    # 讀取時 session 剛好被其他執行緒修改，下一輪再送
+                    self._enqueue_sync(user_id, 'put')
+                    continue
+                if payload is None:
+                    continue
+
+            failed = self._send(user_id, item['op'], payload)
+            if not failed or not self._is_outboxed_for_primary({'stores': failed}):
+                # 主要後端寫入成功即已保存
+                self._record_synced(item['since'])
+            if not failed:
+                if self._outbox.pop(user_id, None) is not None:
+                    outbox_changed = True
+            else:
+                self._sync_stats['failed'] += 1
+                # 同一用戶只保留最新的一筆（較舊的失敗項目已被取代），只重送給失敗的後端
+                self._outbox[user_id] = {
+                    'op': item['op'],
+                    'payload': payload,
+                    'stores': failed,
+                    'since': self._outbox.get(user_id, item)['since'],
+                    'attempts': self._outbox.get(user_id, {}).get('attempts', 0) + 1,
+                    'next_retry_at': time.time() + self.OUTBOX_RETRY_SECONDS,
+                }
+                outbox_changed = True
+
+        if outbox_changed:
+            self._save_outbox()
+
+    def _retry_outbox(self, force: bool = False):
+        """重試 outbox 中到期的失敗項目"""
+        with self._send_lock:
+            self._retry_outbox_locked(force)
+
+    def _retry_outbox_locked(self, force: bool):
+        now = time.time()
+        changed = False
+        for user_id, item in list(self._outbox.items()):
+            if not force and item.get('next_retry_at', 0) > now:
+                continue
+            with self._sync_lock:
+                # 已有更新的變更在排隊，由正常流程送出
+                if user_id in self._pending_sync:
+                    continue
+            failed = self._send(user_id, item['op'], item.get('payload'), item.get('stores'))
+            if self._is_outboxed_for_primary(item) and not self._is_outboxed_for_primary({'stores': failed}):
+                self._record_synced(item['since'])
+            if not failed:
+                self._outbox.pop(user_id, None)
+            else:
+                item['stores'] = failed
+                item['attempts'] = item.get('attempts', 0) + 1
+                item['next_retry_at'] = now + min(self.OUTBOX_RETRY_SECONDS * 2 ** (item['attempts'] - 1), 3600)
+            changed = True
+        if changed:
+            self._save_outbox()
+
+    def _record_synced(self, since: float):
+        self._sync_stats['synced'] += 1
+        self._sync_lags.append(time.time() - since)
+
+    def _sync_loop(self):
+        """背景執行緒：收到變更後稍待片刻，合併送出；定期重試 outbox"""
+        while True:
+            self._sync_event.wait(self.OUTBOX_RETRY_SECONDS)
+            if self._sync_event.is_set():
+                time.sleep(self.SYNC_COALESCE_SECONDS)
+                self._sync_event.clear()
+            try:
+                self._drain_pending()
+                if self._outbox:
+                    self._retry_outbox()
+            except Exception as e:
+                print(f"⚠️ Session 背景同步失敗: {e}")
+
+    def flush_sync(self):
+        """立即送出所有待同步項目（程式結束時呼叫；送不出的保留在 outbox 檔）"""
+        deadline = time.time() + self.SHUTDOWN_FLUSH_SECONDS
+        self._drain_pending()
+        if self._outbox and time.time() < deadline:
+            self._retry_outbox(force=True)
+
+    def _load_outbox(self) -> Dict[str, Dict[str, Any]]:
         try:
-            requests.delete(
-                f"{self.BACKEND_API_URL}/api/bot/sessions/{user_id}",
-                timeout=2
-            )
-        except Exception as e:
-            print(f"⚠️ 刪除 Session 失敗: {e}")
+            with open(self.outbox_file, 'r', encoding='utf-8') as f:
+                outbox = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if outbox:
+            print(f"📮 Session outbox 有 {len(outbox)} 筆待重送")
+        # 重新啟動後立即重試
+        for item in outbox.values():
+            item['next_retry_at'] = 0
+        return outbox
+
+    def _save_outbox(self):
+        """原子寫入 outbox 檔（暫存檔 + os.replace）"""
+        try:
+            os.makedirs(os.path.dirname(self.outbox_file), exist_ok=True)
+            tmp_path = f"{self.outbox_file}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._outbox, f, ensure_ascii=False)
+            os.replace(tmp_path, self.outbox_file)
+        except OSError as e:
+            print(f"⚠️ Session outbox 寫入失敗: {e}")
+
+    def get_sync_stats(self) -> Dict[str, Any]:
+        """同步統計：待同步 / outbox 筆數、成功 / 失敗 / 合併次數、同步延遲（秒）"""
+        with self._sync_lock:
+            pending = len(self._pending_sync)
+            oldest = min((item['since'] for item in self._pending_sync.values()), default=None)
+        lags = sorted(self._sync_lags)
+        oldest_outbox = min((item['since'] for item in self._outbox.values()), default=None)
+        candidates = [t for t in (oldest, oldest_outbox) if t is not None]
+        return {
+            'pending': pending,
+            'outbox': len(self._outbox),
+            **self._sync_stats,
+            'lag_avg_seconds': round(sum(lags) / len(lags), 3) if lags else None,
+            'lag_p95_seconds': round(lags[int(len(lags) * 0.95) - 1 if len(lags) > 1 else 0], 3) if lags else None,
+            # 目前尚未同步成功的最舊變更已等待多久
+            'current_lag_seconds': round(time.time() - min(candidates), 3) if candidates else 0,
+        }
     
     def get_state(self, user_id: str) -> str:
         """
@@ -271,8 +505,11 @@ class ConversationStateMachine:
         Returns:
             'order_query', 'same_day_booking', 或 'ai_conversation'
         """
-        state = self.get_state(user_id)
-        
+        return self._handler_type_for_state(self.get_state(user_id))
+
+    @staticmethod
+    def _handler_type_for_state(state: str) -> str:
+        """狀態 → Handler 類型"""
         if state.startswith('order_query'):
             return 'order_query'
         elif state.startswith('booking'):
@@ -368,8 +605,7 @@ class ConversationStateMachine:
         Args:
             user_id: LINE 用戶 ID
         """
-        if user_id in self.sessions:
-            del self.sessions[user_id]
+        self.sessions.pop(user_id, None)
         
         # 從 SQLite 刪除
         self._delete_from_backend(user_id)
@@ -5,22 +5,64 @@
 
 import requests
 import os
+import time
+import threading
 from datetime import datetime, timedelta
 
+from helpers.report_cache import get_report_cache
+from helpers.room_catalog import get_room_catalog
+
 class InternalQueryHandler:
     """內部 VIP 專用查詢器"""
     
+    # 日期區間查詢（checkin-range）每頁筆數
+    RANGE_PAGE_SIZE = 200
+    # 區間查詢最多翻頁數（防止伺服器分頁資訊異常時無限迴圈）
+    RANGE_MAX_PAGES = 50
+    # 伺服器不支援區間查詢時，隔多久再重新探測（秒）
+    RANGE_REPROBE_SECONDS = 60 * 60
+    
+    # 每日住房快照排程：今日每 5 分鐘刷新，未來 60 天每小時刷新
+    SNAPSHOT_TODAY_INTERVAL = 5 * 60
+    SNAPSHOT_FUTURE_INTERVAL = 60 * 60
+    SNAPSHOT_FUTURE_DAYS = 60
+    # 沒有區間查詢（逐日呼叫 PMS）時，每小時只刷新未來 14 天，避免每次數十個請求
+    SNAPSHOT_FUTURE_DAYS_PER_DAY = 14
+    
+    # 不佔用房間的訂單狀態（取消、NO-SHOW），不計入住房率
+    NOT_IN_HOUSE_STATUSES = ('D', 'C', 'S')
+    
     def __init__(self):
         self.backend_url = os.getenv('KTW_BACKEND_URL', 'http://localhost:3000')
         self.pms_api_url = os.getenv('PMS_API_URL', 'http://192.168.8.3:3000')
+        # 區間端點（checkin-range）需 PMS API 另行提供，目前 pms-api 沒有此路由，預設逐日查詢
+        self._range_enabled = os.getenv('PMS_CHECKIN_RANGE_ENABLED', 'False').lower() == 'true'
+        # 最近一次確認伺服器不支援區間查詢的時間（None = 未知或支援）
+        self._range_unsupported_at = None
+        # 今日房況快照 (刷新時間, 查詢結果)
+        self._today_status_snapshot = None
+        self._snapshot_thread = None
     
     def query_today_status(self) -> dict:
         """
         查詢今日房況
         
+        背景排程會定期刷新快照，快照仍新鮮時直接回傳，不呼叫 API。
+        
         Returns:
             dict: 包含入住數、退房數、住房率等資訊
         """
+        snapshot = self._today_status_snapshot
+        if snapshot and time.time() - snapshot[0] < self.SNAPSHOT_TODAY_INTERVAL * 2:
+            return dict(snapshot[1])
+        
+        result = self._fetch_today_status()
+        if result.get('success'):
+            self._today_status_snapshot = (time.time(), result)
+        return result
+    
+    def _fetch_today_status(self) -> dict:
+        """即時查詢今日房況（Dashboard + 房間狀態 + 今日入住）"""
         try:
             # 取得 Dashboard 基本數據
             response = requests.get(
@@ -129,44 +171,24 @@ class InternalQueryHandler:
             yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
             weekday_name = ['一', '二', '三', '四', '五', '六', '日'][(datetime.now() - timedelta(days=1)).weekday()]
             
-            booking_count = 0
-            room_count = 0
-            room_type_stats = {}  # 房型統計
-            source_stats = {}     # 來源統計
-            
+            # 昨日已發生，統計結果可永久快取
             try:
-                response = requests.get(
-                    f"{self.pms_api_url}/api/bookings/checkin-by-date",
-                    params={'date': yesterday},
-                    timeout=5
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    bookings = data.get('data', [])
-                    booking_count = len(bookings)
-                    
-                    for b in bookings:
-                        room_numbers = b.get('room_numbers', [])
-                        rooms = len(room_numbers) if room_numbers else b.get('room_count', 1)
-                        room_count += rooms
-                        
-                        # 統計房型 - 用實際房號查詢（昨日=已發生）
-                        actual_types = self._get_actual_room_type(room_numbers)
-                        for rt_name, count in actual_types.items():
-                            room_type_stats[rt_name] = room_type_stats.get(rt_name, 0) + count
-                        
-                        # 統計來源 (從 remarks 或 ota_booking_id 判斷)
-                        source = self._detect_booking_source(b)
-                        source_stats[source] = source_stats.get(source, 0) + 1
-                        
+                stats = self._get_day_stats(yesterday)
             except Exception as e:
                 return {'success': False, 'message': f'❌ 查詢失敗: {str(e)}'}
             
+            booking_count = stats['booking_count']
+            room_count = stats['room_count']
+            room_type_stats = stats['room_types']  # 房型統計
+            source_stats = stats['sources']        # 來源統計
+            rate = stats.get('occupancy_rate', 0)
+            occupied_rooms = stats.get('occupied_rooms', 0)
+            
             # 組合訊息
             lines = [f"📊 昨日房況 ({yesterday} 週{weekday_name})"]
             lines.append(f"━━━━━━━━━━━━━━━━━")
             lines.append(f"📈 已住統計：{booking_count} 筆 / {room_count} 間")
+            lines.append(f"📊 住房率：{rate}% ({occupied_rooms}/{self.TOTAL_ROOMS})")
             
             if room_type_stats:
                 lines.append(f"\n🏨 房型分布：")
@@ -185,60 +207,31 @@ class InternalQueryHandler:
                 'date': yesterday,
                 'room_types': room_type_stats,
                 'sources': source_stats,
+                'occupancy_rate': rate,
                 'message': '\n'.join(lines)
             }
             
         except Exception as e:
             return {'success': False, 'message': f'❌ 查詢失敗: {str(e)}'}
     
-    # 房號 → 房型代碼對照表（固定不變）
-    ROOM_TYPE_BY_NUMBER = {
-        # 2F
-        '201': 'SQ', '202': 'SQ', '203': 'SD', '205': 'FM', '206': 'SD', '207': 'SD', 
-        '208': 'SD', '210': 'SD', '211': 'SD', '212': 'FM', '213': 'AQ', '215': 'SQ', '216': 'SQ',
-        # 3F
-        '301': 'SQ', '302': 'SQ', '303': 'SQ', '305': 'FM', '306': 'SQ', '307': 'ST', 
-        '308': 'ST', '309': 'ST', '310': 'ST', '311': 'ST', '312': 'FM', '313': 'AQ', '315': 'SQ', '316': 'SQ',
-        # 5F
-        '501': 'WQ', '502': 'WD', '503': 'WQ', '505': 'VQ', '506': 'CD', '507': 'CQ', 
-        '508': 'CQ', '509': 'CD', '510': 'CQ', '511': 'CD', '512': 'VQ', '513': 'AQ', '515': 'CD', '516': 'CQ',
-        # 6F
-        '601': 'WD', '602': 'WD', '603': 'WD', '605': 'VD', '606': 'DD', '607': 'ED', 
-        '608': 'DD', '609': 'ED', '611': 'ED', '612': 'VD', '613': 'AD', '615': 'DD', '616': 'ED',
-    }
+    @property
+    def TOTAL_ROOMS(self) -> int:
+        """總房數（計算每日住房率用，來自房型目錄）"""
+        return get_room_catalog().total_rooms
     
     def _get_room_type_name(self, code: str) -> str:
-        """將房型代碼轉換為中文名稱（與 room_type_mapping.json 一致）"""
-        mapping = {
-            'AD': '無障礙雙人房',
-            'AQ': '無障礙四人房',
-            'CD': '經典雙人房',
-            'CQ': '經典四人房',
-            'DD': '豪華雙人房',
-            'ED': '行政雙人房',
-            'FM': '親子家庭房',
-            'SD': '標準雙人房',
-            'SQ': '標準四人房',
-            'ST': '標準三人房',
-            'VD': 'VIP雙人房',
-            'VQ': 'VIP四人房',
-            'WD': '海景雙人房',
-            'WQ': '海景四人房',
-            'PH': '閣樓房',
-            'FD': '家庭雙人房',
-            'FQ': '家庭四人房',
-        }
-        return mapping.get(code.strip().upper(), code or '未知房型')
+        """將房型代碼轉換為中文名稱（來自 data/room_catalog.json）"""
+        return get_room_catalog().get_type_name(code)
     
     def _get_actual_room_type(self, room_numbers: list) -> dict:
         """
         從房號列表取得實際房型統計
         用於已發生的日期（過去/今日）
         """
+        catalog = get_room_catalog()
         stats = {}
         for room_no in room_numbers:
-            rt_code = self.ROOM_TYPE_BY_NUMBER.get(str(room_no).strip(), '')
-            rt_name = self._get_room_type_name(rt_code)
+            rt_name = catalog.get_type_name(catalog.get_type_code(room_no))
             stats[rt_name] = stats.get(rt_name, 0) + 1
         return stats
     
@@ -258,6 +251,328 @@ class InternalQueryHandler:
         else:
             return '官網/電話'
     
+    def _fetch_checkins_for_date(self, date_str: str) -> list:
+        """
+        查詢單日入住訂單（checkin-by-date）
+        
+        Args:
+            date_str: 日期字串 (YYYY-MM-DD 格式)
+            
+        Returns:
+            list | None: 訂單列表，API 非 200 時回傳 None（連線錯誤會拋出例外）
+        """
+        response = requests.get(
+            f"{self.pms_api_url}/api/bookings/checkin-by-date",
+            params={'date': date_str},
+            timeout=5
+        )
+        if response.status_code == 200:
+            return response.json().get('data', [])
+        return None
+    
+    def _fetch_checkins_by_range(self, start_date: str, end_date: str) -> dict:
+        """
+        查詢日期區間內的入住訂單，並依入住日期分組
+        
+        設定 PMS_CHECKIN_RANGE_ENABLED 時優先使用 PMS 區間端點（checkin-range，分頁取回），
+        一次請求串流取代逐日 N 次呼叫；未設定或伺服器不支援時逐日查詢 checkin-by-date。
+        
+        Args:
+            start_date: 起始日期 (YYYY-MM-DD)
+            end_date: 結束日期 (YYYY-MM-DD，含當日)
+            
+        Returns:
+            dict: {日期字串: 訂單列表}，查詢失敗的日期不會出現在結果中
+        """
+        start = datetime.strptime(start_date, '%Y-%m-%d')
+        end = datetime.strptime(end_date, '%Y-%m-%d')
+        date_strs = [(start + timedelta(days=i)).strftime('%Y-%m-%d')
+                     for i in range((end - start).days + 1)]
+        
+        if self._is_range_supported():
+            grouped = self._fetch_checkin_range_pages(start_date, end_date)
+            if grouped is not None:
+                return {d: grouped.get(d, []) for d in date_strs}
+        
+        # Fallback：逐日查詢
+        result = {}
+        for d in date_strs:
+            try:
+                bookings = self._fetch_checkins_for_date(d)
+                if bookings is not None:
+                    result[d] = bookings
+            except Exception as e:
+                print(f"⚠️ 查詢 {d} 失敗: {e}")
+        return result
+    
+    def _is_range_supported(self) -> bool:
+        """伺服器是否（可能）支援區間查詢，不支援的判定會在一段時間後失效並重新探測"""
+        if not self._range_enabled:
+            return False
+        if self._range_unsupported_at is None:
+            return True
+        if time.time() - self._range_unsupported_at > self.RANGE_REPROBE_SECONDS:
+            self._range_unsupported_at = None
+            return True
+        return False
+    
+    def _fetch_checkin_range_pages(self, start_date: str, end_date: str):
+        """
+        分頁取回 checkin-range 結果並依 check_in_date 分組
+        
+        Returns:
+            dict | None: {日期字串: 訂單列表}；伺服器不支援或中途失敗回傳 None（由呼叫端退回逐日查詢）
+        """
+        grouped = {}
+        page = 1
+        
+        try:
+            while page <= self.RANGE_MAX_PAGES:
+                response = requests.get(
+                    f"{self.pms_api_url}/api/bookings/checkin-range",
+                    params={
+                        'start_date': start_date,
+                        'end_date': end_date,
+                        'page': page,
+                        'page_size': self.RANGE_PAGE_SIZE
+                    },
+                    timeout=10
+                )
+                
+                # 404/400/405：舊版 PMS API 沒有此端點（會被 /:booking_id 攔截）
+                if response.status_code in (400, 404, 405, 501):
+                    print(f"ℹ️ PMS 不支援區間查詢 (HTTP {response.status_code})，改用逐日查詢")
+                    self._range_unsupported_at = time.time()
+                    return None
+                if response.status_code != 200:
+                    print(f"⚠️ 區間查詢失敗: HTTP {response.status_code}")
+                    return None
+                
+                data = response.json()
+                if not data.get('success') or not isinstance(data.get('data'), list):
+                    print(f"ℹ️ PMS 區間查詢回傳格式不符，改用逐日查詢")
+                    self._range_unsupported_at = time.time()
+                    return None
+                
+                bookings = data['data']
+                for b in bookings:
+                    # 與 checkin-by-date 一致：入住日之後的續住日也列入（計算當晚住房率）
+                    for stay_date in self._stay_dates(b, end_date):
+                        grouped.setdefault(stay_date, []).append(b)
+                
+                has_more = data.get('has_more')
+                if has_more is None:
+                    has_more = len(bookings) >= self.RANGE_PAGE_SIZE
+                if not has_more:
+                    return grouped
+                page += 1
+            
+            print(f"⚠️ 區間查詢超過 {self.RANGE_MAX_PAGES} 頁，改用逐日查詢")
+            return None
+            
+        except Exception as e:
+            print(f"⚠️ 區間查詢失敗: {e}")
+            return None
+    
+    def _stay_dates(self, booking: dict, end_date: str) -> list:
+        """訂單在 end_date（含）之前的住宿日期：入住日到退房前一天，沒有退房日時只算入住日"""
+        check_in = (booking.get('check_in_date') or '')[:10]
+        check_out = (booking.get('check_out_date') or '')[:10]
+        if not check_in:
+            return []
+        dates = [check_in]
+        day = datetime.strptime(check_in, '%Y-%m-%d') + timedelta(days=1)
+        while check_out and day.strftime('%Y-%m-%d') < check_out and day.strftime('%Y-%m-%d') <= end_date:
+            dates.append(day.strftime('%Y-%m-%d'))
+            day += timedelta(days=1)
+        return dates
+    
+    def _is_in_house(self, booking: dict, date_str: str) -> bool:
+        """訂單當晚是否佔用房間（入住日 ≤ 當日 < 退房日，排除取消 / NO-SHOW）"""
+        if booking.get('status_code') in self.NOT_IN_HOUSE_STATUSES:
+            return False
+        check_in = (booking.get('check_in_date') or '')[:10]
+        check_out = (booking.get('check_out_date') or '')[:10]
+        if not check_in or check_in > date_str:
+            return False
+        return not check_out or date_str < check_out
+    
+    def _count_rooms(self, booking: dict) -> int:
+        """計算單筆訂單房間數（已分房用 room_numbers，未分房用 rooms 陣列）"""
+        room_numbers = booking.get('room_numbers', [])
+        if room_numbers:
+            return len(room_numbers)
+        rooms = booking.get('rooms', [])
+        return len(rooms) if rooms else 1
+    
+    def _aggregate_day(self, date_str: str, bookings: list) -> dict:
+        """
+        彙總單日入住統計
+        
+        Args:
+            date_str: 日期字串 (YYYY-MM-DD)
+            bookings: 該日入住訂單列表
+            
+        Returns:
+            dict: booking_count, room_count, room_types, sources,
+                  occupied_rooms（當晚在住間數）, occupancy_rate（在住間數 / 總房數）
+        """
+        is_past_or_today = date_str <= datetime.now().strftime('%Y-%m-%d')
+        room_count = 0
+        occupied_rooms = 0
+        room_type_stats = {}
+        source_stats = {}
+        
+        for b in bookings:
+            room_numbers = b.get('room_numbers', [])
+            room_count += self._count_rooms(b)
+            if self._is_in_house(b, date_str):
+                occupied_rooms += self._count_rooms(b)
+            
+            # 統計房型：過去/今日用實際房型，未來用訂單房型
+            if is_past_or_today and room_numbers:
+                # 已發生：用房號查實際房型
+                actual_types = self._get_actual_room_type(room_numbers)
+                for rt_name, count in actual_types.items():
+                    room_type_stats[rt_name] = room_type_stats.get(rt_name, 0) + count
+            else:
+                # 未發生：用訂單房型（計價房種）
+                for room in b.get('rooms', []):
+                    rt_code = room.get('room_type_code', '').strip()
+                    rt_name = self._get_room_type_name(rt_code)
+                    room_type_stats[rt_name] = room_type_stats.get(rt_name, 0) + 1
+            
+            # 統計來源 (從 remarks 或 ota_booking_id 判斷)
+            source = self._detect_booking_source(b)
+            source_stats[source] = source_stats.get(source, 0) + 1
+        
+        return {
+            'booking_count': len(bookings),
+            'room_count': room_count,
+            'room_types': room_type_stats,
+            'sources': source_stats,
+            'occupied_rooms': occupied_rooms,
+            'occupancy_rate': round(occupied_rooms / self.TOTAL_ROOMS * 100, 1) if self.TOTAL_ROOMS else 0
+        }
+    
+    def _get_day_stats(self, date_str: str) -> dict:
+        """
+        取得單日統計（優先讀快取，連線失敗時拋出例外）
+        
+        API 非 200 時視為 0 筆，但不寫入快取，避免把錯誤結果永久保存。
+        """
+        cache = get_report_cache()
+        stats = cache.get(date_str)
+        if stats is None:
+            bookings = self._fetch_checkins_for_date(date_str)
+            stats = self._aggregate_day(date_str, bookings or [])
+            if bookings is not None:
+                cache.set(date_str, stats)
+        return stats
+    
+    def _get_days_stats(self, date_strs: list) -> dict:
+        """
+        取得多日統計：已快取的日期直接使用，其餘以一次區間查詢補齊
+        
+        Args:
+            date_strs: 日期字串列表（已排序）
+            
+        Returns:
+            dict: {日期字串: 統計 dict}，查詢失敗的日期不在結果中
+        """
+        cache = get_report_cache()
+        stats_by_date = cache.get_many(date_strs)
+        missing = [d for d in date_strs if d not in stats_by_date]
+        
+        if missing:
+            bookings_by_date = self._fetch_checkins_by_range(missing[0], missing[-1])
+            fresh = {
+                d: self._aggregate_day(d, bookings_by_date[d])
+                for d in missing if d in bookings_by_date
+            }
+            cache.set_many(fresh)
+            stats_by_date.update(fresh)
+        
+        return stats_by_date
+    
+    # ============================================
+    # 每日住房快照排程 (背景刷新)
+    # ============================================
+    
+    def _refresh_days_stats(self, date_strs: list, ttl_seconds: int) -> int:
+        """
+        強制重新計算多日統計並寫入快照（已永久快取的過去日期略過）
+        
+        Args:
+            date_strs: 日期字串列表（已排序）
+            ttl_seconds: 快照有效秒數
+            
+        Returns:
+            int: 成功刷新的天數
+        """
+        cache = get_report_cache()
+        final = cache.get_many(date_strs, final_only=True)
+        stale = [d for d in date_strs if d not in final]
+        if not stale:
+            return 0
+        
+        bookings_by_date = self._fetch_checkins_by_range(stale[0], stale[-1])
+        fresh = {
+            d: self._aggregate_day(d, bookings_by_date[d])
+            for d in stale if d in bookings_by_date
+        }
+        cache.set_many(fresh, ttl_seconds)
+        return len(fresh)
+    
+    def refresh_today_snapshot(self):
+        """刷新今日快照（今日房況 + 今日統計）"""
+        result = self._fetch_today_status()
+        if result.get('success'):
+            self._today_status_snapshot = (time.time(), result)
+        
+        today_str = datetime.now().strftime('%Y-%m-%d')
+        self._refresh_days_stats([today_str], self.SNAPSHOT_TODAY_INTERVAL * 2)
+    
+    def refresh_future_snapshots(self):
+        """
+        刷新本月初（或本週一）到未來的每日快照
+        
+        已過日期算過一次就永久有效，之後每小時實際只查今日以後；
+        有區間查詢時刷新 SNAPSHOT_FUTURE_DAYS 天，逐日查詢時只刷新 SNAPSHOT_FUTURE_DAYS_PER_DAY 天。
+        """
+        today = datetime.now()
+        start = min(today.replace(day=1), today - timedelta(days=today.weekday()))
+        future_days = self.SNAPSHOT_FUTURE_DAYS if self._is_range_supported() else self.SNAPSHOT_FUTURE_DAYS_PER_DAY
+        end = today + timedelta(days=future_days)
+        date_strs = [(start + timedelta(days=i)).strftime('%Y-%m-%d')
+                     for i in range((end.date() - start.date()).days + 1)]
+        
+        refreshed = self._refresh_days_stats(date_strs, self.SNAPSHOT_FUTURE_INTERVAL * 2)
+        print(f"📸 每日住房快照已刷新: {refreshed} 天")
+    
+    def start_snapshot_refresher(self):
+        """啟動背景快照刷新執行緒（重複呼叫不會重複啟動）"""
+        if self._snapshot_thread and self._snapshot_thread.is_alive():
+            return
+        
+        def _loop():
+            last_future_refresh = 0
+            while True:
+                try:
+                    if time.time() - last_future_refresh >= self.SNAPSHOT_FUTURE_INTERVAL:
+                        self.refresh_future_snapshots()
+                        last_future_refresh = time.time()
+                    self.refresh_today_snapshot()
+                except Exception as e:
+                    print(f"⚠️ 快照刷新失敗: {e}")
+                time.sleep(self.SNAPSHOT_TODAY_INTERVAL)
+        
+        self._snapshot_thread = threading.Thread(target=_loop, name='report-snapshot', daemon=True)
+        self._snapshot_thread.start()
+        future_days = self.SNAPSHOT_FUTURE_DAYS if self._is_range_supported() else self.SNAPSHOT_FUTURE_DAYS_PER_DAY
+        print(f"📸 每日住房快照排程已啟動 (今日每 {self.SNAPSHOT_TODAY_INTERVAL // 60} 分鐘, "
+              f"未來 {future_days} 天每 {self.SNAPSHOT_FUTURE_INTERVAL // 60} 分鐘)")
+    
     def query_specific_date(self, date_str: str) -> dict:
         """
         查詢特定日期房況（詳細版）
@@ -275,7 +590,6 @@ class InternalQueryHandler:
             
             # 判斷是過去還是未來，決定用詞
             today = datetime.now().date()
-            is_past_or_today = target_date.date() <= today
             
             if target_date.date() < today:
                 time_label = "已住"
@@ -287,52 +601,23 @@ class InternalQueryHandler:
                 time_label = "預訂"
                 action_label = "預訂"
             
-            booking_count = 0
-            room_count = 0
-            room_type_stats = {}
-            source_stats = {}
-            
             try:
-                response = requests.get(
-                    f"{self.pms_api_url}/api/bookings/checkin-by-date",
-                    params={'date': date_str},
-                    timeout=5
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    bookings = data.get('data', [])
-                    booking_count = len(bookings)
-                    
-                    for b in bookings:
-                        room_numbers = b.get('room_numbers', [])
-                        rooms = len(room_numbers) if room_numbers else b.get('room_count', 1)
-                        room_count += rooms
-                        
-                        # 統計房型：過去/今日用實際房型，未來用訂單房型
-                        if is_past_or_today and room_numbers:
-                            # 已發生：用房號查實際房型
-                            actual_types = self._get_actual_room_type(room_numbers)
-                            for rt_name, count in actual_types.items():
-                                room_type_stats[rt_name] = room_type_stats.get(rt_name, 0) + count
-                        else:
-                            # 未發生：用訂單房型（計價房種）
-                            for room in b.get('rooms', []):
-                                rt_code = room.get('room_type_code', '').strip()
-                                rt_name = self._get_room_type_name(rt_code)
-                                room_type_stats[rt_name] = room_type_stats.get(rt_name, 0) + 1
-                        
-                        # 統計來源
-                        source = self._detect_booking_source(b)
-                        source_stats[source] = source_stats.get(source, 0) + 1
-                        
+                stats = self._get_day_stats(date_str)
             except Exception as e:
                 return {'success': False, 'message': f'❌ 查詢失敗: {str(e)}'}
             
+            booking_count = stats['booking_count']
+            room_count = stats['room_count']
+            room_type_stats = stats['room_types']
+            source_stats = stats['sources']
+            rate = stats.get('occupancy_rate', 0)
+            occupied_rooms = stats.get('occupied_rooms', 0)
+            
             # 組合訊息
             lines = [f"📊 {date_str} (週{weekday_name}) 【{time_label}】"]
             lines.append(f"━━━━━━━━━━━━━━━━━")
             lines.append(f"📈 {action_label}統計：{booking_count} 筆 / {room_count} 間")
+            lines.append(f"📊 住房率：{rate}% ({occupied_rooms}/{self.TOTAL_ROOMS})")
             
             if room_type_stats:
                 lines.append(f"\n🏨 房型分布：")
@@ -351,6 +636,7 @@ class InternalQueryHandler:
                 'date': date_str,
                 'room_types': room_type_stats,
                 'sources': source_stats,
+                'occupancy_rate': rate,
                 'message': '\n'.join(lines)
             }
             
@@ -386,46 +672,19 @@ class InternalQueryHandler:
                 dates = [today + timedelta(days=i) for i in range(days_to_sunday + 1)]
                 title = f"本週 ({today.strftime('%m/%d')}~{dates[-1].strftime('%m/%d')})"
             
-            # 調用 PMS API 取得各日入住數
+            # 取得各日統計（已過日期讀快取，其餘一次區間查詢）
             lines = [f"📅 {title} 入住預測：\n"]
             total_bookings = 0
             total_rooms = 0
+            stats_by_date = self._get_days_stats([d.strftime('%Y-%m-%d') for d in dates])
             
             for d in dates:
                 date_str = d.strftime('%Y-%m-%d')
                 weekday_name = ['一', '二', '三', '四', '五', '六', '日'][d.weekday()]
                 
-                # 計算相對天數（0=今天, 1=明天, ...）
-                days_offset = (d.date() - datetime.now().date()).days
-                
-                # 根據日期選擇 API
-                booking_count = 0
-                room_count = 0
-                
-                try:
-                    # 使用統一的 API 端點查詢任意日期
-                    response = requests.get(
-                        f"{self.pms_api_url}/api/bookings/checkin-by-date",
-                        params={'date': date_str},
-                        timeout=5
-                    )
-                    
-                    if response.status_code == 200:
-                        data = response.json()
-                        bookings = data.get('data', [])
-                        booking_count = len(bookings)
-                        # 加總每筆訂單的房間數（優先用 room_numbers 長度）
-                        for b in bookings:
-                            room_numbers = b.get('room_numbers', [])
-                            if room_numbers:
-                                # 已分房：用 room_numbers 長度
-                                room_count += len(room_numbers)
-                            else:
-                                # 未分房（未來日期）：用 rooms 陣列長度
-                                rooms = b.get('rooms', [])
-                                room_count += len(rooms) if rooms else 1
-                except Exception as e:
-                    print(f"⚠️ 查詢 {date_str} 失敗: {e}")
+                stats = stats_by_date.get(date_str) or {}
+                booking_count = stats.get('booking_count', 0)
+                room_count = stats.get('room_count', 0)
                 
                 total_bookings += booking_count
                 total_rooms += room_count
@@ -485,34 +744,16 @@ class InternalQueryHandler:
             future_lines = []
             today_line = None
             
+            # 已過日期的統計不會再變動，只需查詢今日以後的日期
+            stats_by_date = self._get_days_stats([d.strftime('%Y-%m-%d') for d in dates])
+            
             for d in dates:
                 date_str = d.strftime('%Y-%m-%d')
                 weekday_name = ['一', '二', '三', '四', '五', '六', '日'][d.weekday()]
                 
-                booking_count = 0
-                room_count = 0
-                
-                try:
-                    # 使用統一的 API 端點查詢任意日期
-                    response = requests.get(
-                        f"{self.pms_api_url}/api/bookings/checkin-by-date",
-                        params={'date': date_str},
-                        timeout=5
-                    )
-                    
-                    if response.status_code == 200:
-                        data = response.json()
-                        bookings = data.get('data', [])
-                        booking_count = len(bookings)
-                        for b in bookings:
-                            room_numbers = b.get('room_numbers', [])
-                            if room_numbers:
-                                room_count += len(room_numbers)
-                            else:
-                                rooms_list = b.get('rooms', [])
-                                room_count += len(rooms_list) if rooms_list else 1
-                except Exception as e:
-                    print(f"⚠️ 查詢 {date_str} 失敗: {e}")
+                stats = stats_by_date.get(date_str) or {}
+                booking_count = stats.get('booking_count', 0)
+                room_count = stats.get('room_count', 0)
                 
                 total_bookings += booking_count
                 total_rooms += room_count
@@ -8,12 +8,14 @@ from datetime import datetime
 from typing import Optional, Dict, Any, List
 from .base_handler import BaseHandler
 from helpers.order_helper import (
-    ROOM_TYPES, normalize_phone, clean_ota_id, 
+    normalize_phone, clean_ota_id, 
     detect_booking_source, get_breakfast_info, get_resume_message,
     sync_order_details, validate_arrival_time, is_vague_time,
     format_order_display
 )
 from helpers.intent_detector import IntentDetector
+from helpers.slot_extractor import extract_slots
+from helpers.room_catalog import get_room_catalog
 
 
 class OrderQueryHandler(BaseHandler):
@@ -45,9 +47,6 @@ class OrderQueryHandler(BaseHandler):
         self.gmail_helper = gmail_helper
         self.logger = logger
         self.state_machine = state_machine  # 新增：注入狀態機
-        
-        # 房型對照表 (已遷移至 order_helper.ROOM_TYPES)
-        self.room_types = ROOM_TYPES 
     
     def is_active(self, user_id: str) -> bool:
         """檢查用戶是否在訂單查詢流程中"""
@@ -126,8 +125,7 @@ class OrderQueryHandler(BaseHandler):
 
     def _is_booking_intent(self, message: str) -> bool:
         """偵測加訂意圖"""
-        keywords = ['加訂', '加定', '多訂', '再訂', '多一間', '再一間']
-        return any(kw in message for kw in keywords)
+        return IntentDetector.analyze(message).has('add_booking')
     
     def _extract_order_number(self, message: str) -> Optional[str]:
         """從訊息中提取訂單編號 (已套用 OTA 清理)"""
@@ -174,7 +172,12 @@ class OrderQueryHandler(BaseHandler):
                     'line_user_id': user_id,
                     'line_display_name': display_name
                 }
-                self.logger.save_order(basic_order)
+                # 已有記錄時只合併基本欄位，保留先前收集的電話、抵達時間、特殊需求
+                self.logger.update_order(
+                    order_id,
+                    lambda existing: {**existing, **{k: v for k, v in basic_order.items() if v is not None}},
+                    create=True
+                )
                 print(f"📝 已建立訂單基本記錄: {order_id}")
             
             # 格式化訂單資訊
@@ -239,9 +242,8 @@ class OrderQueryHandler(BaseHandler):
                     room_code = (room.get('room_type_code') or room.get('ROOM_TYPE_CODE') or '').strip()
                     room_count = room.get('room_count') or room.get('ROOM_COUNT') or 1
                     
-                    # 獲取中文名稱 (從 SSOT 常數獲取)
-                    room_meta = self.room_types.get(room_code, {})
-                    room_name_zh = room_meta.get('zh', room_code)
+                    # 獲取中文名稱 (SSOT：房型目錄)
+                    room_name_zh = get_room_catalog().get_type_name(room_code, room_code)
                     
                     # 累加相同房型的數量
                     if room_name_zh in room_count_dict:
@@ -573,33 +575,12 @@ class OrderQueryHandler(BaseHandler):
         return response
     
     def _extract_phone(self, message: str) -> Optional[str]:
-        """提取電話號碼"""
-        # 移除空白和連字符
-        clean = message.replace(' ', '').replace('-', '')
-        
-        # 台灣手機號碼 (09開頭10位)
-        match = re.search(r'(09\d{8})', clean)
-        if match:
-            return match.group(1)
-        
-        # 其他數字（至少8位）
-        match = re.search(r'(\d{8,})', clean)
-        if match:
-            return match.group(1)
-        
-        return None
+        """提取電話號碼（09 開頭手機優先，其次 8 位以上數字）"""
+        return extract_slots(message).loose_phone
     
     def _is_vague_time(self, time_str: str) -> bool:
-        """檢查時間是否模糊"""
-        vague_keywords = ['下午', '晚上', '傍晚', '中午', '早上', '上午']
-        specific_patterns = [r'\d{1,2}[點:：時]', r'\d{1,2}pm', r'\d{1,2}am']
-        
-        # 如果有具體數字時間，不是模糊的
-        if any(re.search(p, time_str) for p in specific_patterns):
-            return False
-        
-        # 如果只有時段關鍵字，是模糊的
-        return any(kw in time_str for kw in vague_keywords)
+        """檢查時間是否模糊（只有時段，沒有具體幾點）"""
+        return extract_slots(time_str).arrival_vague
     
     def _save_guest_info(self, user_id: str, info_type: str, content: str):
         """儲存客人資訊到資料庫"""
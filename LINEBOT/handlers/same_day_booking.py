@@ -5,12 +5,15 @@
 
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
-import json
-import os
+
+from order_store import get_order_store
 
 # 引入共用 Helper
 from helpers.intent_detector import IntentDetector
 from helpers.order_helper import validate_arrival_time, is_vague_time
+from helpers.slot_extractor import extract_slots
+from helpers.room_catalog import get_room_catalog
+from helpers.session_sweeper import get_session_sweeper
 
 
 class SameDayBookingHandler:
@@ -27,33 +30,9 @@ class SameDayBookingHandler:
         {'code': 'SQ', 'name': '標準四人房', 'price': 4200, 'beds': ['兩大床', '四小床'], 'capacity': 4}
     ]
     
-    # 可升等的房型（依容納人數分類，VIP/家庭房/無障礙房不可升等）
-    UPGRADABLE_ROOMS = {
-        2: ['SD', 'CD', 'DD', 'ED', 'WD'],   # 雙人房可用（排除 AD 無障礙）
-        3: ['ST', 'SQ', 'CQ', 'WQ'],          # 三人房可用三人/四人房（排除 AQ 無障礙）
-        4: ['SQ', 'CQ', 'WQ']                 # 四人房可用（排除 AQ 無障礙）
-    }
-    
-    # 無障礙房型（需特別告知）
-    ACCESSIBLE_ROOMS = ['AD', 'AQ']
-    
-    # 完整房型對照表
-    ROOM_TYPE_MAP = {
-        'SD': '標準雙人房',
-        'ST': '標準三人房', 
-        'SQ': '標準四人房',
-        'CD': '經典雙人房',
-        'CQ': '經典四人房',
-        'DD': '豪華雙人房',
-        'ED': '行政雙人房',
-        'WD': '海景雙人房',
-        'WQ': '海景四人房',
-        'VD': 'VIP雙人房',
-        'VQ': 'VIP四人房',
-        'FM': '親子家庭房',
-        'AD': '無障礙雙人房',
-        'AQ': '無障礙四人房'
-    }
+    # 房型目錄 (data/room_catalog.json)：可升等矩陣（get_upgradable_codes）、無障礙房型（accessible）
+    # 可升等的房型依容納人數分類（VIP/家庭房/無障礙房不可升等）；目錄重新載入時索引會整個換掉，每次從目錄讀取
+    room_catalog = get_room_catalog()
     
     def __init__(self, pms_client, state_machine):
         """
@@ -66,11 +45,19 @@ class SameDayBookingHandler:
         self.pms_client = pms_client
         self.state_machine = state_machine  # 注入狀態機
         self.user_sessions = {}  # 暫時保留，用於業務資料
+        # 閒置超過狀態機 session 超時的預訂資料從記憶體移除
+        self._session_tracker = get_session_sweeper().register(
+            'SameDayBookingHandler.user_sessions', self.user_sessions,
+            self.state_machine.SESSION_TIMEOUT_SECONDS if self.state_machine else 2 * 60 * 60
+        )
     
     def get_session(self, user_id: str) -> Dict[str, Any]:
         """取得或建立用戶對話 session"""
-        if user_id not in self.user_sessions:
-            self.user_sessions[user_id] = {
+        # 先 touch 再取用，避免 sweeper 在兩步之間移除
+        self._session_tracker.touch(user_id)
+        session = self.user_sessions.get(user_id)
+        if session is None:
+            session = self.user_sessions.setdefault(user_id, {
                 'state': 'idle',  # 使用字串常量而非 self.STATE_IDLE
                 'available_rooms': [],
                 'selected_room': None,
@@ -84,8 +71,8 @@ class SameDayBookingHandler:
                 'multi_room_orders': [],
                 'is_multi_room': False,
                 'created_at': datetime.now().isoformat()
-            }
-        return self.user_sessions[user_id]
+            })
+        return session
     
     def clear_session(self, user_id: str, save_interrupted: bool = False):
         """
@@ -95,14 +82,13 @@ class SameDayBookingHandler:
             user_id: LINE 用戶 ID
             save_interrupted: 是否保存中斷資訊到 Dashboard
         """
-        if user_id in self.user_sessions:
-            session = self.user_sessions[user_id]
-            
-            # 如果已選擇房型但未完成預訂，保存為中斷狀態
-            if save_interrupted and session.get('selected_room') and session.get('state') != self.STATE_IDLE:
-                self._save_interrupted_booking(user_id, session)
-            
-            del self.user_sessions[user_id]
+        session = self.user_sessions.pop(user_id, None)
+        if session is None:
+            return
+        
+        # 如果已選擇房型但未完成預訂，保存為中斷狀態
+        if save_interrupted and session.get('selected_room') and session.get('state') != self.STATE_IDLE:
+            self._save_interrupted_booking(user_id, session)
     
     def _save_interrupted_booking(self, user_id: str, session: Dict):
         """保存中斷的預訂資訊到 Dashboard"""
@@ -142,24 +128,9 @@ class SameDayBookingHandler:
         Returns:
             True 如果是訂房意圖
         """
+        intent = IntentDetector.analyze(message)
         # 排除：查詢訂單的關鍵字
-        exclude_keywords = [
-            '我有訂房', '我訂了', '已經訂',
-            '確認訂單', '查訂單', '查詢訂單',
-            '我的訂單', '訂單查詢'
-        ]
-        
-        if any(kw in message.lower() for kw in exclude_keywords):
-            return False
-        
-        booking_keywords = [
-            '訂房', '預訂', '訂', '住', '入住', 
-            '有房', '還有房', '空房', '房間',
-            '想住', '要住', '可以住'
-        ]
-        
-        message_lower = message.lower()
-        return any(kw in message_lower for kw in booking_keywords)
+        return intent.has('booking_general') and not intent.has('booking_general_exclude')
     
     def is_same_day_intent(self, message: str) -> bool:
         """
@@ -171,20 +142,9 @@ class SameDayBookingHandler:
         Returns:
             True 如果是當日預訂意圖
         """
-        keywords = [
-            '今天', '今日', '當天', '當日',
-            '現在', '馬上', '立刻', '等下', '等一下',
-            '晚上', '今晚', '下午', '傍晚'
-        ]
-        booking_keywords = ['訂房', '預訂', '訂', '住', '入住', '有房', '還有房']
-        
-        message_lower = message.lower()
-        
+        intent = IntentDetector.analyze(message)
         # 檢查是否包含時間關鍵字 + 預訂關鍵字
-        has_time = any(kw in message_lower for kw in keywords)
-        has_booking = any(kw in message_lower for kw in booking_keywords)
-        
-        return has_time and has_booking
+        return intent.has('same_day_time') and intent.has('same_day_booking')
     
     def is_cancel_intent(self, message: str) -> bool:
         """
@@ -196,12 +156,7 @@ class SameDayBookingHandler:
         Returns:
             True 如果是取消意圖
         """
-        cancel_keywords = [
-            '取消訂單', '取消預訂', '不住了', '不要了',
-            '不來了', '取消了', '我要取消', '幫我取消',
-            '想取消', '需要取消'
-        ]
-        return any(kw in message for kw in cancel_keywords)
+        return IntentDetector.analyze(message).has('cancel_order')
     
     def _is_interrupt_intent(self, message: str) -> bool:
         """
@@ -213,13 +168,7 @@ class SameDayBookingHandler:
         Returns:
             True 如果用戶想中斷
         """
-        interrupt_keywords = [
-            '不用了', '算了', '先不用', '我再想想',
-            '下次', '改天', '等等', '稍後', '晚點',
-            '謝謝', '謝謝你', '好的謝謝', '感謝',
-            '不需要', '暫時不用', '先這樣'
-        ]
-        return any(kw in message for kw in interrupt_keywords)
+        return IntentDetector.analyze(message).has('booking_interrupt')
     
     def is_within_booking_hours(self) -> bool:
         """
@@ -231,17 +180,19 @@ class SameDayBookingHandler:
         now = datetime.now()
         return now.hour < 22
     
-    def _is_invalid_arrival_time(self, arrival_time: str) -> bool:
+    def _is_invalid_arrival_time(self, arrival_time: str, arrival_hhmm: Optional[str] = None,
+                                 arrival_period: Optional[str] = None) -> bool:
         """
-        檢查抵達時間是否無效（超過晚上10點或已過的時間）
+        檢查抵達時間是否無效（晚上10點以後或已過的時間）
         
         Args:
             arrival_time: 客人輸入的抵達時間字串
+            arrival_hhmm: 解析時存下的 24 小時制時間（slot_extractor）
+            arrival_period: 解析時存下的時段詞（下午、晚上…）
             
         Returns:
             True 如果時間無效
         """
-        import re
         from datetime import datetime
         
         current_hour = datetime.now().hour
@@ -251,61 +202,32 @@ class SameDayBookingHandler:
         if any(kw in arrival_time for kw in tomorrow_keywords):
             return True
         
-        # 特殊格式：馬上到、等等到、X分鐘後 都視為有效
-        if any(kw in arrival_time for kw in ['馬上', '等等', '現在', '待會', '分鐘後']):
-            # 但如果已經超過晚上10點，則無效
-            if current_hour >= 22:
-                return True
-            return False
+        # 舊 session 沒有存解析結果時才重新解析
+        if arrival_hhmm is None:
+            slots = extract_slots(arrival_time)
+            if slots.arrival_relative:
+                # 馬上到、等等到、X分鐘後 都視為有效，但已經超過晚上10點則無效
+                return current_hour >= 22
+            arrival_hhmm, arrival_period = slots.arrival_hhmm, slots.arrival_period
         
-        # 嘗試解析小時
-        hour_match = re.search(r'(\d{1,2})', arrival_time)
-        if not hour_match:
-            return False  # 無法解析，交給人工處理
-        
-        hour = int(hour_match.group(1))
-        
-        # 判斷上午/下午/晚上
-        if '晚上' in arrival_time or '晚間' in arrival_time:
-            # 晚上格式：晚上7點=19:00, 晚上10點=22:00
-            if hour >= 10:  # 晚上10點以後無效
-                return True
-        elif '下午' in arrival_time or '傍晚' in arrival_time:
-            # 下午轉為24小時制
-            if hour < 12:
-                hour += 12
-            if hour >= 22:
-                return True
-        elif '上午' in arrival_time or '早上' in arrival_time:
-            # 如果已經過了上午時間，則無效
-            if hour < current_hour:
-                return True
-            return False
-        elif '中午' in arrival_time:
-            if current_hour > 13:  # 已經過了中午
-                return True
-            return False
-        else:
-            # 沒有前綴，根據當前時間智能判斷
-            # 原則：客人說的時間一定是「未來的時間」
-            
-            # 24小時制：22-23 和 0-5 無效（太晚或凌晨）
-            if hour >= 22 or hour == 0:
-                return True
-            if 1 <= hour <= 5:
-                return True
-            
-            # 智能判斷：如果說的時間早於現在，可能是指下午/晚上
-            # 例如：現在11點，客人說6點 -> 應該是下午6點(18:00)
-            if hour < current_hour:
-                # 檢查加12小時後是否有效（不超過22點）
-                adjusted_hour = hour + 12
-                if adjusted_hour >= 22:
-                    return True  # 太晚了
-                # 否則視為有效（會智能理解為下午）
-                return False
-            
-            # 時間在當前時間之後，直接有效
+        if not arrival_hhmm:
+            return False  # 相對 / 模糊時間或無法解析，交給後續追問或人工處理
+        
+        hour = int(arrival_hhmm[:2])
+        
+        # 有時段或 24 小時制（下午3點、晚上12點=00:00、15:00）：時間已確定
+        if arrival_period or hour >= 12:
+            # 晚上10點以後、午夜後無效；早於現在的整點也無效
+            return hour >= 22 or hour < 6 or hour < current_hour
+        
+        # 沒有時段的 12 小時制，根據當前時間智能判斷
+        # 原則：客人說的時間一定是「未來的時間」
+        if hour == 0 or 1 <= hour <= 5:
+            return True  # 凌晨
+        
+        # 例如：現在11點，客人說6點 -> 應該是下午6點(18:00)
+        if hour < current_hour:
+            return hour + 12 >= 22 or hour + 12 < current_hour
         
         return False
     
@@ -319,24 +241,12 @@ class SameDayBookingHandler:
         Returns:
             True 如果時間模糊需要再確認
         """
-        import re
-        
-        # 如果只有時段詞，沒有具體數字，就是模糊的
-        vague_only_keywords = ['傍晚', '中午', '下午', '晚上', '早上', '上午']
-        
-        # 檢查是否有數字
-        has_number = bool(re.search(r'\d', arrival_time))
-        
-        if not has_number:
-            # 沒有數字，只有時段詞，需要確認
-            return any(kw in arrival_time for kw in vague_only_keywords)
-        
-        return False
+        # 只有時段詞，沒有具體時間，就是模糊的
+        return extract_slots(arrival_time).arrival_vague
 
     def _is_query_intent(self, message: str) -> bool:
         """偵測查詢意圖"""
-        keywords = ['查訂單', '查詢訂單', '我有訂房', '確認訂單', '我的訂單', '我訂了', '已經訂']
-        return any(kw in message for kw in keywords)
+        return IntentDetector.analyze(message).has('booking_query')
     
     def handle_message(self, user_id: str, message: str, display_name: str = None) -> Optional[str]:
         """
@@ -589,7 +499,7 @@ class SameDayBookingHandler:
         for room in self.AVAILABLE_ROOMS:
             capacity = room['capacity']
             # 檢查該房型（含可升等房型）的庫存
-            upgradable_codes = self.UPGRADABLE_ROOMS.get(capacity, [room['code']])
+            upgradable_codes = self.room_catalog.get_upgradable_codes(capacity, [room['code']])
             total_stock = sum(api_available.get(code, 0) for code in upgradable_codes)
             
             if total_stock <= 0:
@@ -683,53 +593,9 @@ class SameDayBookingHandler:
         Returns:
             list of {'room': room_dict, 'count': int} or None
         """
-        import re
-        
-        # 中文數字對照
-        chinese_numbers = {
-            '一': 1, '二': 2, '兩': 2, '三': 3, '四': 4, '五': 5,
-            '六': 6, '七': 7, '八': 8, '九': 9, '十': 10
-        }
-        
-        # 房型關鍵字對照
-        room_keywords = {
-            '雙人': 2,
-            '雙人房': 2,
-            '兩人': 2,
-            '2人': 2,
-            '三人': 3,
-            '三人房': 3,
-            '3人': 3,
-            '四人': 4,
-            '四人房': 4,
-            '4人': 4,
-        }
-        
-        # 嘗試匹配 「數量+間+房型」 模式，支援阿拉伯數字和中文數字
-        # 匹配：1間雙人、兩間雙人、2雙人房 等
-        pattern = r'([一二兩三四五六七八九十\d]+)\s*間?\s*(雙人房?|兩人|2人|三人房?|3人|四人房?|4人)'
-        matches = re.findall(pattern, message)
-        
-        if not matches:
-            return None
-        
+        # 「數量+間+房型」由 slot_extractor 解析（支援阿拉伯數字、中文數字與全形數字）
         results = []
-        for count_str, room_type in matches:
-            # 解析數量（支援中文數字）
-            if count_str in chinese_numbers:
-                count = chinese_numbers[count_str]
-            elif count_str.isdigit():
-                count = int(count_str)
-            else:
-                continue
-                
-            if count <= 0:
-                continue
-                
-            capacity = room_keywords.get(room_type)
-            if not capacity:
-                continue
-            
+        for capacity, count in extract_slots(message).rooms:
             # 找到對應的房型
             for room in self.AVAILABLE_ROOMS:
                 if room['capacity'] == capacity:
@@ -773,7 +639,7 @@ class SameDayBookingHandler:
             
             # 取得該房型可升等的總庫存
             capacity = room['capacity']
-            upgradable_codes = self.UPGRADABLE_ROOMS.get(capacity, [room_code])
+            upgradable_codes = self.room_catalog.get_upgradable_codes(capacity, [room_code])
             total_available = sum(availability.get(code, 0) for code in upgradable_codes)
             
             if total_available < count:
@@ -819,15 +685,11 @@ class SameDayBookingHandler:
     
     def _handle_count_collection(self, user_id: str, session: Dict, message: str) -> str:
         """處理房間數量收集"""
-        message_clean = message.strip()
-        
-        # 解析數量
-        import re
-        count_match = re.search(r'(\d+)', message_clean)
-        if not count_match:
+        # 解析數量（支援「2」「兩間」）
+        room_count = extract_slots(message).room_count
+        if room_count is None:
             return "請輸入數字，例如：1"
         
-        room_count = int(count_match.group(1))
         if room_count <= 0:
             return "房間數量需大於 0，請重新輸入。"
         
@@ -897,12 +759,13 @@ class SameDayBookingHandler:
         available_rooms = result.get('data', {}).get('available_room_types', [])
         
         # 取得可升等的房型列表
-        upgradable_codes = self.UPGRADABLE_ROOMS.get(capacity, [])
+        upgradable_codes = self.room_catalog.get_upgradable_codes(capacity)
         
         # 計算總可用數量（館內＋網路）
         total_available = 0
         accessible_only = True  # 是否只剩無障礙房
         available_types = []    # 可用的房型列表
+        accessible_codes = self.room_catalog.accessible
         
         for room in available_rooms:
             room_code = room.get('room_type_code')
@@ -911,7 +774,7 @@ class SameDayBookingHandler:
                 if count > 0:
                     total_available += count
                     available_types.append(room_code)
-                    if room_code not in self.ACCESSIBLE_ROOMS:
+                    if room_code not in accessible_codes:
                         accessible_only = False
         
         # 檢查庫存
@@ -921,7 +784,7 @@ class SameDayBookingHandler:
             
             # 如果只剩無障礙房，需要告知
             accessible_notice = ""
-            if accessible_only and any(code in self.ACCESSIBLE_ROOMS for code in available_types):
+            if accessible_only and any(code in accessible_codes for code in available_types):
                 accessible_notice = "\n\n⚠️ 目前僅剩無障礙房型，此房型只有淋浴間為無障礙設計，其餘房內設施與一般房間相同。"
             
             # 進入特殊需求詢問狀態
@@ -1079,19 +942,16 @@ class SameDayBookingHandler:
     
     def _handle_info_collection(self, user_id: str, session: Dict, message: str) -> str:
         """收集客人資訊"""
-        import re
-        
-        # 清理訊息
-        clean_message = message.replace('-', '').replace(' ', '')
+        # 電話、抵達時間、姓名一次解析（slot_extractor）
+        slots = extract_slots(message)
         
         # 1. 嘗試解析電話
-        # 先找所有數字開頭的疑似電話（至少 8 位數）
-        all_digits_match = re.search(r'(0\d{7,14})', clean_message)
-        if all_digits_match and not session.get('phone'):
-            potential_phone = all_digits_match.group(1)
+        # 先找所有數字開頭的疑似電話（0 開頭，至少 8 位數）
+        if slots.phone_candidate and not session.get('phone'):
+            potential_phone = slots.phone_candidate
             
             # 檢查是否為標準台灣手機格式（09 開頭 10 位）
-            if re.match(r'^09\d{8}$', potential_phone):
+            if slots.is_mobile_candidate:
                 # 正確格式
                 session['phone'] = potential_phone
             elif potential_phone.startswith('09') and len(potential_phone) != 10:
@@ -1101,39 +961,19 @@ class SameDayBookingHandler:
                 # 其他格式（市話或可能打錯），暫存等待確認
                 session['pending_phone'] = potential_phone
         
-        # 2. 嘗試解析抵達時間（更寬鬆的格式）
-        if not session.get('arrival_time'):
-            time_patterns = [
-                r'(下午\d+點?半?)', r'(晚上\d+點?半?)', r'(傍晚\d+點?半?)', 
-                r'(上午\d+點?半?)', r'(中午\d*點?半?)',
-                r'(\d{1,2}[點:：時]\d{0,2})',  # 3點、15:00
-                r'(\d{1,2}點半?)',  # 5點、5點半
-                r'(\d+分鐘後[到來]?)',  # 10分鐘後到、5分鐘後
-                r'(馬上[到來]?)', r'(等等[到來]?)', r'(現在)', r'(待會[兒]?[到來]?)',
-            ]
-            for pattern in time_patterns:
-                time_match = re.search(pattern, message)
-                if time_match:
-                    session['arrival_time'] = time_match.group(1)
-                    break
+        # 2. 嘗試解析抵達時間（具體時間、相對時間如「馬上到」、或只有時段）
+        # 先前只說了時段（例如「下午」），這次提供幾點時以新的時間取代
+        current_time = session.get('arrival_time')
+        if slots.arrival_time and (not current_time or
+                                   (self._is_vague_arrival_time(current_time) and not slots.arrival_vague)):
+            session['arrival_time'] = slots.arrival_time
+            # 存下解析結果，之後驗證時不必再解析原文
+            session['arrival_hhmm'] = slots.arrival_hhmm
+            session['arrival_period'] = slots.arrival_period
         
-        # 3. 嘗試解析姓名
-        if not session.get('guest_name'):
-            remaining = message
-            if all_digits_match:
-                remaining = remaining.replace(all_digits_match.group(0), '')
-            if session.get('arrival_time'):
-                remaining = remaining.replace(session['arrival_time'], '')
-            
-            # 清理標點後提取姓名
-            remaining = re.sub(r'[,，、。！？\s]', '', remaining)
-            name_match = re.search(r'([一-龥A-Za-z]{2,10})', remaining)
-            if name_match:
-                potential_name = name_match.group(1)
-                # 排除非姓名詞
-                exclude_words = ['晚上', '下午', '傍晚', '上午', '中午', '點', '間', '房', '好了', '可以', '沒問題']
-                if not any(word in potential_name for word in exclude_words):
-                    session['guest_name'] = potential_name
+        # 3. 嘗試解析姓名（已排除電話、時間與非姓名詞）
+        if not session.get('guest_name') and slots.guest_name:
+            session['guest_name'] = slots.guest_name
         
         # 4. 檢查是否有待確認的電話
         if session.get('pending_phone') and not session.get('phone'):
@@ -1175,7 +1015,8 @@ class SameDayBookingHandler:
         
         # 5. 驗證抵達時間是否有效
         arrival_time = session.get('arrival_time', '')
-        if self._is_invalid_arrival_time(arrival_time):
+        if self._is_invalid_arrival_time(arrival_time, session.get('arrival_hhmm'),
+                                         session.get('arrival_period')):
             self.clear_session(user_id)
             return """抱歉，當日預訂僅接受今日晚上 10 點前抵達的訂單。
 
@@ -1333,7 +1174,7 @@ class SameDayBookingHandler:
         room_name = room.get('name')
         bed_info = f" - {session.get('bed_type')}" if session.get('bed_type') else ""
         
-        # 寫入 guest_orders.json
+        # 寫入訂單資料庫
         self._save_to_guest_orders(
             order_id=order_id,
             user_id=user_id,
@@ -1414,7 +1255,7 @@ class SameDayBookingHandler:
                 order_id = result.get('data', {}).get('temp_order_id', '未知')
                 created_orders.append(order_id)
                 
-                # 寫入 guest_orders.json
+                # 寫入訂單資料庫
                 self._save_to_guest_orders(
                     order_id=order_id,
                     user_id=user_id,
@@ -1464,17 +1305,8 @@ class SameDayBookingHandler:
     
     def _save_to_guest_orders(self, order_id: str, user_id: str, session: Dict, 
                                room: Dict, check_in: str, check_out: str):
-        """將當日預訂寫入 guest_orders.json"""
+        """將當日預訂寫入訂單資料庫（data/chat_logs/guest_orders.db）"""
         try:
-            # 檔案路徑（從 handlers/ 跳兩層到 LINEBOT/，再到 data/chat_logs/）
-            orders_file = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'chat_logs', 'guest_orders.json')
-            
-            # 讀取現有資料
-            orders = {}
-            if os.path.exists(orders_file):
-                with open(orders_file, 'r', encoding='utf-8') as f:
-                    orders = json.load(f)
-            
             # 建立訂單記錄
             now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             room_code = room.get('code', 'SD')
@@ -1507,16 +1339,13 @@ class SameDayBookingHandler:
             # 清除 None 值
             order_data['special_requests'] = [r for r in order_data['special_requests'] if r]
             
-            # 寫入
-            orders[order_id] = order_data
-            
-            with open(orders_file, 'w', encoding='utf-8') as f:
-                json.dump(orders, f, ensure_ascii=False, indent=2)
+            # 寫入（只寫入這一筆訂單）
+            get_order_store().upsert(order_data)
             
-            print(f"✅ 已寫入 guest_orders.json: {order_id}")
+            print(f"✅ 已寫入訂單資料庫: {order_id}")
             
         except Exception as e:
-            print(f"⚠️ 寫入 guest_orders.json 失敗: {e}")
+            print(f"⚠️ 寫入訂單資料庫失敗: {e}")
     
     def is_in_booking_flow(self, user_id: str) -> bool:
         """
@@ -1528,6 +1357,8 @@ class SameDayBookingHandler:
         Returns:
             True 如果用戶正在進行當日預訂
         """
+        # 每則訊息都會經過這裡，touch 讓進行中的預訂不會在處理前被清除
+        self._session_tracker.touch(user_id)
         session = self.user_sessions.get(user_id)
         if not session:
             return False
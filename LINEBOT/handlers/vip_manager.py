@@ -3,13 +3,31 @@ VIP 用戶管理模組
 雙層架構：
 - guest: 客人 VIP（後台標籤識別）
 - internal: 內部 VIP（董事長/管理層/員工，可存取完整功能）
+
+快取策略：
+- 啟動時以 GET /api/vip 一次取回完整 VIP 名單，之後背景定期刷新
+- 名單另存一份，有效期間直接以名單回答（名單內即 VIP、不在名單內即非 VIP），
+  不受單一用戶快取 TTL 影響，也不再逐一呼叫 API
+- 名單失效時改逐一查詢，單一用戶結果有 TTL 與數量上限（LRU），降級 / 移除標籤最晚 TTL 後生效
+- 後台修改 VIP 標籤時呼叫 invalidate()（/vip/invalidate），立即生效
 """
 
 import requests
 import os
+import json
+import time
+import threading
+from collections import OrderedDict
 
 class VIPManager:
     """VIP 用戶管理器"""
+
+    # 單一用戶快取有效時間（秒）
+    CACHE_TTL_SECONDS = 5 * 60
+    # 快取最多保留的用戶數（超過時淘汰最久未使用）
+    CACHE_MAX_SIZE = 5000
+    # 完整名單背景刷新間隔（秒）
+    ROSTER_REFRESH_SECONDS = 5 * 60
     
     def __init__(self, backend_url: str = None):
         """
@@ -19,7 +37,11 @@ class VIPManager:
             backend_url: Backend API URL，預設從環境變數讀取
         """
         self.backend_url = backend_url or os.getenv('KTW_BACKEND_URL', 'http://localhost:3000')
-        self._cache = {}  # 簡單快取，減少 API 呼叫
+        self._cache = OrderedDict()  # user_id → (快取時間, VIP 資訊)
+        self._roster = {}  # 完整名單：user_id → VIP 資訊（名單有效期間使用）
+        self._lock = threading.Lock()
+        self._roster_loaded_at = 0.0  # 完整名單最後載入時間（0 = 尚未載入）
+        self._refresh_thread = None
     
     def get_vip_info(self, user_id: str) -> dict:
         """
@@ -31,10 +53,28 @@ class VIPManager:
         Returns:
             dict: VIP 資訊，包含 is_vip, vip_type, is_internal 等欄位
         """
+        now = time.time()
+
         # 檢查快取
-        if user_id in self._cache:
-            return self._cache[user_id]
-        
+        with self._lock:
+            cached = self._cache.get(user_id)
+            if cached and now - cached[0] < self.CACHE_TTL_SECONDS:
+                self._cache.move_to_end(user_id)
+                return cached[1]
+
+            # 完整名單仍有效：以名單回答，不在名單內即非 VIP，不必再查 API
+            if self._is_roster_fresh(now):
+                return self._roster.get(user_id) or self._default_result()
+
+        result = self._fetch_vip_info(user_id)
+        if result is not None:
+            with self._lock:
+                self._store(user_id, result, time.time())
+            return result
+        return self._default_result()
+
+    def _fetch_vip_info(self, user_id: str):
+        """呼叫 GET /api/vip/{user_id} 查詢單一用戶，失敗返回 None（不快取）"""
         try:
             response = requests.get(
                 f"{self.backend_url}/api/vip/{user_id}",
@@ -43,24 +83,113 @@ class VIPManager:
             
             if response.status_code == 200:
                 data = response.json()
-                result = {
-                    'is_vip': data.get('is_vip', False),
-                    'vip_type': data.get('vip_type'),  # 'guest' | 'internal' | None
-                    'is_internal': data.get('is_internal', False),
-                    'vip_level': data.get('data', {}).get('vip_level', 0) if data.get('data') else 0,
-                    'role': data.get('data', {}).get('role') if data.get('data') else None,
-                    'display_name': data.get('data', {}).get('display_name') if data.get('data') else None,
-                    'permissions': data.get('data', {}).get('permissions', []) if data.get('data') else []
-                }
-                # 快取結果（5 分鐘過期由外部處理）
-                self._cache[user_id] = result
-                return result
-            else:
+                if data.get('data'):
+                    return self._parse_vip_row(data['data'])
                 return self._default_result()
+            return None
                 
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, ValueError) as e:
             print(f"⚠️ VIP 查詢失敗: {e}")
-            return self._default_result()
+            return None
+
+    def _parse_vip_row(self, row: dict) -> dict:
+        """將後台 vip_users 資料列轉為 VIP 資訊"""
+        permissions = row.get('permissions') or []
+        if isinstance(permissions, str):
+            # GET /api/vip 名單中的 permissions 為未解析的 JSON 字串
+            try:
+                permissions = json.loads(permissions)
+            except json.JSONDecodeError:
+                permissions = []
+
+        vip_type = row.get('vip_type')
+        return {
+            'is_vip': True,
+            'vip_type': vip_type,  # 'guest' | 'internal'
+            'is_internal': vip_type == 'internal',
+            'vip_level': row.get('vip_level') or 0,
+            'role': row.get('role'),
+            'display_name': row.get('display_name'),
+            'permissions': permissions
+        }
+
+    def _store(self, user_id: str, result: dict, now: float):
+        """寫入快取並淘汰超出上限的項目（呼叫端需持有 lock）"""
+        self._cache[user_id] = (now, result)
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.CACHE_MAX_SIZE:
+            self._cache.popitem(last=False)
+
+    def _is_roster_fresh(self, now: float) -> bool:
+        """完整名單是否仍可作為「非 VIP」判定依據（容許一次刷新失敗）"""
+        return bool(self._roster_loaded_at) and now - self._roster_loaded_at < self.ROSTER_REFRESH_SECONDS * 2
+
+    def prefetch_all(self) -> bool:
+        """
+        一次取回完整 VIP 名單並取代目前名單
+
+        Returns:
+            bool: 是否成功載入
+        """
+        try:
+            response = requests.get(f"{self.backend_url}/api/vip", timeout=5)
+            if response.status_code != 200:
+                print(f"⚠️ VIP 名單載入失敗: HTTP {response.status_code}")
+                return False
+            rows = response.json().get('data') or []
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"⚠️ VIP 名單載入失敗: {e}")
+            return False
+
+        now = time.time()
+        roster = {row['line_user_id']: self._parse_vip_row(row) for row in rows if row.get('line_user_id')}
+        with self._lock:
+            # 名單即完整真相：整批取代，被移除的 VIP 也會一併失效
+            self._cache.clear()
+            self._roster = roster
+            self._roster_loaded_at = now
+
+        print(f"⭐ VIP 名單已載入: {len(roster)} 位")
+        return True
+
+    def start_refresher(self):
+        """啟動背景執行緒：立即載入完整名單，之後每 ROSTER_REFRESH_SECONDS 刷新"""
+        if self._refresh_thread and self._refresh_thread.is_alive():
+            return
+
+        def _loop():
+            while True:
+                self.prefetch_all()
+                time.sleep(self.ROSTER_REFRESH_SECONDS)
+
+        self._refresh_thread = threading.Thread(target=_loop, name='vip-roster', daemon=True)
+        self._refresh_thread.start()
+
+    def invalidate(self, user_id: str = None):
+        """
+        後台修改 VIP 標籤時呼叫，讓變更立即生效
+
+        Args:
+            user_id: 指定用戶 ID（重新查詢該用戶），若為 None 則重新載入完整名單
+        """
+        if not user_id:
+            if not self.prefetch_all():
+                self.clear_cache()
+            return
+
+        result = self._fetch_vip_info(user_id)
+        with self._lock:
+            if result is not None:
+                self._store(user_id, result, time.time())
+                # 名單同步更新，TTL 過後仍以最新狀態回答
+                if result['is_vip']:
+                    self._roster[user_id] = result
+                else:
+                    self._roster.pop(user_id, None)
+            else:
+                self._cache.pop(user_id, None)
+                # 無法確認最新狀態，名單暫不作為非 VIP 依據，改逐一查詢
+                self._roster_loaded_at = 0.0
     
     def is_vip(self, user_id: str) -> bool:
         """檢查用戶是否為 VIP（任何類型）"""
@@ -111,10 +240,13 @@ class VIPManager:
         Args:
             user_id: 指定用戶 ID，若為 None 則清除全部
         """
-        if user_id:
-            self._cache.pop(user_id, None)
-        else:
-            self._cache.clear()
+        with self._lock:
+            if user_id:
+                self._cache.pop(user_id, None)
+            else:
+                self._cache.clear()
+            # 清除後名單不再完整，改逐一查詢直到下次刷新
+            self._roster_loaded_at = 0.0
     
     def _default_result(self) -> dict:
         """回傳預設結果（非 VIP）"""
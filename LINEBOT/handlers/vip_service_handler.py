@@ -14,7 +14,7 @@ VIP 服務處理器
 import os
 import re
 from typing import Optional, Dict, Any
-from datetime import datetime
+from datetime import datetime, timedelta
 from PIL import Image
 import io
 
@@ -37,6 +37,35 @@ class VIPServiceHandler(BaseHandler):
     STATE_VIP_IDLE = 'vip_idle'
     STATE_VIP_WAITING_IMAGE = 'vip_waiting_image'
     
+    # 本地意圖規則（依序比對，先中先贏）：相對期間 > 明確日期 > 一般關鍵字
+    LOCAL_PERIOD_RULES = [
+        ('yesterday_status', re.compile(r'昨天|昨日')),
+        ('month_forecast', re.compile(r'本月|這個月|這月')),
+        ('weekend_forecast', re.compile(r'週末|周末')),
+        ('week_forecast', re.compile(r'這禮拜|本週|本周|這星期|這週|這周')),
+    ]
+    LOCAL_KEYWORD_RULES = [
+        ('checkin_list', re.compile(r'入住名單|今日入住|今天入住|誰入住')),
+        ('room_status', re.compile(r'待清潔|待打掃|房間狀態|停用')),
+        ('same_day_bookings', re.compile(r'臨時訂單|LINE\s*訂單', re.IGNORECASE)),
+        ('today_status', re.compile(r'房況|住房率|空房|幾間房')),
+    ]
+    # 相對日期（明天 / 後天 / 大後天）→ 天數；大後天須先比對，否則會被「後天」吃掉
+    RELATIVE_DAY_PATTERN = re.compile(r'(大後天|明天|明日|後天)')
+    RELATIVE_DAYS = {'明天': 1, '明日': 1, '後天': 2, '大後天': 3}
+    # 下週 / 下個月等未來期間：本地規則只涵蓋本期，交給 AI（避免誤回今天或本週的數字）
+    FUTURE_PERIOD_PATTERN = re.compile(r'下週|下周|下禮拜|下星期|下個月|下月')
+    # 明確日期格式（YYYY-MM-DD、MM/DD、X月X日）；「X號」易與房號混淆，不算明確
+    EXPLICIT_DATE_PATTERN = re.compile(r'\d{4}[-/]\d{1,2}[-/]\d{1,2}|\d{1,2}/\d{1,2}|\d{1,2}月\d{1,2}')
+    # 「X號」「二十五日」只有日期：本地不判定，交給 AI（可能是查該日房況）
+    DAY_OF_MONTH_PATTERN = re.compile(r'[\d一二三四五六七八九十]{1,3}\s*[號日]')
+    # 與 PMS 查詢相關的字眼；完全沒有時直接判定非查詢，不送 AI
+    PMS_CUE_PATTERN = re.compile(r'房|住|訂|客人|名單|清潔|打掃')
+    # 查詢動詞（「幫我查王小明」「找一下陳大文」可能是查客人訂單），沒有 PMS 字眼也交給 AI
+    QUERY_VERB_PATTERN = re.compile(r'查|找')
+    # 相對期間規則需要的住房字眼（「這週末墾丁天氣」「昨天那位客人叫什麼」不是房況查詢）
+    PERIOD_CUE_PATTERN = re.compile(r'房|住|訂|空|滿|預測|統計')
+    
     # 角色稱謂對照表
     ROLE_TITLES = {
         'chairman': '董事長',
@@ -58,6 +87,12 @@ class VIPServiceHandler(BaseHandler):
         self.state_machine = state_machine
         self.logger = logger
         self.vision_model = vision_model
+        
+        # AI 意圖分類用的 Gemini client（首次使用時建立，之後重複使用）
+        self._genai_client = None
+        self._genai_fallback_model = None
+        # 意圖判斷來源統計：local = 本地規則、llm = AI 分類、llm_failed = AI 失敗改用本地結果
+        self.intent_stats = {'local': 0, 'llm': 0, 'llm_failed': 0}
     
     def is_vip(self, user_id: str) -> bool:
         """檢查用戶是否為任何類型的 VIP"""
@@ -181,12 +216,90 @@ class VIPServiceHandler(BaseHandler):
     
     def _detect_query_intent(self, message: str) -> Optional[Dict]:
         """
-        使用 AI 判斷用戶的查詢意圖
+        判斷用戶的查詢意圖（本地規則優先，低信心才交給 AI）
         回傳: {'type': 'today_status'} 或 {'type': 'specific_date', 'date': '2025-12-25'} 等
         """
+        intent, confident = self._classify_intent_locally(message)
+        if confident:
+            self.intent_stats['local'] += 1
+            return intent
+
+        llm_intent = self._detect_query_intent_by_llm(message)
+        if llm_intent is False:
+            # AI 失敗，改用本地的低信心結果
+            self.intent_stats['llm_failed'] += 1
+            return intent
+
+        self.intent_stats['llm'] += 1
+        return llm_intent
+
+    def _classify_intent_locally(self, message: str):
+        """
+        本地意圖分類（預編譯規則 + 日期解析，不呼叫任何 API）
+
+        Returns:
+            (intent, confident): intent 為意圖 dict 或 None；
+            confident 為 False 時表示需要交給 AI 判斷
+        """
+        # 0. 下週 / 下個月：本地沒有對應規則，交給 AI
+        if self.FUTURE_PERIOD_PATTERN.search(message):
+            return None, False
+
+        # 1. 相對期間（昨天 / 本月 / 週末 / 本週）+ 住房字眼；沒有住房字眼時交給 AI
+        for intent_type, pattern in self.LOCAL_PERIOD_RULES:
+            if pattern.search(message):
+                return {'type': intent_type}, bool(self.PERIOD_CUE_PATTERN.search(message))
+
+        # 2. 明天 / 後天 / 大後天 + 查詢字眼
+        match = self.RELATIVE_DAY_PATTERN.search(message)
+        if match and self.PMS_CUE_PATTERN.search(message):
+            date = datetime.now() + timedelta(days=self.RELATIVE_DAYS[match.group(1)])
+            return {'type': 'specific_date', 'date': date.strftime('%Y-%m-%d')}, True
+
+        # 3. 明確日期（12/25、12月25日、2025-12-25）
+        if self.EXPLICIT_DATE_PATTERN.search(message):
+            date_str = self._parse_date_from_message(message)
+            if date_str:
+                return {'type': 'specific_date', 'date': date_str}, True
+
+        # 「25號房況」：查的是該日，不可落入下方的今日房況；交給 AI，備援為本地解析的日期
+        if self.DAY_OF_MONTH_PATTERN.search(message):
+            date_str = self._parse_date_from_message(message)
+            return ({'type': 'specific_date', 'date': date_str} if date_str else None), False
+
+        # 4. 一般關鍵字（入住名單 / 房間狀態 / 臨時訂單 / 房況）
+        for intent_type, pattern in self.LOCAL_KEYWORD_RULES:
+            if pattern.search(message):
+                return {'type': intent_type}, True
+
+        # 5. 完全沒有 PMS 相關字眼、也沒有查詢動詞：不是查詢（交回後續流程）
+        if not self.PMS_CUE_PATTERN.search(message) and not self.QUERY_VERB_PATTERN.search(message):
+            return None, True
+
+        # 6. 其餘（查某人訂單等）信心不足，交給 AI；本地猜測作為 AI 失敗時的備援
+        return self._fallback_keyword_detection(message), False
+
+    def get_intent_stats(self) -> Dict[str, Any]:
+        """取得意圖判斷來源統計（含本地判定比例）"""
+        total = sum(self.intent_stats.values())
+        local_ratio = self.intent_stats['local'] / total if total else 0.0
+        return {**self.intent_stats, 'total': total, 'local_ratio': round(local_ratio, 3)}
+
+    def _get_genai_client(self):
+        """取得（重複使用）新版 SDK 的 Gemini client"""
+        if self._genai_client is None:
+            from google import genai
+            self._genai_client = genai.Client(api_key=os.getenv('GOOGLE_API_KEY'))
+        return self._genai_client
+
+    def _detect_query_intent_by_llm(self, message: str):
+        """
+        使用 AI 判斷用戶的查詢意圖
+
+        Returns:
+            意圖 dict、None（非查詢意圖），AI 失敗時回傳 False
+        """
         try:
-            api_key = os.getenv('GOOGLE_API_KEY')
-            
             # 快速意圖分類 Prompt
             prompt = f"""你是一個意圖分類器。根據用戶訊息，判斷他想查詢什麼類型的旅館資料。
 
@@ -203,6 +316,7 @@ class VIPServiceHandler(BaseHandler):
 - name_search: 查詢特定客人的訂單（需提取姓名）
 - none: 不是查詢 PMS 資料的意圖
 
+今天日期：{datetime.now().strftime('%Y-%m-%d')}
 用戶訊息：「{message}」
 
 請只回覆 JSON 格式，例如：
@@ -213,19 +327,18 @@ class VIPServiceHandler(BaseHandler):
 
             # 使用新版 SDK
             try:
-                from google import genai
-                client = genai.Client(api_key=api_key)
-                response = client.models.generate_content(
+                response = self._get_genai_client().models.generate_content(
                     model='gemini-2.0-flash-exp',
                     contents=prompt
                 )
                 text = response.text.strip()
             except Exception:
                 # Fallback 舊版 SDK
-                import google.generativeai as genai_old
-                genai_old.configure(api_key=api_key)
-                model = genai_old.GenerativeModel('gemini-1.5-flash')
-                response = model.generate_content(prompt)
+                if self._genai_fallback_model is None:
+                    import google.generativeai as genai_old
+                    genai_old.configure(api_key=os.getenv('GOOGLE_API_KEY'))
+                    self._genai_fallback_model = genai_old.GenerativeModel('gemini-1.5-flash')
+                response = self._genai_fallback_model.generate_content(prompt)
                 text = response.text.strip()
             
             # 解析 JSON
@@ -243,11 +356,10 @@ class VIPServiceHandler(BaseHandler):
             
         except Exception as e:
             print(f"⚠️ 意圖判斷失敗: {e}")
-            # Fallback 到簡單關鍵字匹配
-            return self._fallback_keyword_detection(message)
+            return False
     
     def _fallback_keyword_detection(self, message: str) -> Optional[Dict]:
-        """當 AI 判斷失敗時，使用簡單關鍵字匹配作為備援"""
+        """本地規則信心不足時的猜測，作為 AI 判斷失敗時的備援"""
         if any(kw in message for kw in ['昨天', '昨日']):
             return {'type': 'yesterday_status'}
         if any(kw in message for kw in ['本月', '這個月', '這月']):
@@ -410,18 +522,15 @@ class VIPServiceHandler(BaseHandler):
         target_user_id = None
         matched_display_name = None
         
+        other_candidates = []
+        
         if target_name and self.logger:
-            # 從 ChatLogger 的 profiles 中查找
-            for uid, profile in self.logger.profiles.items():
-                if isinstance(profile, dict):
-                    name = profile.get('display_name', '')
-                else:
-                    name = profile  # 舊格式：純字串
-                
-                if name and target_name in name:
-                    target_user_id = uid
-                    matched_display_name = name
-                    break
+            # 從 ChatLogger 的顯示名稱索引查找（完全相符 / 開頭相符 / 最近互動優先）
+            candidates = self.logger.find_users_by_name(target_name)
+            if candidates:
+                target_user_id = candidates[0]['user_id']
+                matched_display_name = candidates[0]['display_name']
+                other_candidates = [c['display_name'] for c in candidates[1:]]
         
         if not target_name:
             # 不指定客人名：直接記錄為通用備註
@@ -437,7 +546,10 @@ class VIPServiceHandler(BaseHandler):
         
         print(f"📝 手動回覆同步：管理員 → {matched_display_name}({target_user_id}): {reply_content[:50]}...")
         
-        return f"{role_title}，已記錄您回覆「{matched_display_name}」的內容 ✅\nAI 下次對話時會看到這段回覆。"
+        reply = f"{role_title}，已記錄您回覆「{matched_display_name}」的內容 ✅\nAI 下次對話時會看到這段回覆。"
+        if other_candidates:
+            reply += f"\n（另有相符客人：{'、'.join(other_candidates)}，若記錯對象請告訴我）"
+        return reply
     
     def _detect_image_task(self, message: str) -> Optional[Dict]:
         """偵測是否為需要圖片的任務 (優化 Regex)"""
@@ -483,8 +595,7 @@ class VIPServiceHandler(BaseHandler):
             
             # 優先嘗試新版 SDK (genai client)
             try:
-                from google import genai
-                client = genai.Client(api_key=api_key)
+                client = self._get_genai_client()
                 # 使用最新型號 gemini-2.0-flash-exp (或目前的 flash 穩定版)
                 response = client.models.generate_content(
                     model='gemini-2.0-flash-exp',
@@ -2,9 +2,18 @@
 網路搜尋模組
 使用 Gemini 的 Search Grounding 功能進行網路搜尋
 僅限內部 VIP 使用
+
+搜尋結果依正規化後的查詢字串快取，TTL 依類別而定（新聞最短、一般資訊最長）；
+同一查詢同時有多位同仁送出時只呼叫一次 Gemini，其餘等待共用結果。
 """
 
 import os
+import re
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime
 
 # 嘗試使用新版 SDK (google-genai)，若失敗則用舊版
 try:
@@ -18,9 +27,30 @@ except ImportError:
 
 class WebSearchHandler:
     """網路搜尋處理器（使用 Google Search Grounding）"""
+
+    # 各類別快取時間（秒）
+    CATEGORY_TTL_SECONDS = {
+        'news': 15 * 60,          # 新聞 / 即時資訊
+        'weather': 30 * 60,       # 天氣
+        'business': 6 * 60 * 60,  # 店家營業時間、電話、票價
+        'general': 24 * 60 * 60,  # 景點介紹等不常變動的資訊
+    }
+    # 類別判斷關鍵字（依序比對）
+    CATEGORY_PATTERNS = [
+        ('weather', re.compile(r'天氣|氣溫|下雨|降雨|颱風|風浪')),
+        ('news', re.compile(r'新聞|最新|即時|快訊|今日|今天')),
+        ('business', re.compile(r'營業|電話|地址|開放時間|門票|票價|價格|公休|菜單')),
+    ]
+    # 相對日期（今天 / 明天 / 週末…）的查詢結果只對當天有效，快取鍵加上日期
+    RELATIVE_DATE_PATTERN = re.compile(r'今天|今日|今晚|今早|明天|明日|明晚|後天|昨天|昨日|本週|本周|這週|這周|週末|周末|現在|目前')
+    # 快取最多保留的查詢數
+    CACHE_MAX_SIZE = 200
     
     def __init__(self):
         self.api_key = os.getenv('GOOGLE_API_KEY')
+        self._cache = OrderedDict()  # 正規化查詢 → (快取時間, TTL, 結果)
+        self._inflight = {}          # 正規化查詢 → threading.Event（搜尋中）
+        self._lock = threading.Lock()
         
         if USE_NEW_SDK and self.api_key:
             # 新版 SDK - 使用 Client 模式
@@ -30,27 +60,113 @@ class WebSearchHandler:
             genai_old.configure(api_key=self.api_key)
             self.client = None
     
-    def search(self, query: str, user_name: str = "您") -> dict:
+    def search(self, query: str, user_name: str = "您", category: str = None) -> dict:
         """
-        執行網路搜尋（使用 Gemini Search Grounding）
+        執行網路搜尋（使用 Gemini Search Grounding，結果會快取）
         
         Args:
             query: 搜尋關鍵字
             user_name: 用戶名稱（用於禮貌稱呼）
+            category: 快取類別（news/weather/business/general），None 時依查詢內容判斷
             
         Returns:
-            dict: 搜尋結果
+            dict: 搜尋結果，含 as_of（資料時間）與 cached（是否來自快取）
         """
         if not self.api_key:
             return {'success': False, 'message': '❌ 未設定 GOOGLE_API_KEY'}
-        
+
+        key = self._normalize_query(query)
+        category = category or self._detect_category(key)
+        if self.RELATIVE_DATE_PATTERN.search(key):
+            key = f"{datetime.now().strftime('%Y-%m-%d')} {key}"
+
+        while True:
+            with self._lock:
+                cached = self._get_cached(key)
+                if cached:
+                    return self._personalize(cached, user_name, cached=True)
+
+                event = self._inflight.get(key)
+                if event is None:
+                    # 由本執行緒負責搜尋
+                    event = threading.Event()
+                    self._inflight[key] = event
+                    break
+
+            # 相同查詢正在搜尋中，等待完成後重新讀取快取
+            event.wait(timeout=60)
+            with self._lock:
+                cached = self._get_cached(key)
+            if cached:
+                return self._personalize(cached, user_name, cached=True)
+            # 前一次搜尋失敗（未快取），由本執行緒重試
+            with self._lock:
+                if self._inflight.get(key) is event:
+                    self._inflight.pop(key, None)
+
+        try:
+            result = self._search_uncached(query)
+            if result.get('success'):
+                result['as_of'] = datetime.now().strftime('%Y-%m-%d %H:%M')
+                with self._lock:
+                    self._cache[key] = (time.time(), self.CATEGORY_TTL_SECONDS[category], result)
+                    self._cache.move_to_end(key)
+                    while len(self._cache) > self.CACHE_MAX_SIZE:
+                        self._cache.popitem(last=False)
+                return self._personalize(result, user_name, cached=False)
+            return result
+        finally:
+            # 等待逾時的執行緒可能已換上新的 Event，只移除自己登記的
+            with self._lock:
+                if self._inflight.get(key) is event:
+                    self._inflight.pop(key, None)
+            event.set()
+
+    def _normalize_query(self, query: str) -> str:
+        """正規化查詢字串（全半形、大小寫、空白、結尾標點）作為快取鍵"""
+        text = unicodedata.normalize('NFKC', query or '').lower()
+        text = re.sub(r'\s+', ' ', text).strip()
+        return text.rstrip('?!.,。？！，~ ')
+
+    def _detect_category(self, query: str) -> str:
+        """依查詢內容判斷快取類別"""
+        for category, pattern in self.CATEGORY_PATTERNS:
+            if pattern.search(query):
+                return category
+        return 'general'
+
+    def _get_cached(self, key: str):
+        """取得未過期的快取結果（呼叫端需持有 lock）"""
+        entry = self._cache.get(key)
+        if not entry:
+            return None
+        cached_at, ttl, result = entry
+        if time.time() - cached_at >= ttl:
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return result
+
+    def _personalize(self, result: dict, user_name: str, cached: bool) -> dict:
+        """加上稱呼與資料時間（快取結果不含稱呼，可供不同同仁共用）"""
+        message = f"{user_name}，{result['message']}\n\n🕒 資料時間：{result['as_of']}"
+        return {**result, 'message': message, 'cached': cached}
+
+    def clear_cache(self):
+        """清除搜尋快取"""
+        with self._lock:
+            self._cache.clear()
+
+    def _search_uncached(self, query: str) -> dict:
+        """實際呼叫 Gemini 搜尋（不經快取）"""
         # 構建搜尋提示 - 內部 VIP 專屬 persona（有禮貌、簡潔）
-        prompt = f"""你是龜地灣旅館的內部助理，正在為管理層人員 {user_name} 查詢資訊。
+        # 稱呼由 _personalize 加上，讓同一份結果可供不同同仁共用
+        prompt = f"""你是龜地灣旅館的內部助理，正在為管理層人員查詢資訊。
 
 【查詢內容】{query}
 
 【回覆要求】
-1. 開頭用「{user_name}，」稱呼
+1. 不需要稱呼或問候，直接回答
 2. 如果是餐廳/店家：優先提供電話、地址、營業時間
 3. 如果是景點：優先提供開放時間、門票資訊
 4. 請優先搜尋「屏東車城」「恆春」「墾丁」地區的資訊
@@ -61,11 +177,11 @@ class WebSearchHandler:
 請用繁體中文回答。"""
         
         if USE_NEW_SDK:
-            return self._search_with_new_sdk(prompt, user_name)
+            return self._search_with_new_sdk(prompt)
         else:
-            return self._search_with_old_sdk(prompt, user_name)
+            return self._search_with_old_sdk(prompt)
     
-    def _search_with_new_sdk(self, prompt: str, user_name: str) -> dict:
+    def _search_with_new_sdk(self, prompt: str) -> dict:
         """使用新版 SDK 進行搜尋（支援 Search Grounding）"""
         try:
             # 建立 Google Search 工具
@@ -96,9 +212,9 @@ class WebSearchHandler:
             error_msg = str(e)
             print(f"❌ 新版 SDK 搜尋錯誤: {error_msg}")
             # Fallback 到舊版
-            return self._search_with_old_sdk(prompt, user_name)
+            return self._search_with_old_sdk(prompt)
     
-    def _search_with_old_sdk(self, prompt: str, user_name: str) -> dict:
+    def _search_with_old_sdk(self, prompt: str) -> dict:
         """使用舊版 SDK 進行搜尋（無 Search Grounding）"""
         try:
             model = genai_old.GenerativeModel('gemini-3-flash-preview')
@@ -125,7 +241,7 @@ class WebSearchHandler:
         Returns:
             dict: 天氣資訊
         """
-        return self.search(f"{location}今日天氣預報")
+        return self.search(f"{location}今日天氣預報", category='weather')
     
     def search_news(self, topic: str = "墾丁旅遊") -> dict:
         """
@@ -137,7 +253,7 @@ class WebSearchHandler:
         Returns:
             dict: 新聞資訊
         """
-        return self.search(f"{topic} 最新新聞")
+        return self.search(f"{topic} 最新新聞", category='news')
 
 
 # 建立全域實例
@@ -9,15 +9,287 @@
 設計原則：
 - 使用靜態方法 (Stateless)
 - 關鍵字匹配為主，未來可擴充為 AI 判斷
+
+單次比對：
+- 所有 Handler 的關鍵字清單集中在 KEYWORD_SETS，啟動時編譯成一個前綴樹 (trie) 正規表達式
+- 每則訊息只正規化一次（全形轉半形、空白、大小寫），一次掃描取得所有意圖旗標與
+  訂單編號 / 電話等實體（MessageAnalysis）
+- analyze() 依訊息快取結果，同一則訊息經過多個 Handler 時不會重複掃描
 """
 
 import re
-from typing import List
+import unicodedata
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable
+
+
+# ============================================
+# 關鍵字清單（意圖名稱 → 關鍵字）
+# 比對時訊息已轉小寫，英文關鍵字一律以小寫定義
+# ============================================
+KEYWORD_SETS: Dict[str, tuple] = {
+    # 訂房意圖（IntentDetector.is_booking_intent）
+    'booking': (
+        '訂房', '預訂', '今天住', '今日住', '有房', '還有房',
+        '空房', '想住', '要住', '可以住', '今天訂', '今日訂',
+        '今天', '今日', '明天', '明日',
+        '加訂', '加定', '多訂', '再訂', '多一間', '再一間',
+    ),
+    # 當日訂房（強調「今天」）
+    'same_day': ('今天', '今日', '今晚', '現在'),
+    # 查詢訂單
+    'query': (
+        '查訂單', '查詢訂單', '我有訂', '確認訂單', '我的訂單',
+        '我訂了', '已經訂', '訂單狀態', '訂單資訊',
+    ),
+    # 取消
+    'cancel': (
+        '取消', '不要', '算了', '放棄', '不訂', '不定',
+        '退訂', '退房', '取消訂房', '取消預訂',
+    ),
+    # 中斷流程
+    'interrupt': (
+        '不要', '算了', '取消', '停止', '退出',
+        '重新開始', '重來', 'reset', 'restart',
+    ),
+    # 禮貌用語（不視為確認）
+    'polite': ('謝謝', '感謝', '謝了', '辛苦', '麻煩', '拜託', '多謝', '3q', 'thanks', 'thank'),
+    # 確認 / 否定
+    'confirm': ('是', '對', '沒錯', '正確', '確認', 'yes', '好', 'ok'),
+    'reject': ('不是', '錯', '不對', '不正確', 'no'),
+    # 特殊需求
+    'special_request': (
+        # 設施需求
+        '嬰兒床', '嬰兒澡盆', '消毒鍋', '奶瓶消毒', '澡盆',
+        '嬰兒', '寶寶', '小孩',
+        # 房間偏好
+        '高樓層', '低樓層', '安靜', '禁菸', '禁煙', '吸菸', '吸煙',
+        '靠近', '鄰近', '同樓層', '隔壁', '附近', '旁邊',
+        '相鄰', '連通', '面海', '海景', '窗戶',
+        # 床型需求
+        '大床', '小床', '雙人床', '單人床', '加床', '併床',
+        '兩張床', '一張床', '床型',
+        # 停車相關
+        '停車', '車位', '停車場',
+        # 寵物相關
+        '寵物', '狗', '貓', '毛小孩',
+        # 其他服務
+        '提前', '提早', '晚退', '延遲退房', 'late checkout',
+        '需要', '希望', '能否', '可以嗎', '可不可以', '幫忙', '安排',
+    ),
+    # 訂單流程中的加訂（OrderQueryHandler._is_booking_intent）
+    'add_booking': ('加訂', '加定', '多訂', '再訂', '多一間', '再一間'),
+    # 一般訂房（SameDayBookingHandler.is_booking_intent）
+    'booking_general': (
+        '訂房', '預訂', '訂', '住', '入住',
+        '有房', '還有房', '空房', '房間',
+        '想住', '要住', '可以住',
+    ),
+    'booking_general_exclude': (
+        '我有訂房', '我訂了', '已經訂',
+        '確認訂單', '查訂單', '查詢訂單',
+        '我的訂單', '訂單查詢',
+    ),
+    # 當日預訂的時間詞 + 預訂詞（SameDayBookingHandler.is_same_day_intent）
+    'same_day_time': (
+        '今天', '今日', '當天', '當日',
+        '現在', '馬上', '立刻', '等下', '等一下',
+        '晚上', '今晚', '下午', '傍晚',
+    ),
+    'same_day_booking': ('訂房', '預訂', '訂', '住', '入住', '有房', '還有房'),
+    # 取消既有訂單（SameDayBookingHandler.is_cancel_intent）
+    'cancel_order': (
+        '取消訂單', '取消預訂', '不住了', '不要了',
+        '不來了', '取消了', '我要取消', '幫我取消',
+        '想取消', '需要取消',
+    ),
+    # 預訂流程中斷（SameDayBookingHandler._is_interrupt_intent）
+    'booking_interrupt': (
+        '不用了', '算了', '先不用', '我再想想',
+        '下次', '改天', '等等', '稍後', '晚點',
+        '謝謝', '謝謝你', '好的謝謝', '感謝',
+        '不需要', '暫時不用', '先這樣',
+    ),
+    # 預訂流程中想查詢訂單（SameDayBookingHandler._is_query_intent）
+    'booking_query': ('查訂單', '查詢訂單', '我有訂房', '確認訂單', '我的訂單', '我訂了', '已經訂'),
+    # 沒有訂單編號的訂房意圖（HotelBot._is_booking_intent_without_order）
+    'booking_without_order': (
+        '訂房', '預訂', '今天住', '今日住', '有房', '還有房',
+        '空房', '想住', '要住', '可以住', '今天訂', '今日訂',
+        '今天', '今日',  # 單獨說「今天」也視為訂房意圖
+    ),
+    'booking_without_order_exclude': ('我有訂', '已經訂', '查訂單', '我的訂單', '確認訂單'),
+}
+
+# 整則訊息完全等於這些詞時視為確認 / 否定（不受長度限制）
+CONFIRM_WORDS = frozenset(KEYWORD_SETS['confirm'])
+REJECT_WORDS = frozenset(KEYWORD_SETS['reject'])
+# 確認 / 否定關鍵字只在短訊息中生效
+SHORT_MESSAGE_LENGTH = 10
+
+# 預先編譯的實體樣式
+WHITESPACE_PATTERN = re.compile(r'\s+')
+MOBILE_PATTERN = re.compile(r'09\d{8}')
+LANDLINE_PATTERN = re.compile(r'0[2-8]\d{7,8}')
+LOOSE_PHONE_PATTERN = re.compile(r'\d{8,}')
+ORDER_NUMBER_PATTERN = re.compile(r'\b[1-9]\d{4,9}\b')
+LONG_NUMBER_PATTERN = re.compile(r'\b\d{5,}\b')
+OTA_PREFIX_PATTERN = re.compile(r'^(RMPGP|RMAG|RMBK|RM[A-Z]{2})')
+NON_DIGIT_PATTERN = re.compile(r'\D')
+EDGE_PUNCTUATION_PATTERN = re.compile(r'^[\s,，、]+|[\s,，、]+$')
+
+
+def normalize_message(message: str) -> str:
+    """正規化訊息：全形轉半形（NFKC）、轉小寫、連續空白合併為一個並去除頭尾"""
+    text = unicodedata.normalize('NFKC', message or '').lower()
+    return WHITESPACE_PATTERN.sub(' ', text).strip()
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """
+    把關鍵字組成前綴樹再輸出成正規表達式
+
+    共同前綴只比對一次，每個位置的分支都以不同字元開頭，
+    比對成本與關鍵字數量無關（只和關鍵字長度有關）。
+    """
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = {}  # 結尾標記
+
+    def build(node: dict) -> str:
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if '' in node:
+            # 目前位置已是完整關鍵字，較長的延伸為可選（貪婪，優先取最長）
+            body = '(?:' + body + ')?'
+        return body
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """
+    多組關鍵字的單次掃描比對器
+
+    每個起始位置只取最長的關鍵字；同一位置較短的關鍵字必為它的前綴，
+    因此事先把「包含在該關鍵字內的所有關鍵字」的意圖合併進去，
+    掃描一次即可得到與逐一 `kw in message` 相同的結果。
+    """
+
+    def __init__(self, keyword_sets: Dict[str, Iterable[str]]):
+        owners: Dict[str, set] = {}
+        for intent, keywords in keyword_sets.items():
+            for kw in keywords:
+                owners.setdefault(kw.lower(), set()).add(intent)
+
+        self._intents_of: Dict[str, FrozenSet[str]] = {}
+        for kw in owners:
+            intents = set()
+            for other, other_intents in owners.items():
+                if other in kw:
+                    intents |= other_intents
+            self._intents_of[kw] = frozenset(intents)
+
+        # 以 lookahead 取得每個位置的匹配（允許重疊）
+        self._pattern = re.compile('(?=(' + _trie_pattern(owners) + '))')
+
+    def scan(self, text: str) -> FrozenSet[str]:
+        """回傳訊息中出現的所有意圖（text 需已正規化）"""
+        found = set()
+        for match in self._pattern.finditer(text):
+            found |= self._intents_of[match.group(1)]
+        return frozenset(found)
+
+
+_matcher = KeywordMatcher(KEYWORD_SETS)
+
+
+class MessageAnalysis:
+    """
+    單則訊息的分析結果（唯讀，會被快取共用）
+
+    Attributes:
+        message: 原始訊息
+        text: 正規化後的訊息
+        intents: 命中的意圖名稱（KEYWORD_SETS 的 key）
+        order_number: 訂單編號（排除電話後），None 表示沒有
+        has_order_number: 是否包含訂單編號（訊息中有手機號碼時為 False）
+        possible_order_number: 整則訊息是否為不以 0 開頭的 5 位數以上數字
+        has_long_number: 是否包含 5 位數以上的數字（不論開頭）
+        phone: 台灣電話（手機 / 市話，嚴格模式）
+        loose_phone: 寬鬆模式電話（手機或 8 位以上數字）
+    """
+
+    __slots__ = ('message', 'text', 'intents', 'order_number', 'has_order_number',
+                 'possible_order_number', 'has_long_number', 'phone', 'loose_phone')
+
+    def __init__(self, message: str):
+        self.message = message
+        self.text = text = normalize_message(message)
+        self.intents = _matcher.scan(text)
+
+        # 訂單編號：不以 0 開頭的 5-10 位數字；訊息中有手機號碼時不算「包含訂單」，
+        # 但仍嘗試取出非電話的數字
+        has_mobile = MOBILE_PATTERN.search(text) is not None
+        order_match = ORDER_NUMBER_PATTERN.search(text)
+        self.order_number = order_match.group(0) if order_match else None
+        self.has_order_number = not has_mobile and order_match is not None
+        self.has_long_number = LONG_NUMBER_PATTERN.search(text) is not None
+
+        digits = text.replace(' ', '').replace('-', '')
+        self.possible_order_number = digits.isdigit() and len(digits) >= 5 and not digits.startswith('0')
+
+        # 電話：移除空白、連字符、加號後比對
+        compact = digits.replace('+', '')
+        mobile = MOBILE_PATTERN.search(compact)
+        landline = None if mobile else LANDLINE_PATTERN.search(compact)
+        self.phone = (mobile or landline).group(0) if (mobile or landline) else None
+        loose = mobile or LOOSE_PHONE_PATTERN.search(compact)
+        self.loose_phone = loose.group(0) if loose else None
+
+    def has(self, *intents: str) -> bool:
+        """是否命中任一意圖"""
+        return any(intent in self.intents for intent in intents)
+
+    @property
+    def is_short(self) -> bool:
+        return len(self.text) <= SHORT_MESSAGE_LENGTH
+
+    def __repr__(self):
+        return f"MessageAnalysis({self.text!r}, intents={sorted(self.intents)})"
+
+
+@lru_cache(maxsize=512)
+def _analyze(message: str) -> MessageAnalysis:
+    return MessageAnalysis(message)
 
 
 class IntentDetector:
     """統一意圖偵測器"""
     
+    @staticmethod
+    def analyze(message: str) -> MessageAnalysis:
+        """
+        一次取得訊息的所有意圖旗標與實體（依訊息內容快取）
+        
+        Args:
+            message: 用戶訊息
+            
+        Returns:
+            MessageAnalysis
+            
+        Examples:
+            >>> intent = IntentDetector.analyze("我想取消訂單 250277285")
+            >>> intent.has('cancel_order'), intent.order_number
+            (True, '250277285')
+        """
+        return _analyze(message or '')
+    
     @staticmethod
     def has_order_number(message: str) -> bool:
         """
@@ -33,12 +305,7 @@ class IntentDetector:
         Returns:
             True 如果包含訂單編號
         """
-        # 排除電話號碼（09 開頭的 10 位數）
-        if re.search(r'09\d{8}', message):
-            return False
-        
-        # 訂單編號：不以 0 開頭的 5-10 位數字
-        return bool(re.search(r'\b[1-9]\d{4,9}\b', message))
+        return IntentDetector.analyze(message).has_order_number
     
     @staticmethod
     def is_possible_order_number(message: str) -> bool:
@@ -67,18 +334,8 @@ class IntentDetector:
             >>> is_possible_order_number("1671721966")
             True  # 不是 0 開頭 → 可能是訂單
         """
-        # 清理訊息
-        clean = message.strip().replace(' ', '').replace('-', '')
-        
-        # 只檢查純數字訊息
-        if not clean.isdigit():
-            return False
-        
-        # 核心判斷：不是 0 開頭 + 至少 5 位數 = 可能是訂單
-        if len(clean) >= 5 and not clean.startswith('0'):
-            return True
-        
-        return False
+        # 純數字（忽略空白、連字符）+ 不是 0 開頭 + 至少 5 位數 = 可能是訂單
+        return IntentDetector.analyze(message).possible_order_number
     
     @staticmethod
     def extract_order_number(message: str) -> str:
@@ -91,17 +348,8 @@ class IntentDetector:
         Returns:
             訂單編號字串，None 表示未找到
         """
-        # 排除電話號碼
-        if re.search(r'09\d{8}', message):
-            # 嘗試找到非電話的數字
-            numbers = re.findall(r'\b[1-9]\d{4,9}\b', message)
-            if numbers:
-                return numbers[0]
-            return None
-        
-        # 提取訂單編號
-        match = re.search(r'\b[1-9]\d{4,9}\b', message)
-        return match.group(0) if match else None
+        # 電話都是 0 開頭，不會被當成訂單編號
+        return IntentDetector.analyze(message).order_number
     
     @staticmethod
     def is_new_order_query(message: str, current_order_id: str = None) -> bool:
@@ -144,10 +392,9 @@ class IntentDetector:
             if not order_id:
                 return ""
             # 移除常見前綴
-            import re
-            cleaned = re.sub(r'^(RMPGP|RMAG|RMBK|RM[A-Z]{2})', '', order_id)
+            cleaned = OTA_PREFIX_PATTERN.sub('', order_id)
             # 只保留數字
-            return re.sub(r'\D', '', cleaned)
+            return NON_DIGIT_PATTERN.sub('', cleaned)
         
         clean_current = clean_order_id(current_order_id)
         clean_new = clean_order_id(new_order)
@@ -166,13 +413,7 @@ class IntentDetector:
         Returns:
             True 如果是訂房意圖
         """
-        keywords = [
-            '訂房', '預訂', '今天住', '今日住', '有房', '還有房',
-            '空房', '想住', '要住', '可以住', '今天訂', '今日訂',
-            '今天', '今日', '明天', '明日',
-            '加訂', '加定', '多訂', '再訂', '多一間', '再一間'
-        ]
-        return any(kw in message for kw in keywords)
+        return IntentDetector.analyze(message).has('booking')
     
     @staticmethod
     def is_same_day_booking_intent(message: str) -> bool:
@@ -185,8 +426,7 @@ class IntentDetector:
         Returns:
             True 如果明確提到今天
         """
-        keywords = ['今天', '今日', '今晚', '現在']
-        return any(kw in message for kw in keywords)
+        return IntentDetector.analyze(message).has('same_day')
     
     @staticmethod
     def is_query_intent(message: str) -> bool:
@@ -199,11 +439,7 @@ class IntentDetector:
         Returns:
             True 如果是查詢意圖
         """
-        keywords = [
-            '查訂單', '查詢訂單', '我有訂', '確認訂單', '我的訂單',
-            '我訂了', '已經訂', '訂單狀態', '訂單資訊'
-        ]
-        return any(kw in message for kw in keywords)
+        return IntentDetector.analyze(message).has('query')
     
     @staticmethod
     def is_cancel_intent(message: str) -> bool:
@@ -216,11 +452,7 @@ class IntentDetector:
         Returns:
             True 如果是取消意圖
         """
-        keywords = [
-            '取消', '不要', '算了', '放棄', '不訂', '不定',
-            '退訂', '退房', '取消訂房', '取消預訂'
-        ]
-        return any(kw in message for kw in keywords)
+        return IntentDetector.analyze(message).has('cancel')
     
     @staticmethod
     def is_interrupt_intent(message: str) -> bool:
@@ -233,11 +465,7 @@ class IntentDetector:
         Returns:
             True 如果用戶想中斷當前流程
         """
-        keywords = [
-            '不要', '算了', '取消', '停止', '退出',
-            '重新開始', '重來', 'reset', 'restart'
-        ]
-        return any(kw in message for kw in keywords)
+        return IntentDetector.analyze(message).has('interrupt')
     
     @staticmethod
     def is_confirmation(message: str) -> bool:
@@ -252,17 +480,12 @@ class IntentDetector:
         Returns:
             True 如果是確認
         """
+        intent = IntentDetector.analyze(message)
         # 排除禮貌用語（不應視為確認）
-        polite_words = ['謝謝', '感謝', '謝了', '辛苦', '麻煩', '拜託', '多謝', '3q', 'thanks', 'thank']
-        message_lower = message.lower().strip()
-        if any(pw in message_lower for pw in polite_words):
+        if intent.has('polite'):
             return False
-        
-        keywords = [
-            '是', '對', '沒錯', '正確', '確認', 'yes', '好', 'ok', 'OK', 'Yes'
-        ]
         # 完全匹配或包含在短訊息中
-        return message_lower in keywords or any(kw in message and len(message) <= 10 for kw in keywords)
+        return intent.text in CONFIRM_WORDS or (intent.has('confirm') and intent.is_short)
     
     @staticmethod
     def is_rejection(message: str) -> bool:
@@ -275,11 +498,8 @@ class IntentDetector:
         Returns:
             True 如果是否定
         """
-        keywords = [
-            '不是', '錯', '不對', '不正確', 'no', 'No', 'NO'
-        ]
-        message_lower = message.lower().strip()
-        return message_lower in keywords or any(kw in message and len(message) <= 10 for kw in keywords)
+        intent = IntentDetector.analyze(message)
+        return intent.text in REJECT_WORDS or (intent.has('reject') and intent.is_short)
     
     @staticmethod
     def extract_phone_number(message: str, strict: bool = True) -> str:
@@ -294,36 +514,11 @@ class IntentDetector:
         Returns:
             電話號碼字串，None 表示未找到
         """
-        # 清理訊息：移除空白、連字符、加號
-        clean = message.replace(' ', '').replace('-', '').replace('+', '')
-        
-        if strict:
-            # 嚴格模式：只接受台灣電話格式
-            
-            # 1. 台灣手機：09 開頭 10 位
-            mobile_match = re.search(r'(09\d{8})', clean)
-            if mobile_match:
-                return mobile_match.group(1)
-            
-            # 2. 台灣市話：0 開頭 9-10 位（排除 09 手機）
-            # 格式：02-xxxxxxxx (台北)、03-xxxxxxx (桃園/新竹)...
-            landline_match = re.search(r'(0[2-8]\d{7,8})', clean)
-            if landline_match:
-                return landline_match.group(1)
-            
-            # 嚴格模式下，不符合台灣電話格式則返回 None
-            return None
-        else:
-            # 寬鬆模式：8 位以上數字（向後兼容舊邏輯）
-            
-            # 1. 優先找 09 開頭手機
-            mobile_match = re.search(r'(09\d{8})', clean)
-            if mobile_match:
-                return mobile_match.group(1)
-            
-            # 2. 其他 8 位以上數字
-            match = re.search(r'(\d{8,})', clean)
-            return match.group(1) if match else None
+        # 清理訊息（移除空白、連字符、加號）後比對：
+        # 嚴格模式只接受台灣電話格式（09 開頭 10 位手機、0[2-8] 開頭 9-10 位市話），
+        # 寬鬆模式優先找 09 開頭手機，其次 8 位以上數字（向後兼容舊邏輯）
+        intent = IntentDetector.analyze(message)
+        return intent.phone if strict else intent.loose_phone
     
     @staticmethod
     def is_phone_number(message: str) -> bool:
@@ -365,26 +560,7 @@ class IntentDetector:
             >>> is_special_request("好")
             False
         """
-        keywords = [
-            # 設施需求
-            '嬰兒床', '嬰兒澡盆', '消毒鍋', '奶瓶消毒', '澡盆',
-            '嬰兒', '寶寶', '小孩',
-            # 房間偏好
-            '高樓層', '低樓層', '安靜', '禁菸', '禁煙', '吸菸', '吸煙',
-            '靠近', '鄰近', '同樓層', '隔壁', '附近', '旁邊',
-            '相鄰', '連通', '面海', '海景', '窗戶',
-            # 床型需求
-            '大床', '小床', '雙人床', '單人床', '加床', '併床',
-            '兩張床', '一張床', '床型',
-            # 停車相關
-            '停車', '車位', '停車場',
-            # 寵物相關
-            '寵物', '狗', '貓', '毛小孩',
-            # 其他服務
-            '提前', '提早', '晚退', '延遲退房', 'late checkout',
-            '需要', '希望', '能否', '可以嗎', '可不可以', '幫忙', '安排'
-        ]
-        return any(kw in message for kw in keywords)
+        return IntentDetector.analyze(message).has('special_request')
     
     @staticmethod
     def extract_special_request(message: str) -> str:
@@ -410,10 +586,10 @@ class IntentDetector:
             return None
         
         # 移除訂單編號（避免汙染需求內容）
-        clean_message = re.sub(r'\b[1-9]\d{4,9}\b', '', message)
+        clean_message = ORDER_NUMBER_PATTERN.sub('', message)
         
         # 移除多餘的標點和空白
-        clean_message = re.sub(r'^[\s,，、]+|[\s,，、]+$', '', clean_message)
+        clean_message = EDGE_PUNCTUATION_PATTERN.sub('', clean_message)
         
         return clean_message.strip() if clean_message.strip() else message
 
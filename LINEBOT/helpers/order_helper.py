@@ -4,26 +4,14 @@
 """
 
 import re
+import unicodedata
 from datetime import datetime
 from typing import Optional, Dict, Any, List
 
-# 房型對照表 (SSOT)
-ROOM_TYPES = {
-    'SD': {'zh': '標準雙人房', 'short': '雙人房'},
-    'ST': {'zh': '標準三人房', 'short': '三人房'},
-    'SQ': {'zh': '標準四人房', 'short': '四人房'},
-    'CD': {'zh': '經典雙人房', 'short': '雙人房'},
-    'CQ': {'zh': '經典四人房', 'short': '四人房'},
-    'ED': {'zh': '行政雙人房', 'short': '雙人房'},
-    'DD': {'zh': '豪華雙人房', 'short': '雙人房'},
-    'WD': {'zh': '海景雙人房', 'short': '海景雙人房'},
-    'WQ': {'zh': '海景四人房', 'short': '海景四人房'},
-    'FM': {'zh': '親子家庭房', 'short': '家庭房'},
-    'VD': {'zh': 'VIP 雙人房', 'short': 'VIP 雙人房'},
-    'VQ': {'zh': 'VIP 四人房', 'short': 'VIP 四人房'},
-    'AD': {'zh': '無障礙雙人房', 'short': '無障礙雙人房'},
-    'AQ': {'zh': '無障礙四人房', 'short': '無障礙四人房'},
-}
+try:
+    from helpers.slot_extractor import extract_slots, convert_numerals, convert_time_numerals
+except ImportError:
+    from .slot_extractor import extract_slots, convert_numerals, convert_time_numerals
 
 def normalize_phone(phone: Optional[str]) -> str:
     """
@@ -215,11 +203,9 @@ def sync_order_details(order_id: str, data: Dict[str, Any], logger: Any, pms_cli
 
     try:
         for key in storage_keys:
-            # 1. 儲存到 guest_orders.json (透過 ChatLogger)
-            # 🔧 修復：先讀取現有資料，再合併新資料
+            # 1. 儲存到訂單資料庫 (透過 ChatLogger)
+            # 🔧 修復：讀取現有資料再合併，讀取與寫回在同一個交易內（不會覆蓋其他程序的寫入）
             if logger:
-                existing_order = logger.get_order(key) or {}
-                
                 # 準備新資料
                 new_data = {
                     'order_id': key,
@@ -236,22 +222,22 @@ def sync_order_details(order_id: str, data: Dict[str, Any], logger: Any, pms_cli
                     new_data['phone'] = data.get('phone')
                 if data.get('arrival_time'):
                     new_data['arrival_time'] = data.get('arrival_time')
-                if data.get('special_requests'):
-                    # 合併特殊需求（不要覆蓋）
-                    existing_reqs = existing_order.get('special_requests', [])
-                    new_reqs = data.get('special_requests', [])
-                    # 去重合併
-                    all_reqs = existing_reqs + [r for r in new_reqs if r not in existing_reqs]
-                    new_data['special_requests'] = all_reqs
                     
                 for field in ['check_in', 'check_out', 'room_type', 'booking_source']:
                     if field in data and data[field]:
                         new_data[field] = data[field]
-                
-                # 合併：現有資料 + 新資料（新資料優先，但不覆蓋空值）
-                full_order = {**existing_order, **{k: v for k, v in new_data.items() if v is not None}}
+
+                def _merge(existing_order, new_data=new_data):
+                    if data.get('special_requests'):
+                        # 合併特殊需求（不要覆蓋）
+                        existing_reqs = existing_order.get('special_requests', [])
+                        new_reqs = data.get('special_requests', [])
+                        # 去重合併
+                        new_data['special_requests'] = existing_reqs + [r for r in new_reqs if r not in existing_reqs]
+                    # 合併：現有資料 + 新資料（新資料優先，但不覆蓋空值）
+                    return {**existing_order, **{k: v for k, v in new_data.items() if v is not None}}
                         
-                logger.save_order(full_order)
+                logger.update_order(key, _merge, create=True)
 
             # 2. 同步到 SQLite (透過 PMSClient 調用後端 API)
             if pms_client:
@@ -302,6 +288,16 @@ CHINESE_NUMERALS = {
     '八': '8', '九': '9', '十': '10', '十一': '11', '十二': '12'
 }
 
+# 時間格式判斷用的樣式（模組載入時編譯一次）
+NON_DIGIT_PATTERN = re.compile(r'\D')
+DATE_PATTERN = re.compile(r'\d{1,2}/\d{1,2}|\d{4}-\d{2}-\d{2}')
+TIME_KEYWORD_PATTERN = re.compile('|'.join(map(re.escape, [
+    '點', '時', ':',
+    '上午', '下午', '中午', '晚上', '傍晚', '早上', '凌晨',
+    '等一下', '等下', '馬上', '待會', '稀候', '稍後', '現在',
+    '左右', '前後', '大約', '約'
+])))
+
 def convert_chinese_numerals(text: str) -> str:
     """
     將中文數字轉換為阿拉伯數字
@@ -315,19 +311,12 @@ def convert_chinese_numerals(text: str) -> str:
         
         >>> convert_chinese_numerals("十二點")
         "12點"
+        
+        >>> convert_chinese_numerals("二十一點")
+        "21點"
     """
-    result = text
-    
-    # 先處理 "十X" 格式（如 十一→11, 十二→12）
-    for cn, ar in [('十二', '12'), ('十一', '11'), ('十', '10')]:
-        result = result.replace(cn, ar)
-    
-    # 再處理單個中文數字
-    for cn, ar in CHINESE_NUMERALS.items():
-        if cn not in ['十', '十一', '十二']:  # 避免重複處理
-            result = result.replace(cn, ar)
-    
-    return result
+    # 以 slot_extractor 的數字文法整段轉換（支援 0-99，如「二十」「二十一」）
+    return convert_numerals(text)
 
 def is_valid_time_format(time_str: str) -> bool:
     """
@@ -348,40 +337,25 @@ def is_valid_time_format(time_str: str) -> bool:
     Returns:
         True 如果是有效的時間格式
     """
-    # 清理輸入
-    clean = time_str.strip()
+    # 清理輸入（全形轉半形，例如「１５：００」）
+    clean = unicodedata.normalize('NFKC', time_str).strip()
     
     # 排除：純數字（8 位以上可能是訂單編號）
-    digits_only = re.sub(r'\D', '', clean)
+    digits_only = NON_DIGIT_PATTERN.sub('', clean)
     if digits_only and len(digits_only) >= 8:
         return False
     
     # 排除：日期格式
-    if re.search(r'\d{1,2}/\d{1,2}', clean) or re.search(r'\d{4}-\d{2}-\d{2}', clean):
+    if DATE_PATTERN.search(clean):
         return False
     
-    # 時間關鍵字白名單（先用原始訊息匹配，避免「等一下」變「等1下」）
-    time_keywords = [
-        '點', '時', ':', 
-        '上午', '下午', '中午', '晚上', '傍晚', '早上', '凌晨',
-        '等一下', '等下', '馬上', '待會', '稀候', '稍後', '現在',
-        '左右', '前後', '大約', '約'
-    ]
-    
-    # 先用原始訊息匹配
-    if any(kw in clean for kw in time_keywords):
+    # 時間關鍵字白名單（「三點」的「點」不需先轉換數字即可命中）
+    if TIME_KEYWORD_PATTERN.search(clean):
         return True
     
-    # 再轉換中文數字後匹配（處理「三點」變「3點」）
-    normalized = convert_chinese_numerals(clean)
-    if any(kw in normalized for kw in time_keywords):
-        return True
-    
-    # 檢查 24 小時格式：14:00、3:30
-    if re.search(r'\d{1,2}:\d{2}', normalized):
-        return True
-    
-    return False
+    # 具體時間（14:00、3pm）或相對時間（10分鐘後）
+    slots = extract_slots(time_str)
+    return slots.arrival_hhmm is not None or slots.arrival_relative
 
 def validate_arrival_time(time_str: str) -> Optional[str]:
     """
@@ -414,8 +388,8 @@ def validate_arrival_time(time_str: str) -> Optional[str]:
     if not is_valid_time_format(time_str):
         return None
     
-    # 2. 標準化：轉換中文數字
-    normalized = convert_chinese_numerals(time_str.strip())
+    # 2. 標準化：全形轉半形、轉換時間單位前後的中文數字（「等一下」維持原樣）
+    normalized = convert_time_numerals(unicodedata.normalize('NFKC', time_str).strip())
     
     # 3. 清理多餘空白
     normalized = ' '.join(normalized.split())
@@ -438,22 +412,6 @@ def is_vague_time(time_str: str) -> bool:
     if not time_str:
         return True
     
-    # 先標準化
-    normalized = convert_chinese_numerals(time_str)
-    
-    # 模糊關鍵字（只有時段，沒有具體時間）
-    vague_keywords = ['下午', '上午', '晚上', '傍晚', '早上', '中午', '凌晨']
-    
-    # 具體時間指標
-    specific_indicators = ['點', '時', ':']
-    
-    # 如果有模糊關鍵字但沒有具體時間指標 → 模糊
-    has_vague = any(kw in normalized for kw in vague_keywords)
-    has_specific = any(ind in normalized for ind in specific_indicators)
-    
-    # 特殊情況：「等一下」「馬上」「待會」視為具體（表示很快到）
-    soon_keywords = ['等一下', '馬上', '待會', '稍後', '現在', '快到']
-    if any(kw in normalized for kw in soon_keywords):
-        return False
-    
-    return has_vague and not has_specific
+    # 有時段（下午、晚上…）但沒有幾點 → 模糊；
+    # 「等一下」「馬上」「待會」等相對時間視為具體（表示很快到）
+    return extract_slots(time_str).arrival_vague
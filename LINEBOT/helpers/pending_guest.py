@@ -5,18 +5,31 @@ Pending Guest Manager - 暫存客人資料管理器
 之後訂單成功查詢時再自動匹配並合併。
 
 暫存期限：7 天
+
+啟動時載入 pending_guests.json 一次，之後都在記憶體中操作：
+- 依 user_id 建立索引，查詢不必掃描全部資料
+- 過期清理使用依建立時間排序的 heap，只檢查最舊的幾筆
+- 寫檔延遲到背景執行緒批次進行（暫存檔 + os.replace，不會寫到一半）
 """
 
 import os
 import json
+import time
+import heapq
+import atexit
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 
 class PendingGuestManager:
     """暫存客人資料管理器"""
     
     # 暫存期限（天）
     EXPIRY_DAYS = 7
+    # 延遲寫入：每隔幾秒寫一次檔（有變更時）
+    FLUSH_INTERVAL_SECONDS = 2
     
     def __init__(self, data_dir: Optional[str] = None):
         """初始化"""
@@ -27,9 +40,25 @@ class PendingGuestManager:
         
         self.data_file = os.path.join(data_dir, "pending_guests.json")
         self._ensure_file_exists()
+
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()  # 確保寫檔依序進行，舊內容不會蓋掉新內容
+        self._dirty = False
+        self._flush_event = threading.Event()
+
+        # 記憶體資料與索引
+        self._data: Dict[str, Dict[str, Any]] = self._load_data()
+        self._by_user: Dict[str, set] = {}   # user_id → key 集合
+        self._created: Dict[str, float] = {}  # key → 建立時間（epoch，只解析一次）
+        self._expiry_heap: List[tuple] = []   # (建立時間, key)，依時間排序
+        for key, value in self._data.items():
+            self._index(key, value)
         
         # 啟動時清理過期資料
         self._cleanup_expired()
+
+        threading.Thread(target=self._flush_loop, name='pending-guest-flush', daemon=True).start()
+        atexit.register(self.flush)
     
     def _ensure_file_exists(self):
         """確保暫存檔案存在"""
@@ -39,35 +68,79 @@ class PendingGuestManager:
                 json.dump({}, f)
     
     def _load_data(self) -> Dict:
-        """載入暫存資料"""
+        """載入暫存資料（僅啟動時讀檔一次）"""
         try:
             with open(self.data_file, 'r', encoding='utf-8') as f:
                 return json.load(f)
         except (json.JSONDecodeError, FileNotFoundError):
             return {}
-    
-    def _save_data(self, data: Dict):
-        """儲存暫存資料"""
-        with open(self.data_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+
+    def _index(self, key: str, value: Dict[str, Any]):
+        """將一筆資料加入索引"""
+        self._by_user.setdefault(value.get('user_id', ''), set()).add(key)
+        if key not in self._created:
+            try:
+                created = datetime.strptime(value.get('created_at', ''), '%Y-%m-%d %H:%M:%S').timestamp()
+            except ValueError:
+                created = time.time()
+            self._created[key] = created
+            heapq.heappush(self._expiry_heap, (created, key))
+
+    def _remove(self, key: str):
+        """從資料與索引移除（heap 中的舊項目於清理時略過）"""
+        value = self._data.pop(key, None)
+        if value is None:
+            return
+        self._by_user.get(value.get('user_id', ''), set()).discard(key)
+        self._created.pop(key, None)
+
+    def _mark_dirty(self):
+        self._dirty = True
+        self._flush_event.set()
+
+    def flush(self):
+        """立即將暫存資料寫入檔案（原子寫入）"""
+        with self._write_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                snapshot = json.dumps(self._data, ensure_ascii=False, indent=2)
+                self._dirty = False
+            tmp_path = f"{self.data_file}.tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(snapshot)
+                os.replace(tmp_path, self.data_file)
+            except OSError as e:
+                # 重新標記並喚醒背景執行緒，下一輪重試
+                with self._lock:
+                    self._mark_dirty()
+                print(f"⚠️ 暫存資料寫入失敗: {e}")
+
+    def _flush_loop(self):
+        """背景執行緒：有變更時每 FLUSH_INTERVAL_SECONDS 秒寫一次檔"""
+        while True:
+            self._flush_event.wait()
+            time.sleep(self.FLUSH_INTERVAL_SECONDS)
+            self._flush_event.clear()
+            self.flush()
     
     def _cleanup_expired(self):
-        """清理過期的暫存資料"""
-        data = self._load_data()
-        now = datetime.now()
-        cutoff = now - timedelta(days=self.EXPIRY_DAYS)
-        
-        expired_keys = []
-        for key, value in data.items():
-            created_at = datetime.strptime(value.get('created_at', ''), '%Y-%m-%d %H:%M:%S')
-            if created_at < cutoff:
-                expired_keys.append(key)
-        
-        if expired_keys:
-            for key in expired_keys:
-                del data[key]
-            self._save_data(data)
-            print(f"🗑️ 已清理 {len(expired_keys)} 筆過期的暫存資料")
+        """清理過期的暫存資料（只檢查 heap 頂端最舊的項目）"""
+        cutoff = (datetime.now() - timedelta(days=self.EXPIRY_DAYS)).timestamp()
+        expired = 0
+        with self._lock:
+            while self._expiry_heap and self._expiry_heap[0][0] < cutoff:
+                created, key = heapq.heappop(self._expiry_heap)
+                # 已移除或重新建立的項目，heap 中的舊記錄直接略過
+                if self._created.get(key) != created:
+                    continue
+                self._remove(key)
+                expired += 1
+            if expired:
+                self._mark_dirty()
+        if expired:
+            print(f"🗑️ 已清理 {expired} 筆過期的暫存資料")
     
     def save_pending(self, user_id: str, order_id: str, guest_name: str = "",
                      phone: str = "", arrival_time: str = "", 
@@ -86,26 +159,28 @@ class PendingGuestManager:
         Returns:
             儲存成功返回 True
         """
-        data = self._load_data()
-        
+        self._cleanup_expired()
         key = f"{user_id}:{order_id}"
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
-        # 如果已存在，合併資料（保留非空值）
-        existing = data.get(key, {})
-        
-        data[key] = {
-            "user_id": user_id,
-            "provided_order_id": order_id,
-            "guest_name": guest_name or existing.get('guest_name', ''),
-            "phone": phone or existing.get('phone', ''),
-            "arrival_time": arrival_time or existing.get('arrival_time', ''),
-            "special_requests": special_requests or existing.get('special_requests', ''),
-            "created_at": existing.get('created_at', datetime.now().strftime('%Y-%m-%d %H:%M:%S')),
-            "updated_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            "status": "pending"
-        }
-        
-        self._save_data(data)
+        with self._lock:
+            # 如果已存在，合併資料（保留非空值）
+            existing = self._data.get(key, {})
+            
+            self._data[key] = {
+                "user_id": user_id,
+                "provided_order_id": order_id,
+                "guest_name": guest_name or existing.get('guest_name', ''),
+                "phone": phone or existing.get('phone', ''),
+                "arrival_time": arrival_time or existing.get('arrival_time', ''),
+                "special_requests": special_requests or existing.get('special_requests', ''),
+                "created_at": existing.get('created_at', now),
+                "updated_at": now,
+                "status": "pending"
+            }
+            self._index(key, self._data[key])
+            self._mark_dirty()
+
         print(f"📝 已暫存客人資料: user={user_id[:12]}..., order={order_id}")
         return True
     
@@ -124,46 +199,52 @@ class PendingGuestManager:
         Returns:
             匹配的暫存資料，無則返回 None
         """
-        data = self._load_data()
-        
-        for key, value in data.items():
-            if value.get('status') != 'pending':
-                continue
-            if value.get('user_id') != user_id:
-                continue
-            
-            provided_id = value.get('provided_order_id', '')
-            # 檢查 OTA ID 是否包含客人提供的 ID
-            if provided_id and provided_id in (ota_booking_id or ''):
-                return value
+        self._cleanup_expired()
+        with self._lock:
+            # 只檢查該用戶自己的暫存資料
+            for key in self._by_user.get(user_id, ()):
+                value = self._data[key]
+                if value.get('status') != 'pending':
+                    continue
+                
+                provided_id = value.get('provided_order_id', '')
+                # 檢查 OTA ID 是否包含客人提供的 ID
+                if provided_id and provided_id in (ota_booking_id or ''):
+                    return dict(value)
         
         return None
+
+    def list_pending(self) -> List[Dict]:
+        """取得所有未匹配的暫存資料（複本）"""
+        self._cleanup_expired()
+        with self._lock:
+            return [dict(value) for value in self._data.values() if value.get('status') == 'pending']
     
     def mark_matched(self, user_id: str, order_id: str):
         """標記為已匹配"""
-        data = self._load_data()
         key = f"{user_id}:{order_id}"
         
-        if key in data:
-            data[key]['status'] = 'matched'
-            data[key]['matched_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            self._save_data(data)
-            print(f"✅ 已標記暫存資料為已匹配: {key}")
+        with self._lock:
+            if key not in self._data:
+                return
+            self._data[key]['status'] = 'matched'
+            self._data[key]['matched_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            self._mark_dirty()
+        print(f"✅ 已標記暫存資料為已匹配: {key}")
     
     def get_pending_by_user(self, user_id: str) -> Optional[Dict]:
         """取得用戶最新的未匹配暫存資料"""
-        data = self._load_data()
-        
-        pending_list = []
-        for key, value in data.items():
-            if value.get('user_id') == user_id and value.get('status') == 'pending':
-                pending_list.append(value)
-        
-        if not pending_list:
-            return None
-        
-        # 返回最新的
-        return sorted(pending_list, key=lambda x: x.get('updated_at', ''), reverse=True)[0]
+        with self._lock:
+            pending_list = [
+                self._data[key] for key in self._by_user.get(user_id, ())
+                if self._data[key].get('status') == 'pending'
+            ]
+            
+            if not pending_list:
+                return None
+            
+            # 返回最新的
+            return dict(max(pending_list, key=lambda x: x.get('updated_at', '')))
 
 
 # 單例模式
@@ -177,12 +258,229 @@ def get_pending_guest_manager() -> PendingGuestManager:
     return _pending_guest_manager
 
 
+class PendingMatchRetrier:
+    """
+    暫存資料背景重試匹配
+
+    OTA 訂單可能在一天中任何時間才同步到 PMS，因此定期重新查詢：
+    - 有限的執行緒池並行查詢 PMS（不會一次打爆 API）
+    - 每筆暫存資料各自指數退避（5 分鐘起跳，最長 6 小時）
+    - 超過暫存期限（EXPIRY_DAYS）就放棄，與暫存資料一起過期
+    """
+
+    POLL_SECONDS = 60              # 檢查到期項目的間隔
+    BASE_DELAY_SECONDS = 300       # 第一次失敗後的等待時間
+    MAX_DELAY_SECONDS = 6 * 3600   # 退避上限
+    MAX_WORKERS = 4                # 同時查詢 PMS 的上限
+
+    def __init__(self, pms_client, logger, manager: Optional[PendingGuestManager] = None):
+        self.pms_client = pms_client
+        self.logger = logger
+        self.manager = manager or get_pending_guest_manager()
+        self._pool = ThreadPoolExecutor(max_workers=self.MAX_WORKERS, thread_name_prefix='pending-match')
+        self._lock = threading.Lock()
+        self._thread = None
+        # key → {'attempts', 'next_retry_at', 'updated_at'}
+        self._backoff: Dict[str, Dict[str, Any]] = {}
+        self.stats = {
+            'runs': 0,
+            'attempts': 0,
+            'matched': 0,
+            'errors': 0,
+            'given_up': 0,
+            'match_latencies': deque(maxlen=200),  # 暫存 → 匹配成功經過的秒數
+            'match_attempts': deque(maxlen=200),   # 匹配成功前的查詢次數
+        }
+
+    @staticmethod
+    def _key(entry: Dict[str, Any]) -> str:
+        return f"{entry.get('user_id')}:{entry.get('provided_order_id')}"
+
+    @staticmethod
+    def _created_epoch(entry: Dict[str, Any]) -> float:
+        try:
+            return datetime.strptime(entry.get('created_at', ''), '%Y-%m-%d %H:%M:%S').timestamp()
+        except ValueError:
+            return time.time()
+
+    def _due_entries(self, force: bool = False) -> List[Dict[str, Any]]:
+        """取得本輪該重試的暫存資料"""
+        now = time.time()
+        horizon = PendingGuestManager.EXPIRY_DAYS * 86400
+        due = []
+        with self._lock:
+            pending = self.manager.list_pending()
+            pending_keys = {self._key(entry) for entry in pending}
+            # 已匹配 / 已過期的項目不再追蹤
+            for key in list(self._backoff):
+                if key not in pending_keys:
+                    del self._backoff[key]
+
+            for entry in pending:
+                if not entry.get('provided_order_id'):
+                    continue
+                key = self._key(entry)
+                state = self._backoff.get(key)
+                # 客人補充資料（updated_at 變動）時重新開始退避
+                if state is None or state['updated_at'] != entry.get('updated_at'):
+                    state = self._backoff[key] = {'attempts': 0, 'next_retry_at': 0, 'updated_at': entry.get('updated_at')}
+                if now - self._created_epoch(entry) > horizon:
+                    if state.get('next_retry_at') != float('inf'):
+                        state['next_retry_at'] = float('inf')
+                        self.stats['given_up'] += 1
+                    continue
+                if force or state['next_retry_at'] <= now:
+                    due.append(entry)
+        return due
+
+    def _schedule_next(self, entry: Dict[str, Any]):
+        """查詢失敗：指數退避到下一次重試"""
+        with self._lock:
+            state = self._backoff.get(self._key(entry))
+            if state is None:
+                return
+            state['attempts'] += 1
+            delay = min(self.BASE_DELAY_SECONDS * 2 ** (state['attempts'] - 1), self.MAX_DELAY_SECONDS)
+            state['next_retry_at'] = time.time() + delay
+
+    def _try_match(self, entry: Dict[str, Any]) -> bool:
+        """查詢 PMS，找到訂單則同步資料並標記為已匹配"""
+        from helpers.order_helper import sync_order_details
+
+        order_id = entry.get('provided_order_id')
+        user_id = entry.get('user_id')
+        with self._lock:
+            self.stats['attempts'] += 1
+
+        try:
+            result = self.pms_client.get_booking_details(order_id)
+        except Exception as e:
+            print(f"⚠️ [Retry] 查詢失敗 {order_id}: {e}")
+            with self._lock:
+                self.stats['errors'] += 1
+            self._schedule_next(entry)
+            return False
+
+        if not (result and result.get('success')):
+            self._schedule_next(entry)
+            return False
+
+        pms_data = result.get('data', {})
+        pms_id = pms_data.get('booking_id')
+        ota_id = pms_data.get('ota_booking_id', order_id)
+
+        print(f"🔄 [Retry] 找到匹配: {order_id} → PMS:{pms_id}")
+
+        try:
+            # 同步資料
+            sync_order_details(
+                order_id=pms_id,
+                data={
+                    "guest_name": entry.get('guest_name'),
+                    "phone": entry.get('phone'),
+                    "arrival_time": entry.get('arrival_time'),
+                    "line_user_id": user_id,
+                    "display_name": entry.get('line_display_name'),
+                    "special_requests": entry.get('special_requests', '').split('; ') if entry.get('special_requests') else []
+                },
+                logger=self.logger,
+                pms_client=self.pms_client,
+                ota_id=ota_id
+            )
+        except Exception as e:
+            print(f"⚠️ [Retry] 同步失敗 {order_id}: {e}")
+            with self._lock:
+                self.stats['errors'] += 1
+            self._schedule_next(entry)
+            return False
+
+        # 標記為已匹配
+        self.manager.mark_matched(user_id, order_id)
+        with self._lock:
+            state = self._backoff.pop(self._key(entry), {'attempts': 0})
+            self.stats['matched'] += 1
+            self.stats['match_latencies'].append(time.time() - self._created_epoch(entry))
+            self.stats['match_attempts'].append(state['attempts'] + 1)
+        return True
+
+    def run_once(self, force: bool = False) -> int:
+        """
+        執行一輪重試（並行查詢，等待本輪全部完成）
+
+        Args:
+            force: 忽略退避時間，所有暫存資料都查一次
+
+        Returns:
+            本輪成功匹配的數量
+        """
+        due = self._due_entries(force)
+        with self._lock:
+            self.stats['runs'] += 1
+        if not due:
+            return 0
+
+        matched_count = sum(1 for ok in self._pool.map(self._try_match, due) if ok)
+        if matched_count > 0:
+            print(f"✅ [Retry] 本次重試成功匹配 {matched_count} 筆資料")
+        return matched_count
+
+    def start(self):
+        """啟動背景重試執行緒（重複呼叫不會重複啟動）"""
+        if self._thread and self._thread.is_alive():
+            return
+
+        def _loop():
+            while True:
+                try:
+                    self.run_once()
+                except Exception as e:
+                    print(f"⚠️ [Retry] 重試匹配失敗: {e}")
+                time.sleep(self.POLL_SECONDS)
+
+        self._thread = threading.Thread(target=_loop, name='pending-match-retry', daemon=True)
+        self._thread.start()
+        print(f"🔄 暫存資料重試匹配已啟動 (每 {self.POLL_SECONDS} 秒檢查，並行 {self.MAX_WORKERS})")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """重試統計：查詢 / 匹配 / 錯誤次數、等待中筆數、平均匹配延遲與查詢次數"""
+        with self._lock:
+            latencies = list(self.stats['match_latencies'])
+            attempts = list(self.stats['match_attempts'])
+            return {
+                'runs': self.stats['runs'],
+                'attempts': self.stats['attempts'],
+                'matched': self.stats['matched'],
+                'errors': self.stats['errors'],
+                'given_up': self.stats['given_up'],
+                'waiting': sum(1 for state in self._backoff.values() if state['next_retry_at'] != float('inf')),
+                'avg_match_latency_seconds': round(sum(latencies) / len(latencies), 1) if latencies else None,
+                'avg_match_attempts': round(sum(attempts) / len(attempts), 2) if attempts else None,
+            }
+
+
+_pending_match_retrier = None
+
+def start_pending_match_retrier(pms_client, logger) -> PendingMatchRetrier:
+    """啟動背景重試匹配（單例）"""
+    global _pending_match_retrier
+    if _pending_match_retrier is None:
+        _pending_match_retrier = PendingMatchRetrier(pms_client, logger)
+    _pending_match_retrier.start()
+    return _pending_match_retrier
+
+
+def get_pending_match_retrier() -> Optional[PendingMatchRetrier]:
+    """取得背景重試匹配實例（尚未啟動回傳 None）"""
+    return _pending_match_retrier
+
+
 def retry_pending_matches(pms_client, logger) -> int:
     """
     🔧 方案 C：延遲重試機制
     
-    定期重新嘗試匹配暫存資料與 PMS API。
+    立即重新嘗試匹配所有暫存資料與 PMS API（忽略退避時間）。
     當之前查無訂單的資料，現在 PMS 已同步時，自動完成關聯。
+    定期重試請改用 start_pending_match_retrier()。
     
     Args:
         pms_client: PMS API 客戶端
@@ -191,59 +489,5 @@ def retry_pending_matches(pms_client, logger) -> int:
     Returns:
         成功匹配的數量
     """
-    from helpers.order_helper import sync_order_details
-    
-    manager = get_pending_guest_manager()
-    data = manager._load_data()
-    
-    matched_count = 0
-    
-    for key, value in list(data.items()):
-        if value.get('status') != 'pending':
-            continue
-        
-        order_id = value.get('provided_order_id')
-        user_id = value.get('user_id')
-        
-        if not order_id:
-            continue
-        
-        # 嘗試查詢 PMS
-        try:
-            result = pms_client.get_booking_details(order_id)
-            
-            if result and result.get('success'):
-                pms_data = result.get('data', {})
-                pms_id = pms_data.get('booking_id')
-                ota_id = pms_data.get('ota_booking_id', order_id)
-                
-                print(f"🔄 [Retry] 找到匹配: {order_id} → PMS:{pms_id}")
-                
-                # 同步資料
-                sync_order_details(
-                    order_id=pms_id,
-                    data={
-                        "guest_name": value.get('guest_name'),
-                        "phone": value.get('phone'),
-                        "arrival_time": value.get('arrival_time'),
-                        "line_user_id": user_id,
-                        "display_name": value.get('line_display_name'),
-                        "special_requests": value.get('special_requests', '').split('; ') if value.get('special_requests') else []
-                    },
-                    logger=logger,
-                    pms_client=pms_client,
-                    ota_id=ota_id
-                )
-                
-                # 標記為已匹配
-                manager.mark_matched(user_id, order_id)
-                matched_count += 1
-                
-        except Exception as e:
-            print(f"⚠️ [Retry] 查詢失敗 {order_id}: {e}")
-            continue
-    
-    if matched_count > 0:
-        print(f"✅ [Retry] 本次重試成功匹配 {matched_count} 筆資料")
-    
-    return matched_count
+    retrier = _pending_match_retrier or PendingMatchRetrier(pms_client, logger)
+    return retrier.run_once(force=True)
@@ -0,0 +1,181 @@
+"""
+Report Cache - 內部報表每日統計快取（每日住房快照）
+
+快取 InternalQueryHandler 每日彙總結果（筆數、間數、房型分布、來源統計、住房率），
+持久化到 data/report_cache.json，重啟後仍有效。
+
+快取規則：
+- 已過日期：訂單不會再變動，在日期結束後計算的結果永久有效
+- 今日 / 未來日期：仍可能變動，只保留 TTL（報表即時查詢用預設 TTL，
+  背景排程刷新的快照則以刷新週期為 TTL）
+"""
+
+import os
+import json
+import threading
+from datetime import datetime
+from typing import Optional, Dict, Any, Iterable
+
+
+class ReportCache:
+    """內部報表每日統計快取"""
+
+    # 今日 / 未來日期的快取時間（秒）
+    VOLATILE_TTL_SECONDS = 5 * 60
+    # 統計格式版本：彙總欄位或算法改變時遞增，舊版本的快取（含永久有效的已過日期）一律重算
+    # v2：住房率改以當晚在住間數計算
+    STATS_VERSION = 2
+
+    def __init__(self, data_dir: Optional[str] = None):
+        """初始化"""
+        if data_dir is None:
+            current_dir = os.path.dirname(os.path.abspath(__file__))
+            project_root = os.path.dirname(os.path.dirname(current_dir))
+            data_dir = os.path.join(project_root, "data")
+
+        self.data_file = os.path.join(data_dir, "report_cache.json")
+        self._lock = threading.Lock()
+        self._entries = self._load_data()
+
+    def _load_data(self) -> Dict[str, Dict[str, Any]]:
+        """載入快取檔案"""
+        try:
+            with open(self.data_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, FileNotFoundError):
+            return {}
+
+    def _save_data(self):
+        """寫入快取檔案（暫存檔 + rename，避免寫到一半損毀）"""
+        os.makedirs(os.path.dirname(self.data_file), exist_ok=True)
+        tmp_file = f"{self.data_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self._entries, f, ensure_ascii=False)
+        os.replace(tmp_file, self.data_file)
+
+    def _is_valid(self, date_str: str, entry: Dict[str, Any], now: datetime) -> bool:
+        """
+        判斷快取項目是否仍有效
+
+        在該日期「結束之後」計算的已過日期結果永久有效；
+        其餘（今日、未來、或在當天就算好的昨日資料）只在 TTL 內有效。
+        """
+        if entry.get('version') != self.STATS_VERSION:
+            return False
+        if self._is_final(date_str, entry, now):
+            return True
+        cached_at = self._parse_cached_at(entry)
+        if cached_at is None:
+            return False
+        ttl = entry.get('ttl') or self.VOLATILE_TTL_SECONDS
+        return (now - cached_at).total_seconds() < ttl
+
+    def _is_final(self, date_str: str, entry: Dict[str, Any], now: datetime) -> bool:
+        """是否為已過日期、且在該日結束後計算的最終結果"""
+        cached_at = self._parse_cached_at(entry)
+        if cached_at is None or entry.get('version') != self.STATS_VERSION:
+            return False
+        return cached_at.strftime('%Y-%m-%d') > date_str and date_str < now.strftime('%Y-%m-%d')
+
+    def _parse_cached_at(self, entry: Dict[str, Any]) -> Optional[datetime]:
+        """解析快取時間"""
+        try:
+            return datetime.strptime(entry.get('cached_at', ''), '%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            return None
+
+    def get(self, date_str: str) -> Optional[Dict[str, Any]]:
+        """
+        取得某日統計
+
+        Args:
+            date_str: 日期字串 (YYYY-MM-DD)
+
+        Returns:
+            統計 dict，無快取或已過期返回 None
+        """
+        with self._lock:
+            entry = self._entries.get(date_str)
+            if entry and self._is_valid(date_str, entry, datetime.now()):
+                return entry.get('stats')
+        return None
+
+    def get_many(self, date_strs: Iterable[str], final_only: bool = False) -> Dict[str, Dict[str, Any]]:
+        """
+        取得多日統計，只回傳仍有效的日期
+
+        Args:
+            date_strs: 日期字串列表
+            final_only: True 時只回傳永久有效的已過日期（排程刷新用）
+        """
+        now = datetime.now()
+        check = self._is_final if final_only else self._is_valid
+        result = {}
+        with self._lock:
+            for date_str in date_strs:
+                entry = self._entries.get(date_str)
+                if entry and check(date_str, entry, now):
+                    result[date_str] = entry.get('stats')
+        return result
+
+    def set_many(self, stats_by_date: Dict[str, Dict[str, Any]], ttl_seconds: Optional[int] = None):
+        """
+        批次寫入多日統計（一次寫檔）
+
+        Args:
+            stats_by_date: {日期字串: 統計 dict}
+            ttl_seconds: 今日 / 未來日期的有效秒數，None 使用 VOLATILE_TTL_SECONDS
+        """
+        if not stats_by_date:
+            return
+
+        now = datetime.now()
+        cached_at = now.strftime('%Y-%m-%d %H:%M:%S')
+        with self._lock:
+            for date_str, stats in stats_by_date.items():
+                entry = {'cached_at': cached_at, 'version': self.STATS_VERSION, 'stats': stats}
+                if ttl_seconds:
+                    entry['ttl'] = ttl_seconds
+                self._entries[date_str] = entry
+
+            # 順手清掉已失效的項目，避免檔案累積過期的未來日期資料
+            expired = [d for d, e in self._entries.items() if not self._is_valid(d, e, now)]
+            for date_str in expired:
+                del self._entries[date_str]
+
+            try:
+                self._save_data()
+            except Exception as e:
+                print(f"⚠️ 報表快取寫入失敗: {e}")
+
+    def set(self, date_str: str, stats: Dict[str, Any], ttl_seconds: Optional[int] = None):
+        """寫入單日統計"""
+        self.set_many({date_str: stats}, ttl_seconds)
+
+    def invalidate(self, date_str: Optional[str] = None):
+        """
+        清除快取
+
+        Args:
+            date_str: 指定日期，若為 None 則清除全部
+        """
+        with self._lock:
+            if date_str:
+                self._entries.pop(date_str, None)
+            else:
+                self._entries.clear()
+            try:
+                self._save_data()
+            except Exception as e:
+                print(f"⚠️ 報表快取寫入失敗: {e}")
+
+
+# 單例模式
+_report_cache = None
+
+def get_report_cache() -> ReportCache:
+    """取得 ReportCache 單例"""
+    global _report_cache
+    if _report_cache is None:
+        _report_cache = ReportCache()
+    return _report_cache
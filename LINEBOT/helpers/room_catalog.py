@@ -0,0 +1,123 @@
+"""
+Room Catalog - 房型 / 房號目錄 (SSOT)
+
+統一讀取 data/room_catalog.json，取代散落各處的房型對照表：
+- 房號 → 房型代碼 → 中文名稱
+- 可升等房型矩陣（依容納人數）
+- 無障礙房型
+
+啟動時載入一次並建立索引，之後每次查詢都是 O(1) 字典查找；
+檔案修改後（mtime 變更）會自動重新載入：先建好新的索引 dict，再在鎖內一次換上，
+查詢中的執行緒不會讀到清空一半的資料。索引會被整個換掉，請透過方法查詢，不要保存 dict 的引用。
+"""
+
+import os
+import json
+import time
+import threading
+from typing import Optional, Dict, List
+
+
+class RoomCatalog:
+    """房型 / 房號目錄"""
+
+    # 檢查檔案是否變更的間隔（秒）
+    RELOAD_CHECK_SECONDS = 30
+
+    def __init__(self, catalog_file: Optional[str] = None):
+        """初始化"""
+        if catalog_file is None:
+            current_dir = os.path.dirname(os.path.abspath(__file__))
+            project_root = os.path.dirname(os.path.dirname(current_dir))
+            catalog_file = os.path.join(project_root, "data", "room_catalog.json")
+
+        self.catalog_file = catalog_file
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._last_check = 0.0
+
+        # 索引（重新載入時整個換成新的 dict）
+        self.room_types: Dict[str, Dict[str, str]] = {}   # 代碼 → {'zh', 'short', 'en'}
+        self.type_names: Dict[str, str] = {}              # 代碼 → 中文名稱
+        self.type_by_room: Dict[str, str] = {}            # 房號 → 代碼
+        self.upgradable: Dict[int, List[str]] = {}        # 容納人數 → 可用房型代碼
+        self.accessible: frozenset = frozenset()          # 無障礙房型代碼
+
+        with self._lock:
+            self._load()
+
+    def _load(self):
+        """載入目錄檔案並重建索引（呼叫端需持有 lock）"""
+        try:
+            mtime = os.path.getmtime(self.catalog_file)
+            with open(self.catalog_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"⚠️ 房型目錄載入失敗: {e}")
+            return
+
+        room_types = data.get('room_types', {})
+        type_names = {code: t.get('zh', code) for code, t in room_types.items()}
+        type_by_room = {str(no).strip(): code for no, code in data.get('rooms', {}).items()}
+        upgradable = {int(cap): codes for cap, codes in data.get('upgradable', {}).items()}
+        accessible = frozenset(data.get('accessible', []))
+
+        # 新索引建好後才換上
+        self.room_types = room_types
+        self.type_names = type_names
+        self.type_by_room = type_by_room
+        self.upgradable = upgradable
+        self.accessible = accessible
+
+        self._mtime = mtime
+        print(f"🏨 房型目錄已載入: {len(self.room_types)} 種房型 / {len(self.type_by_room)} 間房")
+
+    def check_reload(self):
+        """檔案有變更時重新載入（每 RELOAD_CHECK_SECONDS 最多檢查一次）"""
+        now = time.time()
+        if now - self._last_check < self.RELOAD_CHECK_SECONDS:
+            return
+        with self._lock:
+            if now - self._last_check < self.RELOAD_CHECK_SECONDS:
+                return
+            self._last_check = now
+            try:
+                mtime = os.path.getmtime(self.catalog_file)
+            except OSError:
+                return
+            if mtime != self._mtime:
+                self._load()
+
+    @property
+    def total_rooms(self) -> int:
+        """總房數"""
+        self.check_reload()
+        return len(self.type_by_room)
+
+    def get_type_code(self, room_no) -> str:
+        """房號 → 房型代碼，查無回傳空字串"""
+        self.check_reload()
+        return self.type_by_room.get(str(room_no).strip(), '')
+
+    def get_type_name(self, code: str, default: Optional[str] = None) -> str:
+        """房型代碼 → 中文名稱，查無回傳 default（預設為代碼本身或「未知房型」）"""
+        self.check_reload()
+        code = (code or '').strip().upper()
+        if default is None:
+            default = code or '未知房型'
+        return self.type_names.get(code, default)
+
+    def get_upgradable_codes(self, capacity: int, default: Optional[List[str]] = None) -> List[str]:
+        """取得可滿足該容納人數的房型代碼（可升等矩陣）"""
+        self.check_reload()
+        return self.upgradable.get(capacity, default if default is not None else [])
+
+# 單例模式
+_room_catalog = None
+
+def get_room_catalog() -> RoomCatalog:
+    """取得 RoomCatalog 單例"""
+    global _room_catalog
+    if _room_catalog is None:
+        _room_catalog = RoomCatalog()
+    return _room_catalog
@@ -0,0 +1,204 @@
+"""
+Session Store - 對話狀態持久化後端
+
+ConversationStateMachine 透過這裡的介面讀寫 session，可替換的實作：
+- BackendSessionStore：ktw-backend API（/api/bot/sessions，後台可看到進行中流程）
+- SQLiteSessionStore：本機 SQLite（data/bot_sessions.db），不依賴網路，
+  啟動時可一次預載所有進行中的 session，重啟後第一則訊息不必等 HTTP 載入
+
+以環境變數 SESSION_STORE 選擇：
+- backend（預設）：只使用 ktw-backend
+- sqlite：本機 SQLite 為主，並同步一份到 ktw-backend 供後台顯示（後台離線不影響 Bot）
+"""
+
+import os
+import json
+import sqlite3
+import threading
+import requests
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List
+
+
+class SessionStore(ABC):
+    """持久化後端介面"""
+
+    name = 'base'
+
+    @abstractmethod
+    def load(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """讀取單一用戶 session，不存在回傳 None"""
+        pass
+
+    @abstractmethod
+    def save(self, user_id: str, payload: Dict[str, Any]) -> bool:
+        """寫入 session（payload 欄位：handler_type, state, data, pending_intent, pending_intent_message, updated_at）"""
+        pass
+
+    @abstractmethod
+    def delete(self, user_id: str) -> bool:
+        """刪除 session"""
+        pass
+
+    def load_active(self, timeout_seconds: int) -> Dict[str, Dict[str, Any]]:
+        """批次讀取所有非 idle、未超時的 session（不支援預載的後端回傳空 dict）"""
+        return {}
+
+
+class BackendSessionStore(SessionStore):
+    """ktw-backend API（SQLite 在後台那一側）"""
+
+    name = 'backend'
+
+    def __init__(self, base_url: Optional[str] = None):
+        # ktw-backend API URL (本地，非 PMS 192.168.8.3)
+        self.base_url = base_url or os.getenv('KTW_BACKEND_URL', 'http://localhost:3000')
+
+    def _url(self, user_id: str) -> str:
+        return f"{self.base_url}/api/bot/sessions/{user_id}"
+
+    def load(self, user_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            response = requests.get(self._url(user_id), timeout=2)
+            if response.ok:
+                result = response.json()
+                if result.get('success') and result.get('data'):
+                    db_session = result['data']
+                    return {
+                        'state': db_session.get('state', 'idle'),
+                        'created_at': db_session.get('created_at', datetime.now().isoformat()),
+                        'updated_at': db_session.get('updated_at', datetime.now().isoformat()),
+                        'data': db_session.get('data', {}),
+                        'pending_intent': db_session.get('pending_intent'),
+                        'pending_intent_message': db_session.get('pending_intent_message'),
+                    }
+        except Exception as e:
+            print(f"⚠️ 載入 Session 失敗: {e}")
+        return None
+
+    def save(self, user_id: str, payload: Dict[str, Any]) -> bool:
+        try:
+            return requests.put(self._url(user_id), json=payload, timeout=2).ok
+        except Exception as e:
+            print(f"⚠️ 同步 Session 失敗: {e}")
+            return False
+
+    def delete(self, user_id: str) -> bool:
+        try:
+            return requests.delete(self._url(user_id), timeout=2).ok
+        except Exception as e:
+            print(f"⚠️ 刪除 Session 失敗: {e}")
+            return False
+
+
+class SQLiteSessionStore(SessionStore):
+    """本機 SQLite（WAL），不依賴 ktw-backend"""
+
+    name = 'sqlite'
+
+    def __init__(self, db_path: Optional[str] = None):
+        if db_path is None:
+            current_dir = os.path.dirname(os.path.abspath(__file__))
+            project_root = os.path.dirname(os.path.dirname(current_dir))
+            db_path = os.path.join(project_root, "data", "bot_sessions.db")
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS sessions (
+                user_id TEXT PRIMARY KEY,
+                handler_type TEXT,
+                state TEXT NOT NULL,
+                data TEXT,
+                pending_intent TEXT,
+                pending_intent_message TEXT,
+                created_at TEXT,
+                updated_at TEXT
+            )
+        ''')
+        # 預載時只掃描進行中的 session
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_state_updated ON sessions (state, updated_at)')
+
+    COLUMNS = ('user_id', 'state', 'data', 'pending_intent', 'pending_intent_message', 'created_at', 'updated_at')
+
+    def _row_to_session(self, row) -> Dict[str, Any]:
+        record = dict(zip(self.COLUMNS, row))
+        return {
+            'state': record['state'],
+            'created_at': record['created_at'],
+            'updated_at': record['updated_at'],
+            'data': json.loads(record['data'] or '{}'),
+            'pending_intent': record['pending_intent'],
+            'pending_intent_message': record['pending_intent_message'],
+        }
+
+    def load(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM sessions WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return self._row_to_session(row) if row else None
+
+    def save(self, user_id: str, payload: Dict[str, Any]) -> bool:
+        now = datetime.now().isoformat()
+        try:
+            with self._lock:
+                self._conn.execute(
+                    '''
+                    INSERT INTO sessions (user_id, handler_type, state, data, pending_intent,
+                                          pending_intent_message, created_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(user_id) DO UPDATE SET
+                        handler_type = excluded.handler_type,
+                        state = excluded.state,
+                        data = excluded.data,
+                        pending_intent = excluded.pending_intent,
+                        pending_intent_message = excluded.pending_intent_message,
+                        updated_at = excluded.updated_at
+                    ''',
+                    (user_id, payload.get('handler_type'), payload.get('state') or 'idle',
+                     json.dumps(payload.get('data') or {}, ensure_ascii=False),
+                     payload.get('pending_intent'), payload.get('pending_intent_message'),
+                     payload.get('created_at') or now, payload.get('updated_at') or now)
+                )
+            return True
+        except sqlite3.Error as e:
+            print(f"⚠️ Session 寫入 SQLite 失敗: {e}")
+            return False
+
+    def delete(self, user_id: str) -> bool:
+        try:
+            with self._lock:
+                self._conn.execute('DELETE FROM sessions WHERE user_id = ?', (user_id,))
+            return True
+        except sqlite3.Error as e:
+            print(f"⚠️ Session 刪除失敗: {e}")
+            return False
+
+    def load_active(self, timeout_seconds: int) -> Dict[str, Dict[str, Any]]:
+        cutoff = (datetime.now() - timedelta(seconds=timeout_seconds)).isoformat()
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM sessions WHERE state != 'idle' AND updated_at >= ?",
+                (cutoff,)
+            ).fetchall()
+        return {row[0]: self._row_to_session(row) for row in rows}
+
+
+def create_session_stores(kind: Optional[str] = None) -> List[SessionStore]:
+    """
+    依 SESSION_STORE 建立持久化後端清單（第一個為主要來源，讀取 / 預載都從它來）
+
+    Returns:
+        backend → [BackendSessionStore]
+        sqlite  → [SQLiteSessionStore, BackendSessionStore]（後者僅供後台顯示）
+    """
+    kind = (kind or os.getenv('SESSION_STORE', 'backend')).lower()
+    if kind == 'sqlite':
+        return [SQLiteSessionStore(), BackendSessionStore()]
+    return [BackendSessionStore()]
@@ -0,0 +1,205 @@
+"""
+Session Sweeper - 記憶體內 session 過期清理
+
+各處理器以 user_id 為 key 保存的 session（狀態機、訂單查詢、當日預訂、AI 對話的
+Gemini chat）原本只會增加、不會移除，長時間執行後累積大量不再使用的 session。
+
+做法：
+- 各 session map 啟動時向 sweeper 註冊，存取 session 時呼叫 touch() 記錄最後使用時間（O(1)）
+- 每個 key 在 heap 中只有一個到期時間；背景執行緒只處理 heap 頂端已到期的項目，
+  若期間曾被 touch 則以新的到期時間放回，否則從 map 移除（不必每次掃描全部 session）
+- get_stats() 提供每個 map 的 session 數與估計記憶體用量
+
+與處理器的同步：
+- 處理器先 touch() 再以 setdefault / get 取 session，移除則用 pop(key, None)，
+  不做「檢查後再索引」，sweeper 同時移除也不會 KeyError
+- touch 與「確認閒置 → 從 map 移除」在同一個 tracker 鎖內，剛被 touch 的 key 不會被移除
+"""
+
+import sys
+import time
+import heapq
+import threading
+from typing import Dict, Any, Optional, Callable, List
+
+
+def _approx_size(obj: Any, depth: int = 4, _seen: Optional[set] = None) -> int:
+    """估計物件佔用的記憶體（遞迴加總容器內容，限制深度避免過大的物件圖）"""
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    size = sys.getsizeof(obj, 0)
+    if depth <= 0:
+        return size
+    # 先複製成 list 再走訪：session 可能正被處理器修改
+    if isinstance(obj, dict):
+        for k, v in list(obj.items()):
+            size += _approx_size(k, depth - 1, _seen) + _approx_size(v, depth - 1, _seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in list(obj):
+            size += _approx_size(item, depth - 1, _seen)
+    elif hasattr(obj, '__dict__'):
+        size += _approx_size(vars(obj), depth - 1, _seen)
+    return size
+
+
+class SessionTracker:
+    """單一 session map 的使用時間追蹤"""
+
+    def __init__(self, sweeper: 'SessionSweeper', name: str, mapping: Dict[str, Any],
+                 idle_seconds: int, on_evict: Optional[Callable[[str], None]] = None):
+        self.sweeper = sweeper
+        self.name = name
+        self.mapping = mapping
+        self.idle_seconds = idle_seconds
+        self.on_evict = on_evict
+        self.last_seen: Dict[str, float] = {}
+        self.evicted = 0
+        self._lock = threading.Lock()
+
+    def touch(self, key: str):
+        """記錄 session 被使用（新的 key 會排入到期 heap）；取 session 前呼叫"""
+        now = time.time()
+        with self._lock:
+            is_new = key not in self.last_seen
+            self.last_seen[key] = now
+        if is_new:
+            self.sweeper._schedule(now + self.idle_seconds, self, key)
+
+    def evict_if_idle(self, key: str, now: float) -> bool:
+        """仍閒置才從 map 移除（與 touch 互斥，移除前剛被使用的 key 保留）"""
+        with self._lock:
+            last_seen = self.last_seen.get(key)
+            if last_seen is None or now - last_seen < self.idle_seconds:
+                return False
+            self.mapping.pop(key, None)
+            del self.last_seen[key]
+            return True
+
+
+class SessionSweeper:
+    """定期清理閒置 session"""
+
+    SWEEP_INTERVAL_SECONDS = 5 * 60
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._heap: List[tuple] = []  # (到期時間, 序號, tracker, key)
+        self._seq = 0
+        self._trackers: Dict[str, SessionTracker] = {}
+        self._thread = None
+
+    def register(self, name: str, mapping: Dict[str, Any], idle_seconds: int,
+                 on_evict: Optional[Callable[[str], None]] = None) -> SessionTracker:
+        """
+        註冊一個 session map
+
+        Args:
+            name: 統計用名稱
+            mapping: session dict（key 為 user_id 或 session key）
+            idle_seconds: 超過多久未使用即移除
+            on_evict: 移除前呼叫；回傳 False 表示暫不移除（下個週期再檢查）
+        """
+        tracker = SessionTracker(self, name, mapping, idle_seconds, on_evict)
+        with self._lock:
+            # 同名重複註冊時加上編號（例如多個相同處理器實例）
+            key, n = name, 2
+            while key in self._trackers:
+                key, n = f"{name}#{n}", n + 1
+            tracker.name = key
+            self._trackers[key] = tracker
+        # 已存在的 session（例如預載）視為剛使用過
+        for existing in list(mapping):
+            tracker.touch(existing)
+        return tracker
+
+    def _schedule(self, due: float, tracker: SessionTracker, key: str):
+        with self._lock:
+            self._seq += 1
+            heapq.heappush(self._heap, (due, self._seq, tracker, key))
+
+    def sweep(self) -> int:
+        """處理已到期的項目，回傳移除的 session 數"""
+        now = time.time()
+        evicted = 0
+        while True:
+            with self._lock:
+                if not self._heap or self._heap[0][0] > now:
+                    break
+                _, _, tracker, key = heapq.heappop(self._heap)
+
+            last_seen = tracker.last_seen.get(key)
+            if last_seen is None:
+                continue
+            if key not in tracker.mapping:
+                # 已由程式自行清除
+                with tracker._lock:
+                    if key not in tracker.mapping and tracker.last_seen.get(key) == last_seen:
+                        del tracker.last_seen[key]
+                        continue
+            if now - last_seen < tracker.idle_seconds:
+                # 期間有被使用，延後到新的到期時間
+                self._schedule(last_seen + tracker.idle_seconds, tracker, key)
+                continue
+
+            try:
+                if tracker.on_evict and tracker.on_evict(key) is False:
+                    self._schedule(now + self.SWEEP_INTERVAL_SECONDS, tracker, key)
+                    continue
+                if not tracker.evict_if_idle(key, now):
+                    # on_evict 期間被使用：依新的使用時間重新排入
+                    last_seen = tracker.last_seen.get(key)
+                    if last_seen is not None:
+                        self._schedule(last_seen + tracker.idle_seconds, tracker, key)
+                    continue
+            except Exception as e:
+                print(f"⚠️ Session 清理失敗 {tracker.name}:{key}: {e}")
+                continue
+            tracker.evicted += 1
+            evicted += 1
+
+        if evicted:
+            print(f"🧹 已清理 {evicted} 個閒置 session")
+        return evicted
+
+    def start(self):
+        """啟動背景清理執行緒（重複呼叫不會重複啟動）"""
+        if self._thread and self._thread.is_alive():
+            return
+
+        def _loop():
+            while True:
+                time.sleep(self.SWEEP_INTERVAL_SECONDS)
+                try:
+                    self.sweep()
+                except Exception as e:
+                    print(f"⚠️ Session 清理失敗: {e}")
+
+        self._thread = threading.Thread(target=_loop, name='session-sweeper', daemon=True)
+        self._thread.start()
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """每個 session map 的常駐數量、估計記憶體（bytes）、累計清理數"""
+        stats = {}
+        for name, tracker in list(self._trackers.items()):
+            sessions = list(tracker.mapping.values())
+            stats[name] = {
+                'count': len(sessions),
+                'approx_bytes': sum(_approx_size(s) for s in sessions),
+                'evicted': tracker.evicted,
+                'idle_seconds': tracker.idle_seconds,
+            }
+        return stats
+
+
+# 單例模式
+_session_sweeper = None
+
+def get_session_sweeper() -> SessionSweeper:
+    """取得 SessionSweeper 單例"""
+    global _session_sweeper
+    if _session_sweeper is None:
+        _session_sweeper = SessionSweeper()
+    return _session_sweeper
@@ -0,0 +1,322 @@
+"""
+欄位擷取器 (Slot Extractor)
+
+職責：
+- 把一則訊息一次解析成訂房 / 訂單流程需要的欄位：電話、抵達時間（含 HH:MM）、
+  姓名候選、房型與間數、特殊需求
+- 取代各 Handler 各自的正規表達式（OrderQueryHandler、SameDayBookingHandler、
+  order_helper.validate_arrival_time），所有樣式在模組載入時編譯一次
+
+設計原則：
+- 正規化沿用 IntentDetector.analyze()（全形轉半形、空白、大小寫），電話 / 訂單編號也直接取用
+- extract_slots() 依訊息快取，同一則訊息在多個步驟取用時不會重複解析
+- 中文數字只在時間單位（點、時、分）前後轉換，避免「等一下」變成「等1下」；
+  單獨的「一點」要前面有時段或數字才算 1 點（「安靜一點」「晚一點」是「稍微」）
+- 時間範圍 / 並列（下午3-4點、晚上七、八點）沿用同一個時段，取較早的時間
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+try:
+    from helpers.intent_detector import IntentDetector
+except ImportError:
+    from .intent_detector import IntentDetector
+
+
+# ============================================
+# 中文數字
+# ============================================
+CN_DIGITS = {
+    '零': 0, '〇': 0, '一': 1, '二': 2, '兩': 2, '三': 3, '四': 4,
+    '五': 5, '六': 6, '七': 7, '八': 8, '九': 9,
+}
+CN_NUMBER_CHARS = '零〇一二兩三四五六七八九十'
+CN_NUMBER_PATTERN = re.compile(f'[{CN_NUMBER_CHARS}]+')
+# 時間範圍 / 並列的分隔（3-4點、三到四點、七、八點）
+TIME_RANGE_SEPARATORS = '-~～到至、或'
+# 時間單位前後，以及範圍 / 並列前段（「七、八點」的「七」）的中文數字
+TIME_NUMERAL_PATTERN = re.compile(
+    f'(?<=[點時:])[{CN_NUMBER_CHARS}]+'
+    f'|[{CN_NUMBER_CHARS}]+(?=\\s*(?:[點時:分]|am|pm))'
+    f'|[{CN_NUMBER_CHARS}]+(?=\\s*[{TIME_RANGE_SEPARATORS}]\\s*[{CN_NUMBER_CHARS}\\d]+\\s*[點時])'
+)
+
+
+def parse_chinese_number(text: str) -> Optional[int]:
+    """
+    中文數字 → 整數（0-99）
+
+    Examples:
+        >>> parse_chinese_number("十二")
+        12
+        >>> parse_chinese_number("二十一")
+        21
+        >>> parse_chinese_number("兩")
+        2
+    """
+    if not text:
+        return None
+    if '十' in text:
+        tens, _, ones = text.partition('十')
+        if len(tens) > 1 or len(ones) > 1 or '十' in ones:
+            return None
+        tens_value = CN_DIGITS.get(tens) if tens else 1
+        ones_value = CN_DIGITS.get(ones) if ones else 0
+        if tens_value is None or ones_value is None:
+            return None
+        return tens_value * 10 + ones_value
+    # 逐字讀（例如「一二」→ 12）
+    if all(ch in CN_DIGITS for ch in text):
+        return int(''.join(str(CN_DIGITS[ch]) for ch in text))
+    return None
+
+
+def _replace_numeral(match: 're.Match') -> str:
+    value = parse_chinese_number(match.group(0))
+    return match.group(0) if value is None else str(value)
+
+
+def convert_numerals(text: str) -> str:
+    """把所有中文數字轉成阿拉伯數字（無法解析的保留原文）"""
+    return CN_NUMBER_PATTERN.sub(_replace_numeral, text)
+
+
+def _replace_time_numeral(match: 're.Match') -> str:
+    text = match.string
+    if (match.group(0) == '一' and text[match.end():].lstrip().startswith(('點', '時'))
+            and not ONE_OCLOCK_CONTEXT_PATTERN.search(text, 0, match.start())
+            and not ONE_OCLOCK_MINUTE_PATTERN.match(text, match.end())):
+        return match.group(0)
+    return _replace_numeral(match)
+
+
+def convert_time_numerals(text: str) -> str:
+    """只轉換時間單位前後的中文數字（「下午三點半」→「下午3點半」，「等一下」「安靜一點」不變）"""
+    return TIME_NUMERAL_PATTERN.sub(_replace_time_numeral, text)
+
+
+def parse_count(text: str) -> Optional[int]:
+    """阿拉伯數字或中文數字 → 整數"""
+    if text.isdigit():
+        return int(text)
+    return parse_chinese_number(text)
+
+
+# ============================================
+# 抵達時間
+# ============================================
+PERIOD_WORDS = ('凌晨', '早上', '上午', '中午', '下午', '傍晚', '晚上', '晚間')
+# 這些時段的 1-11 點要加 12 小時
+AFTERNOON_PERIODS = ('下午', '傍晚', '晚上', '晚間')
+_PERIOD = '|'.join(PERIOD_WORDS)
+
+# 具體時間：[時段] [範圍起點] 3點 / 3點半 / 3點15分 / 15:00 / 3pm / 3:30pm
+# 範圍 / 並列（下午3-4點、晚上7、8點）的時段同時套用到起點，抵達時間取起點
+CLOCK_TIME_PATTERN = re.compile(
+    rf'(?:(?P<period>{_PERIOD})\s*)?(?<!\d)'
+    rf'(?:(?P<range_hour>\d{{1,2}})\s*(?:[點時]\s*(?P<range_half>半)?)?\s*[{TIME_RANGE_SEPARATORS}]\s*)?(?:'
+    r'(?P<ampm_hour>\d{1,2})(?::(?P<ampm_minute>\d{2}))?\s*(?P<ampm>am|pm)'
+    r'|(?P<hour>\d{1,2})\s*(?:[點時]\s*(?:(?P<half>半)|(?P<minute>\d{1,2})(?!\d)\s*分?)?|:\s*(?P<colon_minute>\d{2})(?!\d))'
+    r')'
+)
+# 相對時間（表示很快到，視為具體）
+RELATIVE_TIME_PATTERN = re.compile(
+    r'\d+\s*分鐘後[到來]?|馬上[到來]?|等一下|等下|等等[到來]?|待會兒?[到來]?|稍後|現在|快到了?'
+)
+# 只有時段（模糊時間）
+PERIOD_ONLY_PATTERN = re.compile(_PERIOD)
+# 「一點」前面要有時段或數字（下午一點、十二、一點）、或後面有分鐘（一點半）才是 1 點；
+# 「安靜一點」「晚一點」「便宜一點」的「一點」是「稍微」的意思
+ONE_OCLOCK_CONTEXT_PATTERN = re.compile(
+    rf'(?:{_PERIOD}|[{CN_NUMBER_CHARS}\d]\s*[{TIME_RANGE_SEPARATORS}]?)\s*$'
+)
+ONE_OCLOCK_MINUTE_PATTERN = re.compile(rf'\s*[點時]\s*(?:半|[{CN_NUMBER_CHARS}\d]+\s*分)')
+
+
+def _to_hhmm(period: Optional[str], hour: int, minute: int, ampm: Optional[str] = None) -> Optional[str]:
+    """時段 + 小時 / 分鐘 → 24 小時制 HH:MM（超出範圍回傳 None）"""
+    if hour > 24 or minute >= 60:
+        return None
+    if ampm == 'pm' and hour < 12:
+        hour += 12
+    elif ampm == 'am' and hour == 12:
+        hour = 0
+    elif period in ('晚上', '晚間') and hour == 12:
+        # 晚上 12 點 = 午夜
+        hour = 0
+    elif period in AFTERNOON_PERIODS and hour < 12:
+        hour += 12
+    elif period == '中午' and hour <= 5:
+        # 中午 1 點 = 13:00
+        hour += 12
+    elif period == '凌晨' and hour == 12:
+        hour = 0
+    return f"{hour % 24:02d}:{minute:02d}"
+
+
+# ============================================
+# 電話 / 房型 / 姓名
+# ============================================
+# 訂房流程收集電話時的候選號碼：0 開頭 8-15 位（位數不對的交給客人確認）
+PHONE_CANDIDATE_PATTERN = re.compile(r'(?<!\d)0\d{7,14}(?!\d)')
+MOBILE_FULL_PATTERN = re.compile(r'^09\d{8}$')
+
+# 房型關鍵字 → 容納人數
+ROOM_CAPACITY_WORDS = {
+    '雙人': 2, '雙人房': 2, '兩人': 2, '2人': 2,
+    '三人': 3, '三人房': 3, '3人': 3,
+    '四人': 4, '四人房': 4, '4人': 4,
+}
+# 數量 + 間 + 房型（1間雙人、兩間雙人、2雙人房）
+ROOM_ORDER_PATTERN = re.compile(
+    rf'([{CN_NUMBER_CHARS}\d]+)\s*間?\s*(雙人房?|兩人|2人|三人房?|3人|四人房?|4人)'
+)
+# 單純的間數（阿拉伯數字，或後面接「間」的中文數字）
+ROOM_COUNT_PATTERN = re.compile(rf'(\d+)|([{CN_NUMBER_CHARS}]+)(?=\s*間)')
+
+# 姓名以標點、空白、數字（電話）分段，逐段尋找
+NAME_SEPARATOR_PATTERN = re.compile(r'[,，、。！？:：;；\s\-+\d]+')
+# 自我介紹的開頭（「我叫王小明」→「王小明」）
+NAME_PREFIX_PATTERN = re.compile(r'^(?:我叫|我是|姓名|名字|大名)')
+NAME_PATTERN = re.compile(r'([一-龥A-Za-z]{2,10})')
+# 不可能是姓名的詞（含時間前後的「大約」「左右」「就到」這類贅詞）
+NAME_EXCLUDE_WORDS = (
+    '晚上', '下午', '傍晚', '上午', '中午', '點', '間', '房', '好了', '可以', '沒問題', '電話', '手機',
+    '大約', '大概', '約莫', '左右', '差不多', '應該', '可能', '預計', '之前', '以前', '之後', '以後',
+    '到', '一下', '馬上', '稍後', '待會', '現在', '便宜', '安靜', '謝謝', '麻煩', '請問', '你好',
+)
+
+
+class MessageSlots:
+    """
+    單則訊息的欄位解析結果（唯讀，會被快取共用）
+
+    Attributes:
+        phone: 台灣電話（嚴格模式，同 IntentDetector.extract_phone_number）
+        loose_phone: 寬鬆模式電話（手機或 8 位以上數字）
+        phone_candidate: 0 開頭 8-15 位數字（可能打錯的電話，需客人確認）
+        arrival_time: 抵達時間原文片段（中文數字已轉換），例如「晚上7點半」「馬上到」「下午」
+        arrival_hhmm: 24 小時制 HH:MM，相對 / 模糊時間為 None
+        arrival_period: 時段詞（下午、晚上…）
+        arrival_relative: 是否為相對時間（馬上、等等、10分鐘後…）
+        arrival_vague: 只有時段沒有幾點（需要追問）
+        guest_name: 姓名候選（已排除電話、時間與非姓名詞）
+        rooms: [(容納人數, 間數), ...]
+        room_count: 單純的間數
+        special_request: 特殊需求內容（同 IntentDetector.extract_special_request）
+    """
+
+    __slots__ = ('message', 'text', 'time_text', 'phone', 'loose_phone', 'phone_candidate',
+                 'arrival_time', 'arrival_hhmm', 'arrival_period', 'arrival_relative', 'arrival_vague',
+                 'guest_name', 'rooms', 'room_count', 'special_request')
+
+    def __init__(self, message: str):
+        intent = IntentDetector.analyze(message)
+        self.message = message
+        self.text = intent.text
+        self.time_text = convert_time_numerals(intent.text)
+
+        self.phone = intent.phone
+        self.loose_phone = intent.loose_phone
+        # 先只移除連字符（避免把後面的「3pm」併進號碼），找不到再連空白一起移除（0912 345 678）
+        candidate = (PHONE_CANDIDATE_PATTERN.search(intent.text.replace('-', ''))
+                     or PHONE_CANDIDATE_PATTERN.search(intent.text.replace('-', '').replace(' ', '')))
+        self.phone_candidate = candidate.group(0) if candidate else None
+
+        self._parse_arrival()
+        self.rooms = self._parse_rooms()
+        self.room_count = self._parse_room_count()
+        self.guest_name = self._parse_name()
+        self.special_request = IntentDetector.extract_special_request(message)
+
+    def _parse_arrival(self):
+        self.arrival_time = self.arrival_hhmm = self.arrival_period = None
+        self.arrival_relative = self.arrival_vague = False
+
+        for match in CLOCK_TIME_PATTERN.finditer(self.time_text):
+            if match.group('range_hour'):
+                hhmm = _to_hhmm(match.group('period'), int(match.group('range_hour')),
+                                30 if match.group('range_half') else 0, match.group('ampm'))
+            elif match.group('ampm'):
+                hhmm = _to_hhmm(match.group('period'), int(match.group('ampm_hour')),
+                                int(match.group('ampm_minute') or 0), match.group('ampm'))
+            else:
+                if match.group('half'):
+                    minute = 30
+                else:
+                    minute = int(match.group('minute') or match.group('colon_minute') or 0)
+                hhmm = _to_hhmm(match.group('period'), int(match.group('hour')), minute)
+            if hhmm:
+                self.arrival_time = match.group(0).strip()
+                self.arrival_hhmm = hhmm
+                self.arrival_period = match.group('period')
+                return
+
+        relative = RELATIVE_TIME_PATTERN.search(self.time_text)
+        if relative:
+            self.arrival_time = relative.group(0)
+            self.arrival_relative = True
+            return
+
+        period = PERIOD_ONLY_PATTERN.search(self.time_text)
+        if period:
+            self.arrival_time = self.arrival_period = period.group(0)
+            self.arrival_vague = True
+
+    def _parse_rooms(self) -> List[Tuple[int, int]]:
+        rooms = []
+        for count_text, room_word in ROOM_ORDER_PATTERN.findall(self.text):
+            count = parse_count(count_text)
+            if count and count > 0:
+                rooms.append((ROOM_CAPACITY_WORDS[room_word], count))
+        return rooms
+
+    def _parse_room_count(self) -> Optional[int]:
+        match = ROOM_COUNT_PATTERN.search(self.text)
+        if not match:
+            return None
+        return parse_count(match.group(1) or match.group(2))
+
+    def _parse_name(self) -> Optional[str]:
+        # 保留大小寫（英文姓名），移除本則訊息中的時間後再找
+        remaining = unicodedata.normalize('NFKC', self.message)
+        if self.arrival_time:
+            remaining = convert_time_numerals(remaining)
+            # 以空白取代，時間前後的字各自成段（「約莫下午4點左右」→「約莫」「左右」）
+            remaining = re.sub(re.escape(self.arrival_time), ' ', remaining, count=1, flags=re.IGNORECASE)
+
+        # 「姓名：林大華、電話 02-2345-6789」→ 林大華（跳過「電話」這類欄位名稱）
+        for segment in NAME_SEPARATOR_PATTERN.split(remaining):
+            match = NAME_PATTERN.search(NAME_PREFIX_PATTERN.sub('', segment))
+            if match and not any(word in match.group(1) for word in NAME_EXCLUDE_WORDS):
+                return match.group(1)
+        return None
+
+    @property
+    def is_mobile_candidate(self) -> bool:
+        """候選電話是否為標準台灣手機格式（09 開頭 10 位）"""
+        return bool(self.phone_candidate and MOBILE_FULL_PATTERN.match(self.phone_candidate))
+
+    def __repr__(self):
+        return (f"MessageSlots(phone={self.phone!r}, arrival={self.arrival_time!r}/{self.arrival_hhmm!r}, "
+                f"name={self.guest_name!r}, rooms={self.rooms!r})")
+
+
+@lru_cache(maxsize=512)
+def _extract(message: str) -> MessageSlots:
+    return MessageSlots(message)
+
+
+def extract_slots(message: str) -> MessageSlots:
+    """
+    一次解析訊息中的所有欄位（依訊息內容快取）
+
+    Examples:
+        >>> slots = extract_slots("王小明、0912345678、晚上七點半")
+        >>> slots.guest_name, slots.phone, slots.arrival_time, slots.arrival_hhmm
+        ('王小明', '0912345678', '晚上7點半', '19:30')
+    """
+    return _extract(message or '')
@@ -0,0 +1 @@
+../shared/order_store.py
\ No newline at end of file
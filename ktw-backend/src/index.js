@@ -2,11 +2,13 @@ import express from 'express';
 import cors from 'cors';
 import { createServer } from 'http';
 import { WebSocketServer } from 'ws';
-import { readFileSync, existsSync, readdirSync, statSync, appendFileSync } from 'fs';
+import { readFileSync, existsSync, readdirSync, statSync, appendFileSync, openSync, closeSync, unlinkSync } from 'fs';
 import { join, dirname } from 'path';
 import { fileURLToPath } from 'url';
 import path from 'path';
 import dotenv from 'dotenv';
+import sqlite3 from 'sqlite3';
+import { gunzipSync } from 'zlib';
 import { getSupplement, getAllSupplements, updateSupplement, getBotSession, updateBotSession, deleteBotSession, getAllActiveSessions, getAllVipUsers, getVipUser, addVipUser, deleteVipUser, saveUserOrderLink, getUserOrders, getUserLatestOrder, getRoomAcknowledgments, addRoomAcknowledgment } from './helpers/db.js';
 import { getBookingSource } from './helpers/bookingSource.js';
 
@@ -46,14 +48,43 @@ async function fetchWithRetry(url, options = {}, retries = 2, delay = 1000) {
 }
 
 
-// Bot 的 guest_orders.json 路徑
+// Bot 的訂單資料庫路徑（SQLite，WAL 模式；舊版 guest_orders.json 僅作為尚未遷移時的備援）
+const GUEST_ORDERS_DB_PATH = join(__dirname, '../../data/chat_logs/guest_orders.db');
 const GUEST_ORDERS_PATH = join(__dirname, '../../data/chat_logs/guest_orders.json');
+let guestOrdersDb = null;
 
 // Bot 的 user_profiles.json 路徑
 const USER_PROFILES_PATH = join(__dirname, '../../data/chat_logs/user_profiles.json');
 
 // 讀取 Bot 收集的訂單資訊
-function getGuestOrders() {
+async function getGuestOrders() {
+    if (!existsSync(GUEST_ORDERS_DB_PATH)) {
+        return getGuestOrdersFromJson();
+    }
+    if (!guestOrdersDb) {
+        guestOrdersDb = new sqlite3.Database(GUEST_ORDERS_DB_PATH, sqlite3.OPEN_READONLY);
+    }
+    return new Promise((resolve) => {
+        guestOrdersDb.all('SELECT order_id, data FROM orders', (err, rows) => {
+            if (err) {
+                console.error('讀取訂單資料庫失敗:', err.message);
+                return resolve({});
+            }
+            const orders = {};
+            for (const row of rows) {
+                try {
+                    orders[row.order_id] = JSON.parse(row.data);
+                } catch {
+                    // 略過損毀的資料列
+                }
+            }
+            resolve(orders);
+        });
+    });
+}
+
+// 讀取舊版 guest_orders.json（Bot 尚未建立訂單資料庫時）
+function getGuestOrdersFromJson() {
     try {
         if (existsSync(GUEST_ORDERS_PATH)) {
             const data = readFileSync(GUEST_ORDERS_PATH, 'utf-8');
@@ -376,9 +407,12 @@ app.get('/api/status', async (req, res) => {
 const PMS_API_BASE = 'http://192.168.8.3:3000/api/v1';
 
 
-// 讀取房型對照表
-const roomTypeMap = JSON.parse(
-    readFileSync(join(__dirname, '../room_type_mapping.json'), 'utf-8')
+// 讀取房型對照表（與 LINE Bot 共用 data/room_catalog.json）
+const roomCatalog = JSON.parse(
+    readFileSync(join(__dirname, '../../data/room_catalog.json'), 'utf-8')
+);
+const roomTypeMap = Object.fromEntries(
+    Object.entries(roomCatalog.room_types).map(([code, type]) => [code, type.zh])
 );
 
 function translateRoomType(code) {
@@ -524,7 +558,7 @@ app.get('/api/pms/today-checkin', async (req, res) => {
 
             if (data.success && data.data) {
                 // 使用共用的資料處理函數
-                const guestOrders = getGuestOrders();
+                const guestOrders = await getGuestOrders();
                 const profiles = getUserProfiles();
                 data.data = await processBookings(data.data, guestOrders, profiles);
             }
@@ -594,7 +628,7 @@ app.get('/api/pms/yesterday-checkin', async (req, res) => {
             const data = await response.json();
             if (data.success && data.data) {
                 // 使用共用的資料處理函數
-                const guestOrders = getGuestOrders();
+                const guestOrders = await getGuestOrders();
                 const profiles = getUserProfiles();
                 data.data = await processBookings(data.data, guestOrders, profiles);
             }
@@ -622,7 +656,7 @@ app.get('/api/pms/checkin-by-offset/:offset', async (req, res) => {
         if (response.ok) {
             const data = await response.json();
             if (data.success && data.data) {
-                const guestOrders = getGuestOrders();
+                const guestOrders = await getGuestOrders();
                 const profiles = getUserProfiles();
                 data.data = await processBookings(data.data, guestOrders, profiles);
             }
@@ -827,7 +861,7 @@ app.get('/api/pms/bookings/:id', async (req, res) => {
 
             // 嘗試合併本地擴充資料
             if (data.success && data.data) {
-                const guestOrders = getGuestOrders();
+                const guestOrders = await getGuestOrders();
                 const profiles = getUserProfiles();
                 const processed = await processBookings([data.data], guestOrders, profiles);
                 data.data = processed[0];
@@ -962,6 +996,24 @@ app.delete('/api/bot/sessions/:userId', async (req, res) => {
 // VIP 用戶管理 API
 // ============================================
 
+// 通知 LINE Bot 更新 VIP 快取（失敗不影響後台操作，Bot 快取最晚 TTL 後也會更新）
+const LINEBOT_URL = process.env.LINEBOT_URL || 'http://localhost:5001';
+// 呼叫 Bot 內部端點時帶上共用金鑰（需與 Bot 的 BOT_INTERNAL_TOKEN 相同）
+const BOT_INTERNAL_TOKEN = process.env.BOT_INTERNAL_TOKEN || '';
+
+function linebotHeaders(headers = {}) {
+    return BOT_INTERNAL_TOKEN ? { ...headers, 'X-Internal-Token': BOT_INTERNAL_TOKEN } : headers;
+}
+
+function notifyVipChanged(userId) {
+    fetch(`${LINEBOT_URL}/vip/invalidate`, {
+        method: 'POST',
+        headers: linebotHeaders({ 'Content-Type': 'application/json' }),
+        body: JSON.stringify({ userId }),
+        signal: AbortSignal.timeout(3000)
+    }).catch(err => console.warn('⚠️ 通知 Bot 更新 VIP 快取失敗:', err.message));
+}
+
 // 取得所有 VIP 用戶
 app.get('/api/vip', async (req, res) => {
     try {
@@ -1012,6 +1064,7 @@ app.post('/api/vip', async (req, res) => {
         });
 
         console.log(`⭐ VIP 用戶已新增: ${userId} (${type || 'guest'})`);
+        notifyVipChanged(userId);
 
         res.json({ success: true, message: 'VIP 用戶已新增', data: result });
     } catch (error) {
@@ -1028,6 +1081,7 @@ app.delete('/api/vip/:userId', async (req, res) => {
 
         if (result.changes > 0) {
             console.log(`🗑️ VIP 用戶已移除: ${userId}`);
+            notifyVipChanged(userId);
             res.json({ success: true, message: 'VIP 用戶已移除' });
         } else {
             res.status(404).json({ success: false, error: '找不到該 VIP 用戶' });
@@ -1094,10 +1148,142 @@ app.post('/api/user-orders', async (req, res) => {
 // Bot 的 chat_logs 目錄路徑
 const CHAT_LOGS_DIR = join(__dirname, '../../data/chat_logs');
 
+// 讀取客人對話日誌（舊版 .txt 與結構化 .jsonl 並存時，.txt 紀錄較舊排在前面）
+function readChatEntries(userId) {
+    const entries = [];
+
+    const txtPath = join(CHAT_LOGS_DIR, `${userId}.txt`);
+    if (existsSync(txtPath)) {
+        const content = readFileSync(txtPath, 'utf-8');
+        // 解析格式：[timestamp] 【角色】\n內容，以分隔線切割每個條目
+        for (const block of content.split(/^-{20,}$/m)) {
+            const match = block.trim().match(/\[(.+?)\]\s*【(.+?)】\n([\s\S]*)/);
+            if (match) {
+                entries.push({
+                    timestamp: match[1].trim(),
+                    role: match[2].trim(),
+                    message: match[3].trim(),
+                });
+            }
+        }
+    }
+
+    const jsonlPath = join(CHAT_LOGS_DIR, `${userId}.jsonl`);
+    if (existsSync(jsonlPath)) {
+        for (const line of readFileSync(jsonlPath, 'utf-8').split('\n')) {
+            if (!line) continue;
+            try {
+                const record = JSON.parse(line);
+                entries.push({
+                    timestamp: record.ts,
+                    role: record.sender,
+                    message: (record.text || '').trim(),
+                });
+            } catch {
+                // 略過寫到一半的紀錄
+            }
+        }
+    }
+
+    return entries;
+}
+
+// 讀取已封存的冷資料（archive/{userId}/YYYY-MM.jsonl.gz），只解壓與 [start, end) 重疊的月份分段
+function readArchivedChatEntries(userId, start = null, end = null) {
+    const indexPath = join(CHAT_LOGS_DIR, 'archive', userId, 'index.json');
+    if (!existsSync(indexPath)) return [];
+
+    const entries = [];
+    const { segments = [] } = JSON.parse(readFileSync(indexPath, 'utf-8'));
+    for (const seg of segments) {
+        if ((end && seg.start >= end) || (start && seg.end < start)) continue;
+        const content = gunzipSync(readFileSync(join(CHAT_LOGS_DIR, 'archive', userId, seg.file))).toString('utf-8');
+        for (const line of content.split('\n')) {
+            if (!line) continue;
+            const record = JSON.parse(line);
+            if ((start && record.ts < start) || (end && record.ts >= end)) continue;
+            entries.push({
+                timestamp: record.ts,
+                role: record.sender,
+                message: (record.text || '').trim(),
+            });
+        }
+    }
+    return entries;
+}
+
+// 與 Bot 的 ChatLogStore.file_lock 共用的跨程序鎖檔（{userId}.jsonl.lock）：
+// Bot 封存 / 轉換日誌期間不附加，避免複製熱資料到替換檔案之間寫入的紀錄遺失
+const CHAT_LOG_LOCK_TIMEOUT_MS = 5000;
+const CHAT_LOG_LOCK_STALE_MS = 30000;
+const chatLogLockWait = new Int32Array(new SharedArrayBuffer(4));
+
+function withChatLogLock(userId, fn) {
+    const lockPath = join(CHAT_LOGS_DIR, `${userId}.jsonl.lock`);
+    const deadline = Date.now() + CHAT_LOG_LOCK_TIMEOUT_MS;
+    let acquired = false;
+    while (true) {
+        try {
+            closeSync(openSync(lockPath, 'wx'));
+            acquired = true;
+            break;
+        } catch (err) {
+            if (err.code !== 'EEXIST') throw err;
+            try {
+                // 程序中斷留下的鎖檔
+                if (Date.now() - statSync(lockPath).mtimeMs > CHAT_LOG_LOCK_STALE_MS) {
+                    unlinkSync(lockPath);
+                    continue;
+                }
+            } catch {
+                continue;  // 鎖剛被釋放
+            }
+        }
+        if (Date.now() >= deadline) {
+            // 逾時仍寫入：訊息不能因為鎖而遺失
+            console.warn(`⚠️ 日誌鎖等待逾時，直接寫入: ${lockPath}`);
+            break;
+        }
+        Atomics.wait(chatLogLockWait, 0, 0, 10);
+    }
+    try {
+        return fn();
+    } finally {
+        if (acquired) {
+            try { unlinkSync(lockPath); } catch { /* 已被移除 */ }
+        }
+    }
+}
+
+// 附加一筆對話紀錄（已轉為 .jsonl 的用戶寫入 .jsonl，否則沿用 .txt）
+function appendChatEntry(userId, sender, message) {
+    withChatLogLock(userId, () => writeChatEntry(userId, sender, message));
+}
+
+function writeChatEntry(userId, sender, message) {
+    const jsonlPath = join(CHAT_LOGS_DIR, `${userId}.jsonl`);
+    if (existsSync(jsonlPath)) {
+        // sv-SE 格式即為 YYYY-MM-DD HH:MM:SS
+        const ts = new Date().toLocaleString('sv-SE', { timeZone: 'Asia/Taipei', hour12: false });
+        const record = { ts, role: 'admin', sender, name: null, text: message, type: 'text' };
+        appendFileSync(jsonlPath, JSON.stringify(record) + '\n', 'utf-8');
+        return;
+    }
+
+    const timestamp = new Date().toLocaleString('zh-TW', {
+        timeZone: 'Asia/Taipei',
+        year: 'numeric', month: '2-digit', day: '2-digit',
+        hour: '2-digit', minute: '2-digit', second: '2-digit',
+        hour12: false
+    });
+    const logEntry = `[${timestamp}] 【${sender}】\n${message}\n${'-'.repeat(30)}\n`;
+    appendFileSync(join(CHAT_LOGS_DIR, `${userId}.txt`), logEntry, 'utf-8');
+}
+
 // 取得今日入住客人的 LINE 資訊（供同步回覆頁面使用）
 app.get('/api/chat/today-checkin-users', async (req, res) => {
     try {
-        const guestOrders = getGuestOrders();
+        const guestOrders = await getGuestOrders();
         const profiles = getUserProfiles();
         
         // 從 PMS API 取得今日入住客人
@@ -1160,15 +1346,18 @@ app.get('/api/chat/users', (req, res) => {
     try {
         const profiles = getUserProfiles();
         
-        // 讀取所有 .txt 日誌檔，取得最後修改時間
-        const logFiles = readdirSync(CHAT_LOGS_DIR)
-            .filter(f => f.endsWith('.txt') && !f.startsWith('_'));
+        // 讀取所有日誌檔（.txt / .jsonl），取得最後修改時間
+        const lastActivity = new Map();
+        for (const f of readdirSync(CHAT_LOGS_DIR)) {
+            if (f.startsWith('_') || !(f.endsWith('.txt') || f.endsWith('.jsonl'))) continue;
+            const userId = f.replace(/\.(txt|jsonl)$/, '');
+            const mtime = statSync(join(CHAT_LOGS_DIR, f)).mtime;
+            if (!lastActivity.has(userId) || mtime > lastActivity.get(userId)) {
+                lastActivity.set(userId, mtime);
+            }
+        }
         
-        const users = logFiles.map(f => {
-            const userId = f.replace('.txt', '');
-            const filePath = join(CHAT_LOGS_DIR, f);
-            const fileStat = statSync(filePath);
-            
+        const users = [...lastActivity.entries()].map(([userId, mtime]) => {
             // 從 profiles 取得顯示名稱
             const profile = profiles[userId];
             let displayName = '未知用戶';
@@ -1181,7 +1370,7 @@ app.get('/api/chat/users', (req, res) => {
             return {
                 user_id: userId,
                 display_name: displayName,
-                last_activity: fileStat.mtime.toISOString()
+                last_activity: mtime.toISOString()
             };
         });
         
@@ -1285,18 +1474,8 @@ app.post('/api/chat/sync-reply', async (req, res) => {
         }
         
         // 寫入該用戶的對話日誌（格式與 ChatLogger.log() 一致）
-        const timestamp = new Date().toLocaleString('zh-TW', { 
-            timeZone: 'Asia/Taipei',
-            year: 'numeric', month: '2-digit', day: '2-digit',
-            hour: '2-digit', minute: '2-digit', second: '2-digit',
-            hour12: false
-        });
-        
         const label = send_line && lineSent ? '管理員(手動回覆+已發送)' : '管理員(手動回覆)';
-        const logEntry = `[${timestamp}] 【${label}】\n${message}\n${'-'.repeat(30)}\n`;
-        const logPath = join(CHAT_LOGS_DIR, `${user_id}.txt`);
-        
-        appendFileSync(logPath, logEntry, 'utf-8');
+        appendChatEntry(user_id, label, message);
         
         // 取得客人名稱
         const profiles = getUserProfiles();
@@ -1326,26 +1505,15 @@ app.post('/api/chat/sync-reply', async (req, res) => {
 app.get('/api/chat/sync-history/:user_id', (req, res) => {
     try {
         const { user_id } = req.params;
-        const logPath = join(CHAT_LOGS_DIR, `${user_id}.txt`);
-        
-        if (!existsSync(logPath)) {
-            return res.json({ success: true, data: [] });
-        }
-        
-        const content = readFileSync(logPath, 'utf-8');
-        const entries = [];
+        // 一併查詢已封存的舊月份（未指定 from / to 時回傳完整歷史，與封存前相同）
+        const { from, to } = req.query;
+        const archived = readArchivedChatEntries(user_id, from, to);
         
-        // 解析日誌，找出管理員手動回覆的條目
-        const blocks = content.split(/^-{20,}$/m);
-        for (const block of blocks) {
-            const match = block.match(/\[(.+?)\]\s*【管理員\(手動回覆\)】\n([\s\S]*)/);
-            if (match) {
-                entries.push({
-                    timestamp: match[1].trim(),
-                    message: match[2].trim(),
-                });
-            }
-        }
+        // 找出管理員手動回覆的條目
+        const entries = [...archived, ...readChatEntries(user_id)]
+            .filter(entry => (!from || entry.timestamp >= from) && (!to || entry.timestamp < to))
+            .filter(entry => entry.role === '管理員(手動回覆)')
+            .map(({ timestamp, message }) => ({ timestamp, message }));
         
         // 最新的在前面
         entries.reverse();
@@ -1357,36 +1525,27 @@ app.get('/api/chat/sync-history/:user_id', (req, res) => {
     }
 });
 
+// 對話全文檢索（由 Bot 的全文索引查詢）：q、user_id、start、end、role、page、page_size
+app.get('/api/chat/search', async (req, res) => {
+    try {
+        const params = new URLSearchParams(req.query);
+        const response = await fetch(`${LINEBOT_URL}/chat/search?${params}`, {
+            headers: linebotHeaders(),
+            signal: AbortSignal.timeout(5000)
+        });
+        res.status(response.status).json(await response.json());
+    } catch (error) {
+        console.error('對話檢索失敗:', error.message);
+        res.status(500).json({ success: false, error: error.message });
+    }
+});
+
 // 取得特定客人的最後 N 段對話（所有角色：客人、AI、管理員）
 app.get('/api/chat/recent/:user_id', (req, res) => {
     try {
         const { user_id } = req.params;
         const count = parseInt(req.query.count) || 5;
-        const logPath = join(CHAT_LOGS_DIR, `${user_id}.txt`);
-        
-        if (!existsSync(logPath)) {
-            return res.json({ success: true, data: [] });
-        }
-        
-        const content = readFileSync(logPath, 'utf-8');
-        const entries = [];
-        
-        // 解析日誌，用分隔線切割每個條目
-        const blocks = content.split(/^-{20,}$/m);
-        for (const block of blocks) {
-            const trimmed = block.trim();
-            if (!trimmed) continue;
-            
-            // 解析格式：[timestamp] 【角色】\n內容
-            const match = trimmed.match(/\[(.+?)\]\s*【(.+?)】\n([\s\S]*)/);
-            if (match) {
-                entries.push({
-                    timestamp: match[1].trim(),
-                    role: match[2].trim(),
-                    message: match[3].trim(),
-                });
-            }
-        }
+        const entries = readChatEntries(user_id);
         
         // 取最後 N 段
         const recent = entries.slice(-count);
@@ -0,0 +1,250 @@
+"""
+意圖 / 欄位擷取基準測試
+
+以標註語料（data/intent_benchmark.jsonl）量測各偵測器的正確率與每次呼叫延遲，
+調整關鍵字清單或改寫比對邏輯時，可同時確認速度與準確度沒有退步。
+
+語料格式（每行一筆）：
+    {"id": "time-01", "text": "下午三點", "labels": {"arrival_time": "下午3點", "vague_time": false}}
+
+labels 只需標註與該訊息相關的偵測器，未標註的偵測器不計分（但仍計入延遲量測）。
+- 布林偵測器：一般的 precision / recall
+- 擷取偵測器：預期與結果相同且非空為 TP；結果非空但不同（或預期為空）為 FP；
+  預期非空但沒取到正確值為 FN
+
+用法：
+    python scripts/intent_benchmark.py                       # 輸出報表
+    python scripts/intent_benchmark.py --errors              # 一併列出判斷錯誤的訊息
+    python scripts/intent_benchmark.py --save-baseline data/intent_benchmark_baseline.json
+    python scripts/intent_benchmark.py --baseline data/intent_benchmark_baseline.json
+        # 任一偵測器的 precision / recall 低於基準時以非 0 結束（可放在部署前檢查）
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from typing import Any, Callable, Dict, List, Optional
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LINEBOT_DIR = os.path.join(PROJECT_ROOT, 'LINEBOT')
+sys.path.insert(0, LINEBOT_DIR)
+
+from helpers import intent_detector  # noqa: E402
+from helpers.intent_detector import IntentDetector  # noqa: E402
+from helpers.order_helper import validate_arrival_time, is_vague_time, convert_chinese_numerals  # noqa: E402
+from helpers import slot_extractor  # noqa: E402
+from helpers.slot_extractor import extract_slots  # noqa: E402
+from handlers.same_day_booking import SameDayBookingHandler  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(PROJECT_ROOT, 'data', 'intent_benchmark.jsonl')
+# 每則訊息重複呼叫次數（延遲取所有呼叫的百分位數）
+DEFAULT_REPEAT = 20
+# 與基準比較時容許的誤差（浮點數四捨五入）
+TOLERANCE = 1e-6
+
+
+def _rooms(handler: SameDayBookingHandler) -> Callable[[str], Optional[List[List[int]]]]:
+    """多房型解析結果 → [[容納人數, 間數], ...]（方便與標註比對）"""
+    def parse(text: str):
+        result = handler._parse_multi_room_input(text)
+        if not result:
+            return None
+        return [[item['room']['capacity'], item['count']] for item in result]
+    return parse
+
+
+def build_detectors() -> Dict[str, Dict[str, Any]]:
+    """偵測器名稱 → {'fn': 呼叫函式, 'kind': 'bool' | 'value'}"""
+    handler = SameDayBookingHandler(pms_client=None, state_machine=None)
+    return {
+        'has_order_number': {'fn': IntentDetector.has_order_number, 'kind': 'bool'},
+        'order_number': {'fn': IntentDetector.extract_order_number, 'kind': 'value'},
+        'phone': {'fn': IntentDetector.extract_phone_number, 'kind': 'value'},
+        'arrival_time': {'fn': validate_arrival_time, 'kind': 'value'},
+        'arrival_hhmm': {'fn': lambda text: extract_slots(text).arrival_hhmm, 'kind': 'value'},
+        'guest_name': {'fn': lambda text: extract_slots(text).guest_name, 'kind': 'value'},
+        'vague_time': {'fn': is_vague_time, 'kind': 'bool'},
+        'chinese_numerals': {'fn': convert_chinese_numerals, 'kind': 'value'},
+        'rooms': {'fn': _rooms(handler), 'kind': 'value'},
+        'booking': {'fn': handler.is_booking_intent, 'kind': 'bool'},
+        'cancel': {'fn': IntentDetector.is_cancel_intent, 'kind': 'bool'},
+        'cancel_order': {'fn': handler.is_cancel_intent, 'kind': 'bool'},
+        'confirmation': {'fn': IntentDetector.is_confirmation, 'kind': 'bool'},
+        'rejection': {'fn': IntentDetector.is_rejection, 'kind': 'bool'},
+        'special_request': {'fn': IntentDetector.is_special_request, 'kind': 'bool'},
+    }
+
+
+def load_corpus(path: str) -> List[Dict[str, Any]]:
+    """讀取標註語料（略過空行與 # 開頭的註解行）"""
+    cases = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                cases.append(json.loads(line))
+    return cases
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _clear_caches():
+    """清除訊息分析快取，量測的是每則新訊息第一次判斷的成本"""
+    intent_detector._analyze.cache_clear()
+    slot_extractor._extract.cache_clear()
+
+
+def evaluate(detectors: Dict[str, Dict[str, Any]], cases: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """計算每個偵測器的 TP / FP / FN 與錯誤清單"""
+    report = {}
+    for name, detector in detectors.items():
+        tp = fp = fn = tn = 0
+        errors = []
+        for case in cases:
+            labels = case.get('labels', {})
+            if name not in labels:
+                continue
+            _clear_caches()
+            expected = labels[name]
+            actual = detector['fn'](case['text'])
+
+            if detector['kind'] == 'bool':
+                actual = bool(actual)
+                if actual and expected:
+                    tp += 1
+                elif actual and not expected:
+                    fp += 1
+                elif expected and not actual:
+                    fn += 1
+                else:
+                    tn += 1
+            else:
+                if expected is not None and actual == expected:
+                    tp += 1
+                else:
+                    if actual is not None:
+                        fp += 1
+                    if expected is not None:
+                        fn += 1
+                    if actual is None and expected is None:
+                        tn += 1
+
+            if actual != expected:
+                errors.append({'id': case.get('id'), 'text': case['text'], 'expected': expected, 'actual': actual})
+
+        precision = tp / (tp + fp) if (tp + fp) else 1.0
+        recall = tp / (tp + fn) if (tp + fn) else 1.0
+        report[name] = {
+            'cases': sum(1 for c in cases if name in c.get('labels', {})),
+            'tp': tp, 'fp': fp, 'fn': fn,
+            'precision': round(precision, 4),
+            'recall': round(recall, 4),
+            'errors': errors,
+        }
+    return report
+
+
+def measure_latency(detectors: Dict[str, Dict[str, Any]], cases: List[Dict[str, Any]],
+                    repeat: int = DEFAULT_REPEAT) -> Dict[str, Dict[str, float]]:
+    """每個偵測器對全部語料的每次呼叫延遲百分位數（微秒，快取清空後量測）"""
+    texts = [case['text'] for case in cases]
+    latency = {}
+    for name, detector in detectors.items():
+        fn = detector['fn']
+        samples = []
+        for _ in range(repeat):
+            for text in texts:
+                _clear_caches()
+                start = time.perf_counter_ns()
+                fn(text)
+                samples.append((time.perf_counter_ns() - start) / 1000)
+        samples.sort()
+        latency[name] = {
+            'p50_us': round(_percentile(samples, 50), 2),
+            'p95_us': round(_percentile(samples, 95), 2),
+            'p99_us': round(_percentile(samples, 99), 2),
+            'max_us': round(samples[-1], 2) if samples else 0.0,
+        }
+    return latency
+
+
+def print_report(report: Dict[str, Dict[str, Any]], latency: Dict[str, Dict[str, float]], show_errors: bool):
+    print(f"{'偵測器':<18}{'筆數':>6}{'precision':>11}{'recall':>9}{'p50 µs':>10}{'p95 µs':>10}{'p99 µs':>10}")
+    print('-' * 74)
+    for name, result in report.items():
+        lat = latency.get(name, {})
+        print(f"{name:<20}{result['cases']:>6}{result['precision']:>11.3f}{result['recall']:>9.3f}"
+              f"{lat.get('p50_us', 0):>10.2f}{lat.get('p95_us', 0):>10.2f}{lat.get('p99_us', 0):>10.2f}")
+
+    if show_errors:
+        for name, result in report.items():
+            if not result['errors']:
+                continue
+            print(f"\n❌ {name}（{len(result['errors'])} 筆）")
+            for err in result['errors']:
+                print(f"   [{err['id']}] {err['text']!r}: 預期 {err['expected']!r}，實際 {err['actual']!r}")
+
+
+def compare_baseline(report: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, float]]) -> List[str]:
+    """回傳比基準差的項目（precision / recall 下降）"""
+    regressions = []
+    for name, base in baseline.items():
+        result = report.get(name)
+        if result is None:
+            regressions.append(f"{name}: 偵測器不存在")
+            continue
+        for metric in ('precision', 'recall'):
+            if result[metric] + TOLERANCE < base[metric]:
+                regressions.append(f"{name}: {metric} {base[metric]:.3f} → {result[metric]:.3f}")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='意圖 / 欄位擷取基準測試')
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS, help='標註語料路徑（JSONL）')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='延遲量測時每則訊息重複次數')
+    parser.add_argument('--errors', action='store_true', help='列出判斷錯誤的訊息')
+    parser.add_argument('--json', action='store_true', help='以 JSON 輸出完整結果')
+    parser.add_argument('--baseline', help='與基準檔比較，precision / recall 下降時回傳非 0')
+    parser.add_argument('--save-baseline', help='把本次 precision / recall 存成基準檔')
+    args = parser.parse_args(argv)
+
+    detectors = build_detectors()
+    cases = load_corpus(args.corpus)
+    report = evaluate(detectors, cases)
+    latency = measure_latency(detectors, cases, args.repeat)
+
+    if args.json:
+        print(json.dumps({'accuracy': report, 'latency': latency}, ensure_ascii=False, indent=2))
+    else:
+        print(f"📊 語料 {len(cases)} 筆，延遲每則重複 {args.repeat} 次\n")
+        print_report(report, latency, args.errors)
+
+    if args.save_baseline:
+        baseline = {name: {'precision': r['precision'], 'recall': r['recall']} for name, r in report.items()}
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 已儲存基準: {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_baseline(report, baseline)
+        if regressions:
+            print("\n⚠️ 準確度低於基準：")
+            for item in regressions:
+                print(f"   {item}")
+            return 1
+        print("\n✅ 準確度未低於基準")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+VIP 快取檢查
+
+以假的後台回應與時間驗證 VIPManager 的快取行為，不需要連線 ktw-backend：
+- 名單載入後，超過單一用戶快取 TTL（300 秒）但名單仍有效（600 秒內），VIP 仍判定為 VIP
+- 不在名單內的用戶判定為非 VIP，且不呼叫單一用戶 API
+- 名單失效後改逐一查詢 API
+
+用法：
+    python scripts/vip_cache_check.py      # 全部通過回傳 0，否則列出失敗項目並回傳 1
+"""
+
+import os
+import sys
+from unittest import mock
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LINEBOT_DIR = os.path.join(PROJECT_ROOT, 'LINEBOT')
+sys.path.insert(0, LINEBOT_DIR)
+
+from handlers.vip_manager import VIPManager  # noqa: E402
+
+ROSTER = [
+    {'line_user_id': 'U_internal', 'vip_type': 'internal', 'vip_level': 3, 'role': 'manager', 'permissions': '[]'},
+    {'line_user_id': 'U_guest', 'vip_type': 'guest', 'vip_level': 1, 'permissions': '["web_search"]'},
+]
+START = 1_000_000.0
+
+
+class FakeResponse:
+    def __init__(self, payload, status_code=200):
+        self.payload = payload
+        self.status_code = status_code
+
+    def json(self):
+        return self.payload
+
+
+class FakeBackend:
+    """GET /api/vip 回傳完整名單；GET /api/vip/{user_id} 記錄呼叫次數"""
+
+    def __init__(self):
+        self.single_calls = []
+
+    def get(self, url, timeout=None):
+        if url.endswith('/api/vip'):
+            return FakeResponse({'data': ROSTER})
+        user_id = url.rsplit('/', 1)[-1]
+        self.single_calls.append(user_id)
+        row = next((r for r in ROSTER if r['line_user_id'] == user_id), None)
+        return FakeResponse({'data': row})
+
+
+def run_checks():
+    """回傳失敗項目清單"""
+    failures = []
+    backend = FakeBackend()
+    clock = {'now': START}
+
+    def check(label, condition):
+        if not condition:
+            failures.append(f"{label}（t+{clock['now'] - START:.0f}s）")
+
+    with mock.patch('handlers.vip_manager.requests.get', backend.get), \
+            mock.patch('handlers.vip_manager.time.time', lambda: clock['now']):
+        manager = VIPManager(backend_url='http://backend.test')
+        check('名單載入成功', manager.prefetch_all())
+
+        # 單一用戶 TTL 到期前、到期後、名單失效前
+        for offset in (0, VIPManager.CACHE_TTL_SECONDS + 1, VIPManager.ROSTER_REFRESH_SECONDS * 2 - 1):
+            clock['now'] = START + offset
+            check('內部 VIP 判定為內部', manager.is_internal('U_internal'))
+            check('客人 VIP 判定為 VIP', manager.is_guest_vip('U_guest'))
+            check('客人 VIP 保留權限', manager.has_permission('U_guest', 'web_search'))
+            check('名單外用戶為非 VIP', not manager.is_vip('U_stranger'))
+        check('名單有效期間不呼叫單一用戶 API', not backend.single_calls)
+
+        # 名單失效：逐一查詢
+        clock['now'] = START + VIPManager.ROSTER_REFRESH_SECONDS * 2 + 1
+        check('名單失效後仍判定為內部', manager.is_internal('U_internal'))
+        check('名單失效後改查 API', backend.single_calls == ['U_internal'])
+    return failures
+
+
+def main() -> int:
+    failures = run_checks()
+    if failures:
+        print("❌ VIP 快取檢查失敗：")
+        for item in failures:
+            print(f"   {item}")
+        return 1
+    print("✅ VIP 快取檢查通過")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
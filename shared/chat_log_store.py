@@ -0,0 +1,561 @@
+"""
+Chat Log Store - 結構化對話日誌（JSONL + 位移索引）
+
+每位用戶兩個檔案：
+- {user_id}.jsonl：一行一筆訊息（只附加），欄位：
+    ts    時間 (YYYY-MM-DD HH:MM:SS)
+    role  user / bot / admin / system
+    sender 日誌標籤（客人為 LINE 顯示名稱，其餘如 Bot、管理員(手動回覆)）
+    name  客人 LINE 顯示名稱（非客人訊息為 None）
+    text  訊息內容
+    type  text / image / sticker / audio
+- {user_id}.idx：每筆訊息 12 bytes（在 .jsonl 中的位移 + Unix 時間），
+  讀取最後 N 筆或某段時間只需讀索引尾端與對應的那幾行，不必讀整個檔案
+
+冷資料封存（compact）：較舊月份的紀錄移到 archive/{user_id}/YYYY-MM.jsonl.gz，
+.jsonl 只保留近期的熱資料；archive/{user_id}/index.json 記錄每個月份分段的
+時間範圍與筆數，讀取某段時間只需解壓重疊的分段。
+
+跨程序鎖：後台 (ktw-backend) 也會直接附加管理員訊息到同一個 .jsonl / .txt，
+附加、封存、轉換前都要建立 {user_id}.jsonl.lock（O_EXCL），兩邊都遵守同一個鎖檔，
+避免封存複製熱資料到替換檔案之間附加的紀錄遺失。
+
+舊版 .txt 日誌（[時間] 【發送者】\\n訊息\\n-----）可用 convert_txt() 轉換：
+    python chat_log_store.py convert [log_dir]
+    python chat_log_store.py compact [log_dir]
+"""
+
+import os
+import sys
+import json
+import time
+import gzip
+import struct
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+
+# 索引項目：位移 (uint64) + Unix 時間 (uint32)
+INDEX_ENTRY = struct.Struct('<QI')
+
+# .txt 日誌的訊息分隔線
+TXT_SEPARATOR = '-' * 30
+
+TS_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# 跨程序鎖檔：等待上限與視為殘留（程序中斷沒刪掉）的時間（秒）
+FILE_LOCK_TIMEOUT_SECONDS = 5
+FILE_LOCK_STALE_SECONDS = 30
+
+
+def sender_role(sender: str) -> str:
+    """由日誌標籤判斷發送者角色"""
+    if sender.startswith('Bot'):
+        return 'bot'
+    if sender.startswith('System'):
+        return 'system'
+    if sender.startswith('管理員'):
+        return 'admin'
+    return 'user'
+
+
+def build_record(sender: str, text: str, display_name: Optional[str] = None,
+                 message_type: str = 'text', ts: Optional[str] = None) -> Dict[str, Any]:
+    """建立一筆日誌紀錄"""
+    role = sender_role(sender)
+    return {
+        'ts': ts or datetime.now().strftime(TS_FORMAT),
+        'role': role,
+        'sender': sender,
+        'name': display_name if role == 'user' else None,
+        'text': text,
+        'type': message_type,
+    }
+
+
+def parse_txt_log(content: str) -> List[Dict[str, Any]]:
+    """解析舊版 .txt 日誌為紀錄列表"""
+    records = []
+    for block in content.split(f'\n{TXT_SEPARATOR}\n'):
+        block = block.strip('\n')
+        if not block.startswith('['):
+            continue
+        header, _, text = block.partition('\n')
+        ts_end = header.find('] 【')
+        if ts_end == -1 or not header.endswith('】'):
+            continue
+        ts = header[1:ts_end].replace('/', '-')  # 後台寫入的時間格式為 YYYY/MM/DD
+        sender = header[ts_end + 3:-1]
+        role = sender_role(sender)
+        records.append({
+            'ts': ts,
+            'role': role,
+            'sender': sender,
+            'name': sender if role == 'user' and sender not in ('User', 'User (Voice)') else None,
+            'text': text,
+            'type': 'audio' if sender.endswith('(Voice)') else 'text',
+        })
+    return records
+
+
+def render_txt(records: List[Dict[str, Any]]) -> str:
+    """將紀錄轉回 .txt 日誌格式（供 get_logs 等舊介面使用）"""
+    return ''.join(f"[{r['ts']}] 【{r['sender']}】\n{r['text']}\n{TXT_SEPARATOR}\n" for r in records)
+
+
+def _ts_to_epoch(ts: str) -> int:
+    try:
+        return int(time.mktime(time.strptime(ts, TS_FORMAT)))
+    except (ValueError, TypeError):
+        return 0
+
+
+class ChatLogStore:
+    """JSONL 對話日誌讀寫"""
+
+    def __init__(self, log_dir: str):
+        self.log_dir = log_dir
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    def lock_for(self, user_id: str) -> threading.Lock:
+        """取得該用戶的寫入鎖（同一用戶的日誌寫入依序進行）"""
+        with self._locks_guard:
+            lock = self._locks.get(user_id)
+            if lock is None:
+                lock = self._locks[user_id] = threading.Lock()
+            return lock
+
+    @contextmanager
+    def file_lock(self, user_id: str, required: bool = True):
+        """
+        跨程序鎖（{user_id}.jsonl.lock），與後台 appendChatEntry 共用
+
+        Args:
+            required: 等待逾時是否拋出 TimeoutError；False 時只警告並照常執行（附加訊息不能因此遺失）
+        """
+        path = f"{self.jsonl_path(user_id)}.lock"
+        deadline = time.monotonic() + FILE_LOCK_TIMEOUT_SECONDS
+        acquired = False
+        while True:
+            try:
+                os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                acquired = True
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(path) > FILE_LOCK_STALE_SECONDS:
+                        os.remove(path)
+                        continue
+                except OSError:
+                    continue  # 鎖剛被釋放
+            if time.monotonic() >= deadline:
+                if required:
+                    raise TimeoutError(f"日誌鎖等待逾時: {path}")
+                print(f"⚠️ 日誌鎖等待逾時，直接寫入: {path}")
+                break
+            time.sleep(0.01)
+        try:
+            yield
+        finally:
+            if acquired:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def jsonl_path(self, user_id: str) -> str:
+        return os.path.join(self.log_dir, f"{user_id}.jsonl")
+
+    def index_path(self, user_id: str) -> str:
+        return os.path.join(self.log_dir, f"{user_id}.idx")
+
+    def exists(self, user_id: str) -> bool:
+        return os.path.exists(self.jsonl_path(user_id))
+
+    # ===== 寫入 =====
+
+    def append(self, user_id: str, record: Dict[str, Any]):
+        """附加一筆紀錄（同一用戶的寫入依序進行）"""
+        self.append_many(user_id, [record])
+
+    def append_many(self, user_id: str, records: List[Dict[str, Any]]):
+        """附加多筆紀錄，各自寫入索引"""
+        if not records:
+            return
+        with self.lock_for(user_id), self.file_lock(user_id, required=False):
+            self._catch_up_index(user_id)
+            with open(self.jsonl_path(user_id), 'a+b') as f:
+                offset = f.seek(0, os.SEEK_END)
+                if offset:
+                    # 上次寫到一半中斷：先補換行，避免新紀錄接在殘缺的行後面
+                    f.seek(offset - 1)
+                    if f.read(1) != b'\n':
+                        f.write(b'\n')
+                        offset += 1
+                index_entries = []
+                for record in records:
+                    line = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+                    f.write(line)
+                    index_entries.append(INDEX_ENTRY.pack(offset, _ts_to_epoch(record['ts'])))
+                    offset += len(line)
+            with open(self.index_path(user_id), 'ab') as f:
+                f.write(b''.join(index_entries))
+
+    # ===== 索引 =====
+
+    def _index_size(self, user_id: str) -> int:
+        try:
+            return os.path.getsize(self.index_path(user_id)) // INDEX_ENTRY.size
+        except OSError:
+            return 0
+
+    def _read_index(self, user_id: str, start: int, count: int) -> List[tuple]:
+        """讀取第 start 筆起 count 筆索引項目"""
+        with open(self.index_path(user_id), 'rb') as f:
+            f.seek(start * INDEX_ENTRY.size)
+            data = f.read(count * INDEX_ENTRY.size)
+        return [INDEX_ENTRY.unpack_from(data, i) for i in range(0, len(data) - INDEX_ENTRY.size + 1, INDEX_ENTRY.size)]
+
+    def _catch_up_index(self, user_id: str):
+        """
+        補上索引中缺少的尾端紀錄（其他程序直接附加、或寫入中途中斷時）
+
+        只讀取最後一筆已索引紀錄之後的內容。
+        """
+        path = self.jsonl_path(user_id)
+        if not os.path.exists(path):
+            return
+        count = self._index_size(user_id)
+        if count == 0:
+            if os.path.getsize(path) > 0:
+                self.rebuild_index(user_id)
+            return
+
+        last_offset, _ = self._read_index(user_id, count - 1, 1)[0]
+        new_entries = []
+        with open(path, 'rb') as f:
+            f.seek(last_offset)
+            f.readline()  # 最後一筆已索引的紀錄
+            while True:
+                offset = f.tell()
+                line = f.readline()
+                if not line.endswith(b'\n'):
+                    break  # 檔尾或寫到一半的紀錄
+                try:
+                    ts = json.loads(line).get('ts')
+                except ValueError:
+                    ts = None
+                new_entries.append(INDEX_ENTRY.pack(offset, _ts_to_epoch(ts)))
+        if new_entries:
+            with open(self.index_path(user_id), 'ab') as f:
+                f.write(b''.join(new_entries))
+
+    def rebuild_index(self, user_id: str):
+        """由 .jsonl 重建整份索引"""
+        entries = []
+        with open(self.jsonl_path(user_id), 'rb') as f:
+            while True:
+                offset = f.tell()
+                line = f.readline()
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    ts = json.loads(line).get('ts')
+                except ValueError:
+                    ts = None
+                entries.append(INDEX_ENTRY.pack(offset, _ts_to_epoch(ts)))
+        tmp_path = f"{self.index_path(user_id)}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(b''.join(entries))
+        os.replace(tmp_path, self.index_path(user_id))
+
+    # ===== 讀取 =====
+
+    def _read_lines(self, user_id: str, start_offset: int, end_offset: Optional[int] = None) -> List[Dict[str, Any]]:
+        """讀取位移區間內的紀錄"""
+        with open(self.jsonl_path(user_id), 'rb') as f:
+            f.seek(start_offset)
+            data = f.read() if end_offset is None else f.read(end_offset - start_offset)
+        records = []
+        for line in data.split(b'\n'):
+            if line:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+        return records
+
+    def count(self, user_id: str) -> int:
+        """紀錄筆數"""
+        if not self.exists(user_id):
+            return 0
+        with self.lock_for(user_id):
+            self._catch_up_index(user_id)
+        return self._index_size(user_id)
+
+    def read_last(self, user_id: str, n: int) -> List[Dict[str, Any]]:
+        """讀取最後 n 筆紀錄（只讀索引尾端與對應的行）"""
+        if n <= 0 or not self.exists(user_id):
+            return []
+        with self.lock_for(user_id):
+            self._catch_up_index(user_id)
+            count = self._index_size(user_id)
+            if count == 0:
+                return []
+            start = max(0, count - n)
+            offset, _ = self._read_index(user_id, start, 1)[0]
+            return self._read_lines(user_id, offset)[-n:]
+
+    def read_all(self, user_id: str) -> List[Dict[str, Any]]:
+        """讀取全部紀錄"""
+        if not self.exists(user_id):
+            return []
+        return self._read_lines(user_id, 0)
+
+    def read_range(self, user_id: str, start: Optional[str] = None, end: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        讀取時間區間內的紀錄（以索引二分搜尋定位，只讀區間內的行）
+
+        Args:
+            start: 起始時間（含），YYYY-MM-DD 或 YYYY-MM-DD HH:MM:SS
+            end: 結束時間（不含），格式同上
+        """
+        if not self.exists(user_id):
+            return []
+        with self.lock_for(user_id):
+            self._catch_up_index(user_id)
+            count = self._index_size(user_id)
+            if count == 0:
+                return []
+            lo = self._bisect(user_id, count, _range_epoch(start)) if start else 0
+            hi = self._bisect(user_id, count, _range_epoch(end)) if end else count
+            if lo >= hi:
+                return []
+            start_offset, _ = self._read_index(user_id, lo, 1)[0]
+            end_offset = self._read_index(user_id, hi, 1)[0][0] if hi < count else None
+            return self._read_lines(user_id, start_offset, end_offset)
+
+    def _bisect(self, user_id: str, count: int, epoch: int) -> int:
+        """第一筆時間 >= epoch 的索引位置"""
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            _, ts = self._read_index(user_id, mid, 1)[0]
+            if ts < epoch:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    # ===== 冷資料封存 =====
+
+    def archive_dir(self, user_id: str) -> str:
+        return os.path.join(self.log_dir, 'archive', user_id)
+
+    def _load_archive_index(self, user_id: str) -> Dict[str, Any]:
+        """
+        封存索引：{'pending': 已寫入封存但 .jsonl 尚未替換時的 {'inode', 'offset'}（否則 None）,
+                   'segments': [{'month', 'file', 'start', 'end', 'count'}, ...]}（依月份排序）
+        """
+        path = os.path.join(self.archive_dir(user_id), 'index.json')
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'pending': None, 'segments': []}
+
+    def _save_archive_index(self, user_id: str, index: Dict[str, Any]):
+        path = os.path.join(self.archive_dir(user_id), 'index.json')
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def compact(self, user_id: str, cutoff: str) -> Dict[str, int]:
+        """
+        將時間早於 cutoff 的紀錄依月份壓縮封存，.jsonl 只保留 cutoff 之後的熱資料
+
+        Args:
+            cutoff: 保留起點（YYYY-MM-DD），之前的紀錄封存
+
+        Returns:
+            dict: archived（封存筆數）、bytes_before / bytes_after（.jsonl 大小）
+        """
+        result = {'archived': 0, 'bytes_before': 0, 'bytes_after': 0}
+        if not self.exists(user_id):
+            return result
+
+        with self.lock_for(user_id):
+            self._catch_up_index(user_id)
+            jsonl_path = self.jsonl_path(user_id)
+            result['bytes_before'] = result['bytes_after'] = os.path.getsize(jsonl_path)
+
+            count = self._index_size(user_id)
+            split = self._bisect(user_id, count, _range_epoch(cutoff)) if count else 0
+            if split == 0:
+                return result
+            split_offset = self._read_index(user_id, split, 1)[0][0] if split < count else result['bytes_before']
+
+            # 1. 舊紀錄依月份附加到壓縮分段（gzip 多段串接，讀取時自動合併）
+            # 上次封存後、替換熱資料前中斷時，同一個檔案開頭已封存的位元組略過（以位移判斷，不受同秒紀錄影響）
+            index = self._load_archive_index(user_id)
+            inode = os.stat(jsonl_path).st_ino
+            pending = index.get('pending')
+            skip_offset = pending['offset'] if pending and pending.get('inode') == inode else 0
+            by_month: Dict[str, List[Dict[str, Any]]] = {}
+            for record in self._read_lines(user_id, min(skip_offset, split_offset), split_offset):
+                by_month.setdefault(record.get('ts', '')[:7] or 'unknown', []).append(record)
+
+            os.makedirs(self.archive_dir(user_id), exist_ok=True)
+            segments = {seg['month']: seg for seg in index['segments']}
+            for month, records in sorted(by_month.items()):
+                filename = f"{month}.jsonl.gz"
+                with gzip.open(os.path.join(self.archive_dir(user_id), filename), 'ab') as f:
+                    f.write(b''.join((json.dumps(r, ensure_ascii=False) + '\n').encode('utf-8') for r in records))
+                seg = segments.setdefault(month, {'month': month, 'file': filename,
+                                                  'start': records[0]['ts'], 'end': records[-1]['ts'], 'count': 0})
+                seg['start'] = min(seg['start'], records[0]['ts'])
+                seg['end'] = max(seg['end'], records[-1]['ts'])
+                seg['count'] += len(records)
+                result['archived'] += len(records)
+
+            index['segments'] = [segments[m] for m in sorted(segments)]
+            index['pending'] = {'inode': inode, 'offset': split_offset}
+            index.pop('archived_through', None)
+            self._save_archive_index(user_id, index)
+
+            # 2. 只保留熱資料；持有跨程序鎖，複製到替換之間後台不會再附加
+            tmp_path = f"{jsonl_path}.tmp"
+            with self.file_lock(user_id):
+                with open(jsonl_path, 'rb') as src, open(tmp_path, 'wb') as dst:
+                    src.seek(split_offset)
+                    while True:
+                        chunk = src.read(1024 * 1024)
+                        if not chunk:
+                            break
+                        dst.write(chunk)
+                os.replace(tmp_path, jsonl_path)
+
+            index['pending'] = None
+            self._save_archive_index(user_id, index)
+            self.rebuild_index(user_id)
+            result['bytes_after'] = os.path.getsize(jsonl_path)
+        return result
+
+    def _read_segment(self, user_id: str, filename: str) -> List[Dict[str, Any]]:
+        with gzip.open(os.path.join(self.archive_dir(user_id), filename), 'rb') as f:
+            data = f.read()
+        return [json.loads(line) for line in data.split(b'\n') if line]
+
+    def read_archive_range(self, user_id: str, start: Optional[str] = None, end: Optional[str] = None) -> List[Dict[str, Any]]:
+        """讀取封存資料中的時間區間（只解壓時間範圍重疊的月份分段）"""
+        records = []
+        for seg in self._load_archive_index(user_id)['segments']:
+            if (end and seg['start'] >= end) or (start and seg['end'] < start):
+                continue
+            records.extend(
+                r for r in self._read_segment(user_id, seg['file'])
+                if (not start or r['ts'] >= start) and (not end or r['ts'] < end)
+            )
+        return records
+
+    def read_archive_last(self, user_id: str, n: int) -> List[Dict[str, Any]]:
+        """讀取封存資料中最新的 n 筆（由最新的分段往回解壓，湊滿即停）"""
+        records: List[Dict[str, Any]] = []
+        for seg in reversed(self._load_archive_index(user_id)['segments']):
+            if len(records) >= n:
+                break
+            records = self._read_segment(user_id, seg['file']) + records
+        return records[-n:] if n > 0 else []
+
+    # ===== 轉換 =====
+
+    def convert_txt(self, user_id: str) -> int:
+        """
+        將 {user_id}.txt 轉為 JSONL（舊紀錄排在既有 .jsonl 紀錄之前），
+        完成後原檔改名為 .txt.converted
+
+        Returns:
+            int: 轉換筆數
+        """
+        txt_path = os.path.join(self.log_dir, f"{user_id}.txt")
+        if not os.path.exists(txt_path):
+            return 0
+
+        with self.lock_for(user_id), self.file_lock(user_id):
+            with open(txt_path, 'r', encoding='utf-8') as f:
+                records = parse_txt_log(f.read())
+
+            jsonl_path = self.jsonl_path(user_id)
+            tmp_path = f"{jsonl_path}.tmp"
+            with open(tmp_path, 'wb') as out:
+                for record in records:
+                    out.write((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+                if os.path.exists(jsonl_path):
+                    with open(jsonl_path, 'rb') as existing:
+                        out.write(existing.read())
+            os.replace(tmp_path, jsonl_path)
+            os.replace(txt_path, f"{txt_path}.converted")
+            self.rebuild_index(user_id)
+        return len(records)
+
+    def compact_all(self, cutoff: str) -> Dict[str, int]:
+        """封存目錄中所有 .jsonl 日誌，回傳合計的封存筆數與熱資料大小變化"""
+        summary = {'users': 0, 'archived': 0, 'bytes_before': 0, 'bytes_after': 0}
+        for filename in sorted(os.listdir(self.log_dir)):
+            if not filename.endswith('.jsonl'):
+                continue
+            try:
+                result = self.compact(filename[:-len('.jsonl')], cutoff)
+            except Exception as e:
+                print(f"⚠️ 日誌封存失敗 {filename}: {e}")
+                continue
+            summary['users'] += 1
+            for key in ('archived', 'bytes_before', 'bytes_after'):
+                summary[key] += result[key]
+        return summary
+
+    def convert_all(self) -> Dict[str, int]:
+        """轉換目錄中所有 .txt 日誌"""
+        results = {}
+        for filename in sorted(os.listdir(self.log_dir)):
+            if filename.endswith('.txt'):
+                user_id = filename[:-len('.txt')]
+                results[user_id] = self.convert_txt(user_id)
+        return results
+
+
+def hot_cutoff(hot_months: int = 2) -> str:
+    """熱資料保留起點：本月往前 hot_months - 1 個月的 1 號（預設保留本月與上月）"""
+    today = datetime.now()
+    month_index = today.year * 12 + today.month - 1 - (hot_months - 1)
+    return f"{month_index // 12:04d}-{month_index % 12 + 1:02d}-01"
+
+
+def _range_epoch(value: str) -> int:
+    """區間參數（日期或日期時間）→ Unix 時間"""
+    if len(value) == 10:
+        value = f"{value} 00:00:00"
+    return _ts_to_epoch(value)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in ('convert', 'compact'):
+        print("用法: python chat_log_store.py convert|compact [log_dir]")
+        sys.exit(1)
+
+    if len(sys.argv) > 2:
+        target_dir = sys.argv[2]
+    else:
+        target_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "data", "chat_logs")
+
+    store = ChatLogStore(target_dir)
+    if sys.argv[1] == 'convert':
+        converted = store.convert_all()
+        print(f"✅ 已轉換 {len(converted)} 個日誌檔，共 {sum(converted.values())} 筆紀錄")
+    else:
+        summary = store.compact_all(hot_cutoff())
+        print(f"✅ 已封存 {summary['archived']} 筆紀錄，"
+              f"熱資料 {summary['bytes_before'] // 1024} KB → {summary['bytes_after'] // 1024} KB")
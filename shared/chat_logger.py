@@ -1,9 +1,27 @@
 import os
 import datetime
+import unicodedata
+import time
+import threading
+import atexit
+from collections import deque
 
 import json
 
+from order_store import get_order_store
+from chat_log_store import ChatLogStore, build_record, parse_txt_log, render_txt, hot_cutoff
+from chat_search import ChatSearchIndex
+
 class ChatLogger:
+    # user_profiles.json 延遲寫入：每隔幾秒、或累積多少筆變更就寫一次檔
+    PROFILE_FLUSH_INTERVAL_SECONDS = 5
+    PROFILE_FLUSH_DIRTY_COUNT = 50
+    # 對話日誌寫入策略：CHAT_LOG_FLUSH_MS=0 每則訊息立即寫入；>0 先緩衝，每 N 毫秒批次寫入
+    LOG_BUFFER_MAX_RECORDS = 100  # 緩衝筆數達上限時提早寫入
+    LOG_LATENCY_SAMPLES = 1000    # 寫入耗時統計保留的樣本數
+    # 冷資料封存：.jsonl 只保留最近幾個月（含本月），更早的紀錄壓縮到 archive/
+    LOG_HOT_MONTHS = 2
+
     def __init__(self, log_dir=None):
         # 預設使用 data/chat_logs（相對於專案根目錄）
         if log_dir is None:
@@ -15,10 +33,46 @@ class ChatLogger:
         self.log_dir = log_dir
         if not os.path.exists(log_dir):
             os.makedirs(log_dir)
+        # 對話日誌格式：jsonl（結構化 + 位移索引）或 txt（舊格式）
+        self.log_format = os.getenv('CHAT_LOG_FORMAT', 'jsonl').lower()
+        self.log_store = ChatLogStore(log_dir)
+        # 對話全文索引（寫入日誌時同步更新）
+        self.search_index = ChatSearchIndex(os.path.join(log_dir, "chat_search.db"))
+        self._search_synced = {}  # 日誌檔名 → 上次追補索引時的 mtime
         self.profile_file = os.path.join(log_dir, "user_profiles.json")
         self.orders_file = os.path.join(log_dir, "guest_orders.json")
+        # 訂單資料庫（SQLite）；首次啟動自動匯入舊的 guest_orders.json
+        self.order_store = get_order_store(os.path.join(log_dir, "guest_orders.db"), self.orders_file)
         self.profiles = self._load_profiles()
-        self.orders = self._load_orders()
+        self._orders = {}
+        self._orders_version = None
+        # 顯示名稱 n-gram 倒排索引：字元 / 雙字元 → user_id 集合
+        self._name_index = {}
+        self._indexed_names = {}  # user_id → 已索引的正規化名稱
+        self._display_names = {}  # user_id → 顯示名稱（訂單名單 join 用）
+        for user_id, profile in self.profiles.items():
+            self._index_name(user_id, profile.get('display_name', ''))
+
+        # 用戶資料延遲寫入（write-behind）
+        self._profile_lock = threading.Lock()
+        self._profile_write_lock = threading.Lock()  # 確保寫檔依序進行，舊內容不會蓋掉新內容
+        self._profile_dirty = 0
+        self._profile_flush_event = threading.Event()
+        threading.Thread(target=self._profile_flush_loop, name='profile-flush', daemon=True).start()
+        atexit.register(self.flush_profiles)
+
+        # 對話日誌緩衝寫入
+        self.log_flush_ms = int(os.getenv('CHAT_LOG_FLUSH_MS', '0'))
+        self._log_buffer = {}  # user_id → 待寫入紀錄
+        self._log_buffer_count = 0
+        self._log_buffer_lock = threading.Lock()
+        self._log_flush_lock = threading.Lock()  # 批次依序寫入，較舊的紀錄不會晚於較新的紀錄
+        self._log_flush_event = threading.Event()
+        self._log_latencies = deque(maxlen=self.LOG_LATENCY_SAMPLES)
+        self._turn = threading.local()
+        if self.log_flush_ms > 0:
+            threading.Thread(target=self._log_flush_loop, name='chat-log-flush', daemon=True).start()
+        atexit.register(self.flush_logs)
 
     def _load_profiles(self):
         if os.path.exists(self.profile_file):
@@ -38,28 +92,146 @@ class ChatLogger:
         return {}
 
     def save_profile(self, user_id, display_name):
-        """Updates the display name for a user."""
-        import datetime
-        
-        # 使用物件格式儲存
-        self.profiles[user_id] = {
-            "display_name": display_name,
-            "last_interaction": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
-        
-        with open(self.profile_file, "w", encoding="utf-8") as f:
-            json.dump(self.profiles, f, ensure_ascii=False, indent=2)
+        """Updates the display name for a user (寫檔由背景執行緒批次處理)."""
+        with self._profile_lock:
+            # 使用物件格式儲存
+            self.profiles[user_id] = {
+                "display_name": display_name,
+                "last_interaction": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            }
+            self._index_name(user_id, display_name)
+            self._profile_dirty += 1
+            dirty = self._profile_dirty
+
+        # 累積變更過多時提早寫檔
+        if dirty >= self.PROFILE_FLUSH_DIRTY_COUNT:
+            self._profile_flush_event.set()
+
+    def flush_profiles(self):
+        """將記憶體中的用戶資料寫入 user_profiles.json（暫存檔 + rename，避免寫到一半損毀）"""
+        with self._profile_write_lock:
+            with self._profile_lock:
+                if not self._profile_dirty:
+                    return
+                content = json.dumps(self.profiles, ensure_ascii=False, indent=2)
+                self._profile_dirty = 0
+
+            tmp_file = f"{self.profile_file}.tmp"
+            try:
+                with open(tmp_file, "w", encoding="utf-8") as f:
+                    f.write(content)
+                os.replace(tmp_file, self.profile_file)
+            except Exception as e:
+                print(f"Error writing profiles: {e}")
+                with self._profile_lock:
+                    self._profile_dirty += 1  # 下次再試
+
+    def _profile_flush_loop(self):
+        """背景執行緒：定期（或變更累積過多時）寫入用戶資料"""
+        while True:
+            self._profile_flush_event.wait(self.PROFILE_FLUSH_INTERVAL_SECONDS)
+            self._profile_flush_event.clear()
+            self.flush_profiles()
+
+    # ===== 顯示名稱索引 =====
+
+    @staticmethod
+    def _normalize_name(name):
+        """正規化名稱（全半形、大小寫、空白）"""
+        return ''.join(unicodedata.normalize('NFKC', name or '').lower().split())
+
+    @staticmethod
+    def _name_grams(name):
+        """名稱的單字元 + 雙字元集合"""
+        grams = set(name)
+        grams.update(name[i:i + 2] for i in range(len(name) - 1))
+        return grams
+
+    def _index_name(self, user_id, display_name):
+        """更新某用戶在名稱索引中的項目（名稱未變時不做事）"""
+        self._display_names[user_id] = display_name
+        name = self._normalize_name(display_name)
+        old_name = self._indexed_names.get(user_id)
+        if old_name == name:
+            return
+
+        if old_name:
+            for gram in self._name_grams(old_name):
+                postings = self._name_index.get(gram)
+                if postings:
+                    postings.discard(user_id)
+                    if not postings:
+                        del self._name_index[gram]
 
-    def log(self, user_id, sender, message):
+        if name:
+            for gram in self._name_grams(name):
+                self._name_index.setdefault(gram, set()).add(user_id)
+            self._indexed_names[user_id] = name
+        else:
+            self._indexed_names.pop(user_id, None)
+
+    def find_users_by_name(self, name, limit=5):
+        """
+        以顯示名稱（部分字串）查找用戶
+
+        以 n-gram 索引取交集找出候選，只需驗證少量候選而非掃描全部 profiles。
+        排序：完全相符 > 開頭相符 > 最近互動時間。
+
+        Returns:
+            list: [{'user_id', 'display_name', 'last_interaction'}, ...]
+        """
+        query = self._normalize_name(name)
+        if not query:
+            return []
+
+        # 查詢字串的雙字元（單字元查詢則用單字元）各自的倒排集合，由小到大取交集
+        # 索引會被背景寫入同時修改，取交集與驗證候選都在鎖內完成
+        grams = [query[i:i + 2] for i in range(len(query) - 1)] or [query]
+        matches = []
+        with self._profile_lock:
+            postings = []
+            for gram in set(grams):
+                users = self._name_index.get(gram)
+                if not users:
+                    return []
+                postings.append(users)
+            postings.sort(key=len)
+            candidates = set(postings[0])
+            for users in postings[1:]:
+                candidates &= users
+                if not candidates:
+                    return []
+
+            for user_id in candidates:
+                indexed = self._indexed_names.get(user_id, '')
+                if query not in indexed:
+                    continue
+                profile = self.profiles.get(user_id, {})
+                matches.append({
+                    'user_id': user_id,
+                    'display_name': profile.get('display_name', ''),
+                    'last_interaction': profile.get('last_interaction', ''),
+                    '_rank': (indexed == query, indexed.startswith(query))
+                })
+
+        matches.sort(key=lambda m: (m['_rank'], m['last_interaction']), reverse=True)
+        for match in matches:
+            del match['_rank']
+        return matches[:limit]
+
+    def log(self, user_id, sender, message, message_type='text'):
         """
         Logs a message to the user's log file.
         If sender is 'User', use the display name from profiles.
+
+        Args:
+            message_type: text / image / sticker / audio（僅 JSONL 格式記錄）
         """
+        started = time.perf_counter()
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        filename = f"{user_id}.txt"
-        filepath = os.path.join(self.log_dir, filename)
         
         # 如果 sender 是 "User"，嘗試使用客人的 LINE 姓名
+        display_name = None
         if sender == "User":
             if user_id in self.profiles:
                 profile = self.profiles[user_id]
@@ -72,21 +244,242 @@ class ChatLogger:
                 sender = display_name
             # 如果找不到姓名，保持使用 "User"
         
-        # Format: [Time] [Sender] Message
-        log_entry = f"[{timestamp}] 【{sender}】\n{message}\n{'-'*30}\n"
-        
+        record = build_record(sender, message, display_name, message_type, timestamp)
         try:
-            with open(filepath, "a", encoding="utf-8") as f:
-                f.write(log_entry)
+            if self.log_flush_ms > 0:
+                # 緩衝：由背景執行緒批次寫入
+                with self._log_buffer_lock:
+                    self._log_buffer.setdefault(user_id, []).append(record)
+                    self._log_buffer_count += 1
+                    buffered = self._log_buffer_count
+                if buffered >= self.LOG_BUFFER_MAX_RECORDS:
+                    self._log_flush_event.set()
+            else:
+                self._write_log_records(user_id, [record])
         except Exception as e:
             print(f"Error writing log: {e}")
+        finally:
+            self._record_log_latency(time.perf_counter() - started)
 
-    def get_logs(self, user_id):
-        """Reads the log file for a specific user."""
+    def _write_log_records(self, user_id, records):
+        """寫入日誌（同一用戶依序寫入，避免並行時內容交錯）"""
+        if self.log_format == 'jsonl':
+            self.log_store.append_many(user_id, records)
+        else:
+            # Format: [Time] [Sender] Message
+            with self.log_store.lock_for(user_id):
+                with open(os.path.join(self.log_dir, f"{user_id}.txt"), "a", encoding="utf-8") as f:
+                    f.write(render_txt(records))
+        try:
+            self.search_index.add(user_id, records)
+        except Exception as e:
+            # 索引失敗不影響日誌本身，背景追補時會補上
+            print(f"⚠️ 對話索引寫入失敗: {e}")
+
+    def flush_logs(self, user_id=None):
+        """
+        寫入緩衝中的對話日誌
+
+        Args:
+            user_id: 只寫入該用戶（讀取前確保看得到自己剛寫的紀錄），None 則全部
+        """
+        with self._log_flush_lock:
+            with self._log_buffer_lock:
+                if not self._log_buffer_count:
+                    return
+                if user_id is None:
+                    pending, self._log_buffer = self._log_buffer, {}
+                else:
+                    records = self._log_buffer.pop(user_id, None)
+                    pending = {user_id: records} if records else {}
+                self._log_buffer_count -= sum(len(records) for records in pending.values())
+
+            for uid, records in pending.items():
+                try:
+                    self._write_log_records(uid, records)
+                except Exception as e:
+                    print(f"Error writing log: {e}")
+
+    def compact_logs(self):
+        """
+        封存冷資料：LOG_HOT_MONTHS 之前的紀錄壓縮到 archive/，.jsonl 只留近期熱資料
+
+        Returns:
+            dict: users、archived（封存筆數）、bytes_before / bytes_after（熱資料總大小）
+        """
+        self.flush_logs()
+        if self.log_format == 'jsonl':
+            # 舊 .txt 先轉成 .jsonl，才能一併封存
+            for filename in os.listdir(self.log_dir):
+                if filename.endswith('.txt'):
+                    try:
+                        self.log_store.convert_txt(filename[:-len('.txt')])
+                    except Exception as e:
+                        print(f"⚠️ 日誌轉換失敗 {filename}: {e}")
+
+        summary = self.log_store.compact_all(hot_cutoff(self.LOG_HOT_MONTHS))
+        if summary['archived']:
+            freed_kb = (summary['bytes_before'] - summary['bytes_after']) // 1024
+            print(f"🗜️ 對話日誌封存完成: {summary['archived']} 筆紀錄，熱資料減少 {freed_kb} KB")
+        return summary
+
+    def start_log_compactor(self, interval_hours=24):
+        """啟動背景封存執行緒（啟動時先執行一次，之後每 interval_hours 小時一次）"""
+        def _loop():
+            while True:
+                try:
+                    self.compact_logs()
+                except Exception as e:
+                    print(f"⚠️ 對話日誌封存失敗: {e}")
+                time.sleep(interval_hours * 3600)
+
+        threading.Thread(target=_loop, name='chat-log-compactor', daemon=True).start()
+
+    # ===== 全文檢索 =====
+
+    def search_logs(self, keyword=None, user_id=None, start=None, end=None, role=None, page=1, page_size=20):
+        """
+        全文檢索對話紀錄（參數見 ChatSearchIndex.search）
+
+        Returns:
+            dict: {'total', 'page', 'page_size', 'results': [...]}，每筆結果附上 display_name
+        """
+        self.flush_logs()
+        result = self.search_index.search(keyword, user_id, start, end, role, page, page_size)
+        for r in result['results']:
+            r['display_name'] = self._display_names.get(r['user_id'], r.get('name') or '')
+        return result
+
+    def sync_search_index(self):
+        """
+        追補索引：舊日誌首次建立索引、後台直接寫入的紀錄補進索引
+        （只處理 mtime 有變動的日誌檔，每位用戶只讀取最後索引時間之後的紀錄）
+
+        Returns:
+            int: 新增筆數
+        """
+        added = 0
+        for filename in os.listdir(self.log_dir):
+            if not (filename.endswith('.jsonl') or filename.endswith('.txt')):
+                continue
+            try:
+                mtime = os.path.getmtime(os.path.join(self.log_dir, filename))
+            except OSError:
+                continue
+            if self._search_synced.get(filename) == mtime:
+                continue
+            user_id = os.path.splitext(filename)[0]
+            try:
+                records = self.get_records_between(user_id, start=self.search_index.last_ts(user_id))
+                added += self.search_index.add(user_id, records)
+                self._search_synced[filename] = mtime
+            except Exception as e:
+                print(f"⚠️ 對話索引追補失敗 {filename}: {e}")
+        if added:
+            print(f"🔎 對話全文索引已追補 {added} 筆紀錄")
+        return added
+
+    def start_search_indexer(self, interval_minutes=5):
+        """啟動背景追補執行緒（啟動時先建立舊日誌索引，之後每 interval_minutes 分鐘一次）"""
+        def _loop():
+            while True:
+                try:
+                    self.sync_search_index()
+                except Exception as e:
+                    print(f"⚠️ 對話索引追補失敗: {e}")
+                time.sleep(interval_minutes * 60)
+
+        threading.Thread(target=_loop, name='chat-search-indexer', daemon=True).start()
+
+    def _log_flush_loop(self):
+        """背景執行緒：每 log_flush_ms 毫秒（或緩衝過多時）寫入日誌"""
+        while True:
+            self._log_flush_event.wait(self.log_flush_ms / 1000)
+            self._log_flush_event.clear()
+            self.flush_logs()
+
+    # ===== 日誌寫入耗時 =====
+
+    def _record_log_latency(self, seconds):
+        """記錄一次 log() 的耗時（全域統計 + 本回合累計）"""
+        self._log_latencies.append(seconds)
+        self._turn.ms = getattr(self._turn, 'ms', 0.0) + seconds * 1000
+        self._turn.count = getattr(self._turn, 'count', 0) + 1
+
+    def begin_turn(self):
+        """開始計算本回合（目前執行緒）的日誌寫入耗時"""
+        self._turn.ms = 0.0
+        self._turn.count = 0
+
+    def end_turn(self):
+        """
+        結束本回合計算
+
+        Returns:
+            tuple: (本回合日誌寫入總耗時 ms, 寫入次數)
+        """
+        return getattr(self._turn, 'ms', 0.0), getattr(self._turn, 'count', 0)
+
+    def get_log_write_stats(self):
+        """日誌寫入耗時統計（最近 LOG_LATENCY_SAMPLES 次）"""
+        samples = sorted(self._log_latencies)
+        if not samples:
+            return {'count': 0, 'avg_ms': 0.0, 'p95_ms': 0.0, 'max_ms': 0.0, 'flush_ms': self.log_flush_ms}
+        return {
+            'count': len(samples),
+            'avg_ms': round(sum(samples) / len(samples) * 1000, 3),
+            'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 3),
+            'max_ms': round(samples[-1] * 1000, 3),
+            'flush_ms': self.log_flush_ms,
+        }
+
+    def _read_txt_records(self, user_id):
+        """讀取尚未轉換的舊版 .txt 日誌"""
         filepath = os.path.join(self.log_dir, f"{user_id}.txt")
-        if os.path.exists(filepath):
-            with open(filepath, "r", encoding="utf-8") as f:
-                return f.read()
+        if not os.path.exists(filepath):
+            return []
+        with open(filepath, "r", encoding="utf-8") as f:
+            return parse_txt_log(f.read())
+
+    def get_recent_records(self, user_id, n):
+        """
+        取得最後 n 筆對話紀錄（新舊格式並存時，舊 .txt 紀錄排在 .jsonl 之前）
+
+        Returns:
+            list: [{'ts', 'role', 'sender', 'name', 'text', 'type'}, ...]
+        """
+        self.flush_logs(user_id)
+        records = self.log_store.read_last(user_id, n)
+        if len(records) < n:
+            # 熱資料不足時才往前補：封存資料（僅解壓最新的分段）→ 舊 .txt
+            records = self.log_store.read_archive_last(user_id, n - len(records)) + records
+        if len(records) < n:
+            older = self._read_txt_records(user_id)
+            records = older[-(n - len(records)):] + records if older else records
+        return records
+
+    def get_records_between(self, user_id, start=None, end=None):
+        """
+        取得時間區間內的對話紀錄
+
+        Args:
+            start: 起始時間（含），YYYY-MM-DD 或 YYYY-MM-DD HH:MM:SS
+            end: 結束時間（不含），格式同上
+        """
+        self.flush_logs(user_id)
+        older = [
+            r for r in self._read_txt_records(user_id)
+            if (not start or r['ts'] >= start) and (not end or r['ts'] < end)
+        ]
+        archived = self.log_store.read_archive_range(user_id, start, end)
+        return older + archived + self.log_store.read_range(user_id, start, end)
+
+    def get_logs(self, user_id):
+        """Reads the log file for a specific user (以 .txt 格式呈現；已封存的舊月份請用 get_records_between)."""
+        self.flush_logs(user_id)
+        records = self._read_txt_records(user_id) + self.log_store.read_all(user_id)
+        if records:
+            return render_txt(records)
         return "尚無對話紀錄 (No logs found)."
 
     def list_users(self):
@@ -94,7 +487,10 @@ class ChatLogger:
         if not os.path.exists(self.log_dir):
             return []
         
-        files = [f.replace(".txt", "") for f in os.listdir(self.log_dir) if f.endswith(".txt")]
+        files = {
+            os.path.splitext(f)[0] for f in os.listdir(self.log_dir)
+            if f.endswith(".txt") or f.endswith(".jsonl")
+        }
         users_list = []
         for uid in sorted(files):
             name = self.profiles.get(uid, "Unknown")
@@ -104,166 +500,134 @@ class ChatLogger:
     # ===== 訂單管理功能 =====
     
     def _load_orders(self):
-        """載入訂單資料"""
-        if os.path.exists(self.orders_file):
-            try:
-                with open(self.orders_file, "r", encoding="utf-8") as f:
-                    return json.load(f)
-            except:
-                return {}
-        return {}
-    
+        """載入訂單資料（整份讀取，僅在資料有變更時由 orders 呼叫）"""
+        try:
+            return self.order_store.get_all()
+        except Exception as e:
+            print(f"Error loading orders: {e}")
+            return {}
+
+    @property
+    def orders(self):
+        """訂單快取 {order_id: order}；任何程序寫入訂單後才會重新載入"""
+        version = self.order_store.version()
+        if version != self._orders_version:
+            self._orders = self._load_orders()
+            self._orders_version = version
+        return self._orders
+
     def save_order(self, order_data):
-        """將訂單儲存到訂單資料庫"""
+        """將訂單儲存到訂單資料庫（整筆覆蓋；修改既有訂單請用 update_order）"""
         try:
             order_id = order_data.get('order_id', '')
             if not order_id:
                 return False
             
-            # 更新記憶體
-            self.orders[order_id] = order_data
-            
-            # 寫入檔案
-            with open(self.orders_file, 'w', encoding='utf-8') as f:
-                json.dump(self.orders, f, ensure_ascii=False, indent=2)
+            # 只寫入這一筆訂單（快取會在下次讀取 orders 時依版本更新）
+            self.order_store.upsert(order_data)
             
             return True
         except Exception as e:
             print(f"Error saving order: {e}")
             return False
+
+    def update_order(self, order_id, mutate, create=False):
+        """
+        讀取 → 修改 → 寫回訂單（同一個交易，不會覆蓋其他程序同時寫入的內容）
+
+        Args:
+            mutate: 修改函式，接收目前的訂單 dict
+            create: 訂單不存在時是否建立
+
+        Returns:
+            dict: 更新後的訂單；訂單不存在時回傳 None
+        """
+        try:
+            return self.order_store.update(order_id, mutate, create=create)
+        except Exception as e:
+            print(f"Error updating order: {e}")
+            return None
     
     def link_order_to_user(self, order_id, line_user_id):
         """建立訂單與 LINE 用戶的關聯"""
-        if order_id not in self.orders:
-            return False
-        
-        # 在訂單中記錄 LINE user_id
-        self.orders[order_id]['line_user_id'] = line_user_id
-        
-        # 更新訂單
-        return self.save_order(self.orders[order_id])
+        def _link(order):
+            # 在訂單中記錄 LINE user_id
+            order['line_user_id'] = line_user_id
+
+        return self.update_order(order_id, _link) is not None
     
     def get_user_orders(self, line_user_id):
         """取得某個 LINE 用戶的所有訂單"""
-        user_orders = []
-        for order_id, order_data in self.orders.items():
-            if order_data.get('line_user_id') == line_user_id:
-                user_orders.append(order_data)
-        return user_orders
+        return self.order_store.find_by_field('line_user_id', line_user_id)
+
+    def get_orders_by_pms_id(self, pms_id):
+        """取得同一筆 PMS 訂單的所有儲存副本（OTA 編號 / 純數字 OTA / PMS 編號）"""
+        return self.order_store.find_by_field('pms_id', pms_id)
     
     def get_order(self, order_id):
-        """取得指定訂單"""
-        # 重新讀取最新資料
-        self.orders = self._load_orders()
-        
-        return self.orders.get(order_id)
+        """取得指定訂單（直接讀取資料庫中的最新資料）"""
+        return self.order_store.get(order_id)
     
     def update_guest_request(self, order_id, request_type, content):
         """
         更新客人需求
         request_type: 'phone', 'arrival_time', 'special_need'
         """
-        if order_id not in self.orders:
-            return False
-        
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        # 根據類型決定處理方式
-        if request_type == 'phone':
-            # 電話：只更新主欄位
-            self.orders[order_id]['phone'] = content
-            print(f"📞 已更新電話: {content}")
-            
-        elif request_type == 'arrival_time':
-            # 抵達時間：只更新主欄位
-            self.orders[order_id]['arrival_time'] = content
-            print(f"⏰ 已更新抵達時間: {content}")
-            
-        elif request_type == 'special_need':
-            # 特殊需求：加入 special_requests 陣列
-            if 'special_requests' not in self.orders[order_id]:
-                self.orders[order_id]['special_requests'] = []
+
+        def _apply(order):
+            # 根據類型決定處理方式
+            if request_type == 'phone':
+                # 電話：只更新主欄位
+                order['phone'] = content
+                print(f"📞 已更新電話: {content}")
+                
+            elif request_type == 'arrival_time':
+                # 抵達時間：只更新主欄位
+                order['arrival_time'] = content
+                print(f"⏰ 已更新抵達時間: {content}")
+                
+            elif request_type == 'special_need':
+                # 特殊需求：加入 special_requests 陣列
+                order.setdefault('special_requests', []).append(f"[{timestamp}] {content}")
+                print(f"📝 已記錄特殊需求: {content}")
             
-            request_entry = f"[{timestamp}] {content}"
-            self.orders[order_id]['special_requests'].append(request_entry)
-            print(f"📝 已記錄特殊需求: {content}")
-        
-        else:
-            # 其他類型：加入 special_requests 作為備註
-            if 'special_requests' not in self.orders[order_id]:
-                self.orders[order_id]['special_requests'] = []
+            else:
+                # 其他類型：加入 special_requests 作為備註
+                order.setdefault('special_requests', []).append(f"[{timestamp}] {request_type}: {content}")
             
-            request_entry = f"[{timestamp}] {request_type}: {content}"
-            self.orders[order_id]['special_requests'].append(request_entry)
-        
-        # 更新時間戳
-        self.orders[order_id]['updated_at'] = timestamp
-        
-        # 儲存
-        return self.save_order(self.orders[order_id])
+            # 更新時間戳
+            order['updated_at'] = timestamp
+
+        return self.update_order(order_id, _apply) is not None
     
     def get_today_checkins(self):
         """取得今天入住的客人列表"""
-        # 重新讀取最新資料（確保即時性）
-        self.orders = self._load_orders()
-        
         today = datetime.datetime.now().strftime("%Y-%m-%d")
-        checkins = []
-        
-        for order_id, order in self.orders.items():
-            if order.get('check_in') == today:
-                # 添加 LINE 用戶姓名（display_name）
-                line_user_id = order.get('line_user_id')
-                if line_user_id and line_user_id in self.profiles:
-                    profile = self.profiles[line_user_id]
-                    # 適配新舊格式
-                    if isinstance(profile, dict):
-                        order['line_display_name'] = profile.get('display_name', '未知')
-                    else:
-                        # 向後兼容舊格式（純字串）
-                        order['line_display_name'] = profile
-                else:
-                    order['line_display_name'] = None
-                checkins.append(order)
-        
-        # 按訂單編號排序
-        checkins.sort(key=lambda x: x.get('order_id', ''))
-        return checkins
+        return self.get_checkins_by_date(today)
     
     def update_admin_notes(self, order_id, notes):
         """
         更新訂單的操作人員備註
         """
-        if order_id not in self.orders:
-            return False
-        
-        self.orders[order_id]['admin_notes'] = notes
-        self.orders[order_id]['updated_at'] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        # 儲存
-        return self.save_order(self.orders[order_id])
+        def _apply(order):
+            order['admin_notes'] = notes
+            order['updated_at'] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        return self.update_order(order_id, _apply) is not None
     
     def get_checkins_by_date(self, date_str):
         """取得指定日期入住的客人列表"""
-        # 重新讀取最新資料
-        self.orders = self._load_orders()
+        # 從資料庫查詢最新資料（確保即時性）
+        checkins = self.order_store.find_by_field('check_in', date_str)
         
-        checkins = []
-        for order_id, order in self.orders.items():
-            if order.get('check_in') == date_str:
-                # 添加 LINE 用戶姓名（display_name）- 與 get_today_checkins 保持一致
-                line_user_id = order.get('line_user_id')
-                if line_user_id and line_user_id in self.profiles:
-                    profile = self.profiles[line_user_id]
-                    # 適配新舊格式
-                    if isinstance(profile, dict):
-                        order['line_display_name'] = profile.get('display_name', '未知')
-                    else:
-                        # 向後兼容舊格式（純字串）
-                        order['line_display_name'] = profile
-                else:
-                    order['line_display_name'] = None
-                checkins.append(order)
+        for order in checkins:
+            # 添加 LINE 用戶姓名（display_name）
+            line_user_id = order.get('line_user_id')
+            if line_user_id and line_user_id in self._display_names:
+                order['line_display_name'] = self._display_names[line_user_id] or '未知'
+            else:
+                order['line_display_name'] = None
         
         # 按訂單編號排序
         checkins.sort(key=lambda x: x.get('order_id', ''))
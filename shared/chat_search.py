@@ -0,0 +1,208 @@
+"""
+Chat Search - 對話日誌全文檢索（SQLite FTS5）
+
+取代逐一 grep 每位用戶的日誌檔：
+- ChatLogger.log() 寫入日誌時同步寫入索引（增量更新）
+- 背景追補：後台（Node.js）直接寫入的管理員回覆、舊日誌首次建立索引
+- 可依關鍵字、用戶、時間區間、發送者角色查詢，支援分頁
+
+中文分詞：FTS5 內建的 unicode61 會把連續的中文字視為一個詞，trigram 則查不到
+兩個字的詞（例如「寵物」）。因此寫入與查詢時都先把每個中日韓字元用空白隔開，
+再以片語查詢（"寵 物"）比對相鄰字元，任意長度的中文關鍵字都能命中；
+英數字仍維持整個單字（訂單編號、英文單字可直接查詢）。
+"""
+
+import os
+import re
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+from typing import Optional, Dict, Any, List, Iterable
+
+# 中日韓字元：CJK 統一漢字（含擴充 A）、相容漢字、平假名 / 片假名、諺文
+CJK_PATTERN = re.compile(r'([぀-ヿ㐀-䶿一-鿿가-힯豈-﫿])')
+
+
+def segment(text: str) -> str:
+    """正規化（全形轉半形）後，在每個中日韓字元前後加上空白"""
+    return CJK_PATTERN.sub(r' \1 ', unicodedata.normalize('NFKC', text or ''))
+
+
+def build_match_query(keyword: str) -> Optional[str]:
+    """
+    關鍵字 → FTS5 MATCH 語法
+
+    以空白分隔的多個關鍵字需同時出現（AND）；每個關鍵字為一個片語。
+    """
+    phrases = []
+    for term in (keyword or '').split():
+        # 與 unicode61 相同：只保留字母 / 數字，標點視為分隔（只輸入「？」則略過）
+        tokens = re.findall(r'[^\W_]+', segment(term))
+        if tokens:
+            phrases.append('"' + ' '.join(tokens) + '"')
+    return ' AND '.join(phrases) if phrases else None
+
+
+class ChatSearchIndex:
+    """對話日誌全文索引"""
+
+    def __init__(self, db_path: str):
+        """
+        初始化
+
+        Args:
+            db_path: SQLite 檔案路徑（例如 data/chat_logs/chat_search.db）
+        """
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._init_schema()
+
+    def _init_schema(self):
+        """建立資料表：messages 存原文與篩選欄位，messages_fts 只存分詞後的索引"""
+        with self._lock:
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    ts TEXT NOT NULL,
+                    role TEXT,
+                    sender TEXT,
+                    name TEXT,
+                    text TEXT,
+                    type TEXT,
+                    digest TEXT NOT NULL
+                )
+            ''')
+            # digest 用來去重：即時寫入與背景追補可能重複送入同一筆紀錄
+            self._conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_digest ON messages (user_id, digest)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_messages_user_ts ON messages (user_id, ts)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_messages_ts ON messages (ts)')
+            self._conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(body, content='')")
+
+    @staticmethod
+    def _digest(record: Dict[str, Any]) -> str:
+        key = f"{record.get('ts', '')}\x1f{record.get('sender', '')}\x1f{record.get('text', '')}"
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def add(self, user_id: str, records: Iterable[Dict[str, Any]]) -> int:
+        """
+        寫入索引（同一個交易；已存在的紀錄略過）
+
+        Args:
+            records: chat_log_store.build_record() 格式的紀錄
+
+        Returns:
+            int: 新增筆數
+        """
+        added = 0
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                for record in records:
+                    cursor = self._conn.execute(
+                        'INSERT OR IGNORE INTO messages (user_id, ts, role, sender, name, text, type, digest) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                        (user_id, record.get('ts', ''), record.get('role'), record.get('sender'),
+                         record.get('name'), record.get('text', ''), record.get('type', 'text'),
+                         self._digest(record))
+                    )
+                    if cursor.rowcount:
+                        self._conn.execute(
+                            'INSERT INTO messages_fts (rowid, body) VALUES (?, ?)',
+                            (cursor.lastrowid, segment(f"{record.get('name') or ''} {record.get('text', '')}"))
+                        )
+                        added += 1
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return added
+
+    def last_ts(self, user_id: str) -> Optional[str]:
+        """該用戶已索引的最新紀錄時間（尚未建立索引回傳 None）"""
+        with self._lock:
+            row = self._conn.execute('SELECT MAX(ts) FROM messages WHERE user_id = ?', (user_id,)).fetchone()
+        return row[0] if row else None
+
+    def search(self, keyword: Optional[str] = None, user_id: Optional[str] = None,
+               start: Optional[str] = None, end: Optional[str] = None,
+               role: Optional[str] = None, page: int = 1, page_size: int = 20) -> Dict[str, Any]:
+        """
+        查詢對話紀錄（新到舊）
+
+        Args:
+            keyword: 關鍵字，多個以空白分隔（需同時出現）；None 只依其他條件篩選
+            user_id: 只查該用戶
+            start: 起始時間（含），YYYY-MM-DD 或 YYYY-MM-DD HH:MM:SS
+            end: 結束時間（不含），格式同上
+            role: 發送者角色 user / bot / admin / system
+            page: 頁碼（從 1 開始）
+            page_size: 每頁筆數（上限 100）
+
+        Returns:
+            dict: {'total', 'page', 'page_size', 'results': [{'user_id', 'ts', 'role', 'sender', 'name', 'text', 'type'}, ...]}
+        """
+        page = max(1, int(page))
+        page_size = min(max(1, int(page_size)), 100)
+
+        conditions, params = [], []
+        if keyword:
+            match = build_match_query(keyword)
+            if match is None:
+                return {'total': 0, 'page': page, 'page_size': page_size, 'results': []}
+            conditions.append('m.id IN (SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?)')
+            params.append(match)
+        if user_id:
+            conditions.append('m.user_id = ?')
+            params.append(user_id)
+        if start:
+            conditions.append('m.ts >= ?')
+            params.append(start)
+        if end:
+            conditions.append('m.ts < ?')
+            params.append(end)
+        if role:
+            conditions.append('m.role = ?')
+            params.append(role)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+        with self._lock:
+            total = self._conn.execute(f'SELECT COUNT(*) FROM messages m {where}', params).fetchone()[0]
+            rows = self._conn.execute(
+                f'SELECT m.user_id, m.ts, m.role, m.sender, m.name, m.text, m.type FROM messages m {where} '
+                f'ORDER BY m.ts DESC, m.id DESC LIMIT ? OFFSET ?',
+                params + [page_size, (page - 1) * page_size]
+            ).fetchall()
+
+        columns = ('user_id', 'ts', 'role', 'sender', 'name', 'text', 'type')
+        return {
+            'total': total,
+            'page': page,
+            'page_size': page_size,
+            'results': [dict(zip(columns, row)) for row in rows],
+        }
+
+    def close(self):
+        """關閉資料庫連線"""
+        with self._lock:
+            self._conn.close()
+
+
+if __name__ == '__main__':
+    # 命令列查詢：python chat_search.py 關鍵字 [user_id]
+    import sys
+    if len(sys.argv) < 2:
+        print("用法: python chat_search.py <關鍵字> [user_id]")
+        sys.exit(1)
+    shared_dir = os.path.dirname(os.path.realpath(__file__))
+    index = ChatSearchIndex(os.path.join(os.path.dirname(shared_dir), 'data', 'chat_logs', 'chat_search.db'))
+    result = index.search(sys.argv[1], user_id=sys.argv[2] if len(sys.argv) > 2 else None)
+    print(f"共 {result['total']} 筆")
+    for r in result['results']:
+        print(f"[{r['ts']}] {r['user_id']} 【{r['sender']}】 {r['text']}")
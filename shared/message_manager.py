@@ -1,24 +1,43 @@
 import json
 import os
+import threading
 from datetime import datetime
 import uuid
 
 class MessageManager:
-    """管理後台留言板"""
-    
-    def __init__(self):
-        self.messages_file = 'chat_logs/messages.json'
+    """
+    管理後台留言板
+
+    留言啟動時載入一次並保存在記憶體中（以 id 為索引），未完成數量隨每次變更增量維護，
+    輪詢用的 get_pending_count 不必讀檔。
+    寫入採「快照 + 變更日誌」：每次變更只在 messages.journal.jsonl 附加一行，
+    累積 JOURNAL_COMPACT_OPS 筆後才把完整快照原子寫回 messages.json 並清空日誌。
+    """
+
+    # 日誌累積多少筆變更後合併回快照
+    JOURNAL_COMPACT_OPS = 200
+
+    def __init__(self, messages_file='chat_logs/messages.json'):
+        self.messages_file = messages_file
+        self.journal_file = os.path.splitext(messages_file)[0] + '.journal.jsonl'
+        self._lock = threading.RLock()
         self._ensure_file_exists()
-    
+
+        self._messages = {}  # id → 留言（依建立順序）
+        self._pending_count = 0
+        self._journal_ops = 0
+        self._sorted_cache = None  # get_all_messages 的排序結果，有變更時才重新排序
+        self._load()
+
     def _ensure_file_exists(self):
         """確保資料檔案存在"""
-        os.makedirs('chat_logs', exist_ok=True)
+        os.makedirs(os.path.dirname(self.messages_file) or '.', exist_ok=True)
         if not os.path.exists(self.messages_file):
             with open(self.messages_file, 'w', encoding='utf-8') as f:
                 json.dump({'messages': []}, f, ensure_ascii=False, indent=2)
-    
+
     def _load_messages(self):
-        """載入所有留言"""
+        """載入快照中的所有留言"""
         try:
             with open(self.messages_file, 'r', encoding='utf-8') as f:
                 data = json.load(f)
@@ -26,33 +45,77 @@ class MessageManager:
         except Exception as e:
             print(f"Error loading messages: {e}")
             return []
-    
+
+    def _load(self):
+        """載入快照並重播變更日誌，建立記憶體索引"""
+        for msg in self._load_messages():
+            self._messages[msg['id']] = msg
+
+        if os.path.exists(self.journal_file):
+            with open(self.journal_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 寫到一半的最後一行
+                        continue
+                    self._apply(entry)
+                    self._journal_ops += 1
+
+        self._pending_count = sum(1 for m in self._messages.values() if not m.get('completed', False))
+
+    def _apply(self, entry):
+        """套用一筆變更到記憶體（不更新計數）"""
+        if entry['op'] == 'put':
+            self._messages[entry['message']['id']] = entry['message']
+        elif entry['op'] == 'delete':
+            self._messages.pop(entry['id'], None)
+
+    def _record(self, entry):
+        """附加一筆變更到日誌（變更需已套用到記憶體），累積過多時合併回快照"""
+        try:
+            with open(self.journal_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self._journal_ops += 1
+            if self._journal_ops >= self.JOURNAL_COMPACT_OPS:
+                self._save_messages(list(self._messages.values()))
+            return True
+        except Exception as e:
+            print(f"Error saving messages: {e}")
+            return False
+
     def _save_messages(self, messages):
-        """儲存留言"""
+        """原子寫入完整快照並清空變更日誌"""
         try:
-            with open(self.messages_file, 'w', encoding='utf-8') as f:
+            tmp_path = f"{self.messages_file}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
                 json.dump({'messages': messages}, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.messages_file)
+            # 快照已包含全部變更，日誌可以清空
+            open(self.journal_file, 'w').close()
+            self._journal_ops = 0
             return True
         except Exception as e:
             print(f"Error saving messages: {e}")
             return False
-    
+
     def get_all_messages(self):
         """取得所有留言（最新的在前）"""
-        messages = self._load_messages()
-        # 未完成的在前，已完成的在後，同類型按時間排序
-        pending = [m for m in messages if not m.get('completed', False)]
-        completed = [m for m in messages if m.get('completed', False)]
-        
-        pending.sort(key=lambda x: x['created_at'], reverse=True)
-        completed.sort(key=lambda x: x.get('completed_at', x['created_at']), reverse=True)
-        
-        return pending + completed
-    
+        with self._lock:
+            if self._sorted_cache is None:
+                # 未完成的在前，已完成的在後，同類型按時間排序
+                messages = self._messages.values()
+                pending = [m for m in messages if not m.get('completed', False)]
+                completed = [m for m in messages if m.get('completed', False)]
+
+                pending.sort(key=lambda x: x['created_at'], reverse=True)
+                completed.sort(key=lambda x: x.get('completed_at') or x['created_at'], reverse=True)
+
+                self._sorted_cache = pending + completed
+            return list(self._sorted_cache)
+
     def add_message(self, msg_type, priority, title, content, created_by):
         """新增留言"""
-        messages = self._load_messages()
-        
         new_message = {
             'id': f"msg_{uuid.uuid4().hex[:8]}",
             'type': msg_type,  # todo, note, urgent
@@ -64,44 +127,52 @@ class MessageManager:
             'completed': False,
             'completed_at': None
         }
-        
-        messages.append(new_message)
-        
-        if self._save_messages(messages):
-            return new_message
-        return None
-    
+
+        with self._lock:
+            self._messages[new_message['id']] = new_message
+            if not self._record({'op': 'put', 'message': new_message}):
+                del self._messages[new_message['id']]
+                return None
+            self._pending_count += 1
+            self._sorted_cache = None
+        return new_message
+
     def toggle_complete(self, msg_id):
         """切換完成狀態"""
-        messages = self._load_messages()
-        
-        for msg in messages:
-            if msg['id'] == msg_id:
-                msg['completed'] = not msg['completed']
-                if msg['completed']:
-                    msg['completed_at'] = datetime.now().isoformat()
-                else:
-                    msg['completed_at'] = None
-                
-                if self._save_messages(messages):
-                    return msg
+        with self._lock:
+            msg = self._messages.get(msg_id)
+            if msg is None:
+                return None
+
+            updated = dict(msg)
+            updated['completed'] = not msg['completed']
+            updated['completed_at'] = datetime.now().isoformat() if updated['completed'] else None
+
+            self._messages[msg_id] = updated
+            if not self._record({'op': 'put', 'message': updated}):
+                self._messages[msg_id] = msg
                 return None
-        
-        return None
-    
+            self._pending_count += -1 if updated['completed'] else 1
+            self._sorted_cache = None
+            return updated
+
     def delete_message(self, msg_id):
         """刪除留言"""
-        messages = self._load_messages()
-        
-        original_count = len(messages)
-        messages = [m for m in messages if m['id'] != msg_id]
-        
-        if len(messages) < original_count:
-            return self._save_messages(messages)
-        
-        return False
-    
+        with self._lock:
+            msg = self._messages.get(msg_id)
+            if msg is None:
+                return False
+
+            del self._messages[msg_id]
+            if not self._record({'op': 'delete', 'id': msg_id}):
+                # 還原（重新插入會排到最後，順序不影響排序結果）
+                self._messages[msg_id] = msg
+                return False
+            if not msg.get('completed', False):
+                self._pending_count -= 1
+            self._sorted_cache = None
+            return True
+
     def get_pending_count(self):
-        """取得未完成數量"""
-        messages = self._load_messages()
-        return len([m for m in messages if not m.get('completed', False)])
+        """取得未完成數量（增量維護，O(1)）"""
+        return self._pending_count
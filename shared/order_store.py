@@ -0,0 +1,264 @@
+"""
+Order Store - 客人訂單資料庫（SQLite）
+
+取代原本每次變更都整份重寫的 guest_orders.json：
+- 每筆訂單一列（order_id 為主鍵），寫入只 UPSERT 變更的那一列
+- WAL 模式：Bot 寫入時，後台（Node.js）仍可同時讀取
+- 首次啟動時自動從 guest_orders.json 一次性匯入（原檔保留不刪除）
+
+訂單內容以 JSON 字串存在 data 欄位，欄位結構與原本 guest_orders.json 相同；
+常用查詢欄位（LINE 用戶、入住日、PMS / OTA 編號）建有運算式索引，查詢不必全表掃描。
+
+所有訂單寫入（ChatLogger、當日預訂、訂單同步）都經過這個模組：
+- 寫入交易一律 BEGIN IMMEDIATE，由 SQLite 檔案鎖在多個程序間排隊，不會互相覆蓋
+- 「讀取 → 修改 → 寫回」請用 update()，讀取與寫回在同一個交易內完成
+- version() 可判斷資料是否被（任何程序）修改過，快取只在有變更時重新載入
+"""
+
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Iterable, Callable, Tuple
+
+
+class OrderStore:
+    """客人訂單資料庫"""
+
+    # 建有次要索引的訂單欄位（json_extract 運算式索引，寫入時由 SQLite 自動維護）
+    INDEXED_FIELDS = ('line_user_id', 'check_in', 'pms_id', 'ota_id')
+    # 其他程序持有寫入鎖時最多等待的毫秒數
+    BUSY_TIMEOUT_MS = 5000
+
+    def __init__(self, db_path: str, json_path: Optional[str] = None):
+        """
+        初始化
+
+        Args:
+            db_path: SQLite 檔案路徑
+            json_path: 舊版 guest_orders.json 路徑（存在且尚未匯入時自動匯入）
+        """
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+        # 單一連線 + lock：Flask 多執行緒與背景執行緒共用
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(f'PRAGMA busy_timeout={self.BUSY_TIMEOUT_MS}')
+        self._local_writes = 0  # 本連線的寫入次數（data_version 不計自己的寫入）
+        self._init_schema()
+
+        if json_path:
+            self.migrate_from_json(json_path)
+
+    def _init_schema(self):
+        """建立資料表"""
+        with self._lock:
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS orders (
+                    order_id TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    updated_at TEXT
+                )
+            ''')
+            for field in self.INDEXED_FIELDS:
+                self._conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_orders_{field} "
+                    f"ON orders (json_extract(data, '$.{field}'))"
+                )
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            ''')
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str):
+        self._conn.execute(
+            'INSERT INTO meta (key, value) VALUES (?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET value = excluded.value',
+            (key, value)
+        )
+
+    def migrate_from_json(self, json_path: str) -> int:
+        """
+        從 guest_orders.json 一次性匯入（已匯入過則略過）
+
+        Returns:
+            int: 匯入筆數
+        """
+        with self._lock:
+            if self._get_meta('migrated_from_json'):
+                return 0
+            if not os.path.exists(json_path):
+                self._set_meta('migrated_from_json', 'no-file')
+                return 0
+
+            try:
+                with open(json_path, 'r', encoding='utf-8') as f:
+                    orders = json.load(f)
+            except (json.JSONDecodeError, OSError) as e:
+                print(f"⚠️ guest_orders.json 匯入失敗: {e}")
+                return 0
+
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                # 已在資料庫的訂單較新，不覆蓋
+                self._conn.executemany(
+                    'INSERT OR IGNORE INTO orders (order_id, data, updated_at) VALUES (?, ?, ?)',
+                    [
+                        (order_id, json.dumps(order, ensure_ascii=False), order.get('updated_at'))
+                        for order_id, order in orders.items() if isinstance(order, dict)
+                    ]
+                )
+                self._set_meta('migrated_from_json', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+                self._conn.execute('COMMIT')
+                self._local_writes += 1
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+        print(f"📦 已從 guest_orders.json 匯入 {len(orders)} 筆訂單到 SQLite")
+        return len(orders)
+
+    def get(self, order_id: str) -> Optional[Dict[str, Any]]:
+        """取得單筆訂單"""
+        with self._lock:
+            row = self._conn.execute('SELECT data FROM orders WHERE order_id = ?', (order_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_all(self) -> Dict[str, Dict[str, Any]]:
+        """取得全部訂單 {order_id: order}"""
+        with self._lock:
+            rows = self._conn.execute('SELECT order_id, data FROM orders').fetchall()
+        return {order_id: json.loads(data) for order_id, data in rows}
+
+    def find_by_field(self, field: str, value: Any) -> List[Dict[str, Any]]:
+        """
+        取得某欄位等於指定值的訂單
+
+        INDEXED_FIELDS 內的欄位走索引；其他欄位需全表掃描。
+        """
+        if field in self.INDEXED_FIELDS:
+            # 運算式必須與索引定義完全相同，SQLite 才會使用索引
+            sql = f"SELECT data FROM orders WHERE json_extract(data, '$.{field}') = ?"
+            params = (value,)
+        else:
+            sql = 'SELECT data FROM orders WHERE json_extract(data, ?) = ?'
+            params = (f'$.{field}', value)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def upsert(self, order: Dict[str, Any]):
+        """新增或更新單筆訂單（只寫入這一列）"""
+        self.upsert_many([order])
+
+    def upsert_many(self, orders: Iterable[Dict[str, Any]]):
+        """在同一個交易中新增或更新多筆訂單"""
+        rows = [
+            (order['order_id'], json.dumps(order, ensure_ascii=False), order.get('updated_at'))
+            for order in orders
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._write_rows(rows)
+                self._conn.execute('COMMIT')
+                self._local_writes += 1
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def _write_rows(self, rows: List[tuple]):
+        self._conn.executemany(
+            'INSERT INTO orders (order_id, data, updated_at) VALUES (?, ?, ?) '
+            'ON CONFLICT(order_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at',
+            rows
+        )
+
+    def update(self, order_id: str, mutate: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]],
+               create: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        讀取 → 修改 → 寫回單筆訂單（同一個寫入交易，其他程序的寫入會排隊等待）
+
+        Args:
+            order_id: 訂單編號
+            mutate: 修改函式，接收目前的訂單（可直接修改或回傳新的 dict）
+            create: 訂單不存在時是否以 {'order_id': order_id} 建立
+
+        Returns:
+            dict: 寫入後的訂單；訂單不存在且 create=False 時回傳 None
+        """
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute('SELECT data FROM orders WHERE order_id = ?', (order_id,)).fetchone()
+                if row is None and not create:
+                    self._conn.execute('ROLLBACK')
+                    return None
+                order = json.loads(row[0]) if row else {'order_id': order_id}
+                order = mutate(order) or order
+                order['order_id'] = order_id
+                self._write_rows([(order_id, json.dumps(order, ensure_ascii=False), order.get('updated_at'))])
+                self._conn.execute('COMMIT')
+                self._local_writes += 1
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return order
+
+    def delete(self, order_id: str):
+        """刪除單筆訂單"""
+        with self._lock:
+            self._conn.execute('DELETE FROM orders WHERE order_id = ?', (order_id,))
+            self._local_writes += 1
+
+    def version(self) -> Tuple[int, int]:
+        """
+        資料版本：任何程序寫入後都會改變（PRAGMA data_version + 本連線寫入次數）
+
+        快取可記住上次載入時的版本，版本相同就不必重新讀取。
+        """
+        with self._lock:
+            data_version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+            return data_version, self._local_writes
+
+    def close(self):
+        """關閉資料庫連線"""
+        with self._lock:
+            self._conn.close()
+
+
+# 單例模式（同一路徑共用一個連線）
+_order_stores: Dict[str, OrderStore] = {}
+_order_stores_lock = threading.Lock()
+
+def get_order_store(db_path: Optional[str] = None, json_path: Optional[str] = None) -> OrderStore:
+    """
+    取得 OrderStore 單例
+
+    Args:
+        db_path: 預設為 data/chat_logs/guest_orders.db
+        json_path: 預設為 data/chat_logs/guest_orders.json（僅首次匯入用）
+    """
+    if db_path is None:
+        shared_dir = os.path.dirname(os.path.realpath(__file__))
+        log_dir = os.path.join(os.path.dirname(shared_dir), "data", "chat_logs")
+        db_path = os.path.join(log_dir, "guest_orders.db")
+        json_path = json_path or os.path.join(log_dir, "guest_orders.json")
+
+    db_path = os.path.abspath(db_path)
+    with _order_stores_lock:
+        if db_path not in _order_stores:
+            _order_stores[db_path] = OrderStore(db_path, json_path)
+        return _order_stores[db_path]